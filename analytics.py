@@ -0,0 +1,354 @@
+"""把成绩历史转换为列式数组（NumPy，安装 pyarrow 时可导出 Parquet），并做向量化的统计分析"""
+
+import argparse
+import json
+import math
+import os
+import re
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+GRADE_LEVEL_SCORES = {
+    "优秀": 95.0,
+    "良好": 85.0,
+    "中等": 75.0,
+    "及格": 65.0,
+    "不及格": 50.0,
+}
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def parse_score(text):
+    """成绩文本转数值：数字直接解析，五级制映射为分数，其余为 NaN"""
+    text = (text or "").strip()
+    if text in GRADE_LEVEL_SCORES:
+        return GRADE_LEVEL_SCORES[text]
+    match = NUMBER_PATTERN.search(text)
+    return float(match.group()) if match else math.nan
+
+
+def parse_ratio(text):
+    """占比文本转小数：带 % 或不带小数点的整数按百分数（'30%'、'30' -> 0.3，'1' -> 0.01），
+    带小数点的数不大于 1 时按小数（'0.3' -> 0.3），否则按百分数（'30.5' -> 0.305）"""
+    match = NUMBER_PATTERN.search(text or "")
+    if not match:
+        return math.nan
+    value = float(match.group())
+    if "%" in text or "." not in match.group() or value > 1:
+        value /= 100
+    return value
+
+
+class Interner:
+    """把字符串映射为连续整数编码，列中只存编码"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+def iter_history_records(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def parse_seen_arg(value, default_account=""):
+    """--seen 参数：'账号=路径' 或单独的路径（账号取 --account）；文件本身不记录账号，必须显式给出"""
+    account, separator, path = value.partition("=")
+    if not separator:
+        account, path = default_account, value
+    if not account or not path:
+        return None
+    return account, path
+
+
+def iter_seen_records(path, account):
+    """把 seen_courses*.json 当前快照视为一次记录，时间取文件修改时间；
+    旧版只有课程名列表的文件没有成绩，跳过"""
+    timestamp = int(os.path.getmtime(path))
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        print(f"跳过旧版课程名列表格式的快照（不含成绩）: {path}")
+        return
+    for name, course in data.items():
+        if not isinstance(course, dict):
+            continue
+        yield {
+            "timestamp": timestamp,
+            "account": account,
+            "course": name,
+            "total": course.get("total", ""),
+            "components": course.get("components", []),
+        }
+
+
+def build_columns(records):
+    """流式读取记录并写入定长数组，内存只与记录数成正比"""
+    if np is None:
+        raise RuntimeError("缺少 numpy，请先执行 pip install -r requirements-analytics.txt")
+    accounts, courses, component_names = Interner(), Interner(), Interner()
+    account_codes, course_codes = array("i"), array("i")
+    timestamps, totals = array("q"), array("d")
+    component_record, component_name = array("q"), array("i")
+    ratios, scores = array("d"), array("d")
+
+    for index, record in enumerate(records):
+        account_codes.append(accounts.code(str(record.get("account", ""))))
+        course_codes.append(courses.code(str(record.get("course", ""))))
+        timestamps.append(int(record.get("timestamp", 0)))
+        totals.append(parse_score(record.get("total", "")))
+        for component in record.get("components", []):
+            component_record.append(index)
+            component_name.append(component_names.code(component.get("name", "")))
+            ratios.append(parse_ratio(component.get("ratio", "")))
+            scores.append(parse_score(component.get("score", "")))
+
+    def column(data, dtype):
+        return np.frombuffer(data, dtype=dtype).copy() if len(data) else np.empty(0, dtype)
+
+    return {
+        "account": column(account_codes, np.int32),
+        "course": column(course_codes, np.int32),
+        "timestamp": column(timestamps, np.int64),
+        "total": column(totals, np.float64),
+        "component_record": column(component_record, np.int64),
+        "component_name": column(component_name, np.int32),
+        "ratio": column(ratios, np.float64),
+        "score": column(scores, np.float64),
+        "accounts": accounts.values,
+        "courses": courses.values,
+        "component_names": component_names.values,
+    }
+
+
+def latest_mask(columns):
+    """每个（账号, 课程）只保留时间最新的一条记录"""
+    order = np.lexsort((columns["timestamp"], columns["course"], columns["account"]))
+    account = columns["account"][order]
+    course = columns["course"][order]
+    last = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        last[:-1] = (account[1:] != account[:-1]) | (course[1:] != course[:-1])
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[last]] = True
+    return mask
+
+
+def weighted_component_totals(columns):
+    """按分项占比加权得到每条记录的计算总评，缺少有效分项时为 NaN"""
+    record_count = len(columns["total"])
+    ratio = columns["ratio"]
+    score = columns["score"]
+    valid = ~(np.isnan(ratio) | np.isnan(score))
+    index = columns["component_record"][valid]
+    weighted = np.bincount(index, weights=ratio[valid] * score[valid], minlength=record_count)
+    weights = np.bincount(index, weights=ratio[valid], minlength=record_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weights > 0, weighted / weights, np.nan)
+
+
+def account_averages(columns, mask=None):
+    """每个账号最新总评的平均分（忽略无法解析的成绩）"""
+    mask = latest_mask(columns) if mask is None else mask
+    totals = columns["total"]
+    valid = mask & ~np.isnan(totals)
+    size = len(columns["accounts"])
+    sums = np.bincount(columns["account"][valid], weights=totals[valid], minlength=size)
+    counts = np.bincount(columns["account"][valid], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return {
+        columns["accounts"][code]: {"courses": int(counts[code]), "average": round(float(means[code]), 2)}
+        for code in range(size)
+        if counts[code]
+    }
+
+
+def course_distributions(columns, mask=None):
+    """每门课程最新总评的分布：人数、均值、标准差、最值与四分位数"""
+    mask = latest_mask(columns) if mask is None else mask
+    totals = columns["total"]
+    valid = mask & ~np.isnan(totals)
+    course = columns["course"][valid]
+    values = totals[valid]
+    order = np.lexsort((values, course))
+    course, values = course[order], values[order]
+    boundaries = np.flatnonzero(np.diff(course)) + 1
+    starts = np.concatenate(([0], boundaries)) if len(course) else np.empty(0, np.int64)
+    ends = np.concatenate((boundaries, [len(course)])) if len(course) else np.empty(0, np.int64)
+    counts = ends - starts
+    sums = np.add.reduceat(values, starts) if len(course) else np.empty(0)
+    squares = np.add.reduceat(values * values, starts) if len(course) else np.empty(0)
+    means = sums / np.maximum(counts, 1)
+    stds = np.sqrt(np.maximum(squares / np.maximum(counts, 1) - means * means, 0))
+
+    def quantile(q):
+        # 组内已排序，直接按位置线性插值
+        position = starts + (counts - 1) * q
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    result = {}
+    if not len(course):
+        return result
+    q25, q50, q75 = quantile(0.25), quantile(0.5), quantile(0.75)
+    for group, start in enumerate(starts):
+        result[columns["courses"][course[start]]] = {
+            "count": int(counts[group]),
+            "mean": round(float(means[group]), 2),
+            "std": round(float(stds[group]), 2),
+            "min": float(values[start]),
+            "p25": round(float(q25[group]), 2),
+            "median": round(float(q50[group]), 2),
+            "p75": round(float(q75[group]), 2),
+            "max": float(values[ends[group] - 1]),
+        }
+    return result
+
+
+def changes_after_release(columns):
+    """统计成绩发布（首次出现有效总评）之后总评又发生变化的次数"""
+    order = np.lexsort((columns["timestamp"], columns["course"], columns["account"]))
+    account = columns["account"][order]
+    course = columns["course"][order]
+    totals = columns["total"][order]
+    if len(order) < 2:
+        return {"changes": 0, "changed_pairs": 0, "by_course": {}}
+    same_pair = (account[1:] == account[:-1]) & (course[1:] == course[:-1])
+    previous = totals[:-1]
+    current = totals[1:]
+    released = ~np.isnan(previous)
+    differs = (current != previous) & ~(np.isnan(current) & np.isnan(previous))
+    changed = same_pair & released & differs
+    changed_course = course[1:][changed]
+    pair_keys = account[1:][changed].astype(np.int64) * len(columns["courses"]) + changed_course
+    by_course = np.bincount(changed_course, minlength=len(columns["courses"]))
+    return {
+        "changes": int(changed.sum()),
+        "changed_pairs": int(len(np.unique(pair_keys))),
+        "by_course": {
+            columns["courses"][code]: int(count)
+            for code, count in enumerate(by_course)
+            if count
+        },
+    }
+
+
+def export_columns(columns, path):
+    """有 pyarrow 时导出为 Parquet（记录表与分项表两个文件），否则导出为 .npz"""
+    if path.endswith(".parquet") and pyarrow is None:
+        path = f"{path[: -len('.parquet')]}.npz"
+        print(f"未安装 pyarrow，改为导出 {path}（pip install pyarrow 后可导出 Parquet）")
+    if path.endswith(".parquet"):
+        records = pyarrow.table(
+            {
+                "account": pyarrow.DictionaryArray.from_arrays(
+                    columns["account"], pyarrow.array(columns["accounts"], pyarrow.string())
+                ),
+                "course": pyarrow.DictionaryArray.from_arrays(
+                    columns["course"], pyarrow.array(columns["courses"], pyarrow.string())
+                ),
+                "timestamp": columns["timestamp"],
+                "total": columns["total"],
+            }
+        )
+        components = pyarrow.table(
+            {
+                "record": columns["component_record"],
+                "name": pyarrow.DictionaryArray.from_arrays(
+                    columns["component_name"],
+                    pyarrow.array(columns["component_names"], pyarrow.string()),
+                ),
+                "ratio": columns["ratio"],
+                "score": columns["score"],
+            }
+        )
+        pyarrow.parquet.write_table(records, path)
+        component_path = f"{path[: -len('.parquet')]}.components.parquet"
+        pyarrow.parquet.write_table(components, component_path)
+        return [path, component_path]
+    arrays = {key: value for key, value in columns.items() if isinstance(value, np.ndarray)}
+    for key in ("accounts", "courses", "component_names"):
+        arrays[key] = np.array(columns[key], dtype=str)
+    np.savez_compressed(path, **arrays)
+    return [path if path.endswith(".npz") else f"{path}.npz"]
+
+
+def build_report(columns):
+    mask = latest_mask(columns)
+    computed = weighted_component_totals(columns)
+    valid = mask & ~np.isnan(computed) & ~np.isnan(columns["total"])
+    return {
+        "records": int(len(columns["total"])),
+        "components": int(len(columns["component_record"])),
+        "accounts": account_averages(columns, mask),
+        "courses": course_distributions(columns, mask),
+        "changes_after_release": changes_after_release(columns),
+        # 按分项占比加权的计算总评与系统总评的平均偏差
+        "weighted_total_mean_abs_diff": round(
+            float(np.abs(computed[valid] - columns["total"][valid]).mean()), 3
+        )
+        if valid.any()
+        else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="成绩历史列式导出与统计分析")
+    parser.add_argument("--history", nargs="*", default=["grade_history.jsonl"], help="成绩历史 JSONL 文件")
+    parser.add_argument(
+        "--seen",
+        nargs="*",
+        default=[],
+        help="额外纳入的 seen_courses*.json 当前快照，写作 账号=路径；只写路径时账号取 --account",
+    )
+    parser.add_argument("--account", default="", help="--seen 中未写账号的快照所属账号（与历史中的账号名一致）")
+    parser.add_argument("--export", default="", help="导出路径（.parquet 或 .npz）")
+    args = parser.parse_args()
+    seen = [parse_seen_arg(value, args.account) for value in args.seen]
+    if None in seen:
+        parser.error("seen_courses 文件不记录账号，请写作 --seen 账号=路径 或同时指定 --account")
+
+    def records():
+        for path in args.history:
+            if os.path.exists(path):
+                yield from iter_history_records(path)
+        for account, path in seen:
+            yield from iter_seen_records(path, account)
+
+    columns = build_columns(records())
+    if args.export:
+        for path in export_columns(columns, args.export):
+            print(f"已导出: {path}")
+    print(json.dumps(build_report(columns), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import random
+import re
+import statistics
+import time
+from collections import deque
+from datetime import datetime
+
+TRACE_DIR = "traces"
+SCREENSHOT_DIR = "screenshots"
+
+
+def build_trace_config(config):
+    trace = config.get("trace", {})
+    return {
+        "enabled": bool(trace.get("enabled", False)),
+        "dir": trace.get("dir") or TRACE_DIR,
+        "slow_seconds": float(trace.get("slow_seconds", 120)),
+        "slow_factor": float(trace.get("slow_factor", 3.0)),
+        "history_size": max(1, int(trace.get("history_size", 20))),
+        "max_count": max(1, int(trace.get("max_count", 10))),
+        "max_total_mb": float(trace.get("max_total_mb", 200)),
+    }
+
+
+def build_screenshot_config(config):
+    screenshots = config.get("screenshots", {})
+    return {
+        "dir": screenshots.get("dir") or SCREENSHOT_DIR,
+        "on_failure": bool(screenshots.get("on_failure", True)),
+        "on_change": bool(screenshots.get("on_change", True)),
+        "sample_rate": min(1.0, max(0.0, float(screenshots.get("sample_rate", 0.0)))),
+        "quality": min(100, max(1, int(screenshots.get("quality", 60)))),
+        "full_page": bool(screenshots.get("full_page", False)),
+        "max_count": max(1, int(screenshots.get("max_count", 50))),
+        "max_total_mb": float(screenshots.get("max_total_mb", 50)),
+    }
+
+
+def safe_file_part(text):
+    cleaned = re.sub(r"[^0-9A-Za-z_.-]+", "_", str(text or "")).strip("._")
+    return cleaned or "default"
+
+
+def prune_artifacts(directory, suffixes, max_count, max_total_bytes):
+    """按数量与总大小裁剪目录中的产物文件，优先删除最旧的文件"""
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(tuple(suffixes)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    while entries and (len(entries) > max_count or total > max_total_bytes):
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except OSError as exc:
+            print(f"删除过期产物失败: {path} ({exc})")
+            continue
+        total -= size
+        removed.append(path)
+    return removed
+
+
+class CheckTracer:
+    """为每次检查录制 Playwright trace，仅在失败或明显变慢时保留
+
+    同一个对象被多次检查共用（需要共享耗时历史），每次检查的开始时间与录制状态放在 start() 返回的记录里；
+    Playwright 每个上下文同时只能录制一份 trace，同一上下文上重叠的检查只计时、不录制。
+    """
+
+    def __init__(self, trace_config):
+        self.config = trace_config
+        self.durations = deque(maxlen=trace_config["history_size"])
+        self.recording = set()
+
+    def update_config(self, trace_config):
+        """配置热更新时调用，保留已记录的检查耗时"""
+        if trace_config["history_size"] != self.config["history_size"]:
+            self.durations = deque(self.durations, maxlen=trace_config["history_size"])
+        self.config = trace_config
+
+    async def start(self, context, title=""):
+        """开始一次检查，返回交给 finish() 的记录"""
+        trace = {"started_at": time.monotonic(), "context": None}
+        if not self.config["enabled"] or context in self.recording:
+            return trace
+        # 先占位再 await，避免并发的 start 同时调用 tracing.start
+        self.recording.add(context)
+        try:
+            await context.tracing.start(
+                title=title or None, screenshots=True, snapshots=True
+            )
+        except Exception as exc:
+            self.recording.discard(context)
+            print(f"启动 trace 录制失败: {exc}")
+            return trace
+        trace["context"] = context
+        return trace
+
+    def is_slow(self, elapsed):
+        if self.config["slow_seconds"] > 0 and elapsed >= self.config["slow_seconds"]:
+            return True
+        if len(self.durations) >= 5:
+            baseline = statistics.median(self.durations)
+            return elapsed > baseline * self.config["slow_factor"]
+        return False
+
+    async def finish(self, trace, failed, label=""):
+        elapsed = time.monotonic() - trace["started_at"]
+        slow = self.is_slow(elapsed)
+        if not failed:
+            self.durations.append(elapsed)
+        context = trace["context"]
+        if context is None:
+            return ""
+        try:
+            return await self.stop_recording(context, failed, slow, elapsed, label)
+        finally:
+            self.recording.discard(context)
+
+    async def stop_recording(self, context, failed, slow, elapsed, label):
+        reason = "failed" if failed else "slow" if slow else ""
+        if not reason:
+            try:
+                await context.tracing.stop()
+            except Exception as exc:
+                print(f"结束 trace 录制失败: {exc}")
+            return ""
+
+        directory = self.config["dir"]
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(
+            directory, f"trace_{safe_file_part(label)}_{stamp}_{reason}.zip"
+        )
+        try:
+            await context.tracing.stop(path=path)
+        except Exception as exc:
+            print(f"保存 trace 失败: {exc}")
+            return ""
+        await asyncio.to_thread(
+            prune_artifacts,
+            directory,
+            (".zip",),
+            self.config["max_count"],
+            self.config["max_total_mb"] * 1024 * 1024,
+        )
+        print(f"检查{'失败' if failed else '耗时过长'} ({elapsed:.1f}s)，trace 已保存: {path}")
+        return path
+
+
+def screenshot_reason(screenshot_config, failed, changed):
+    """根据截图策略判断本次检查是否需要截图，返回原因或空字符串"""
+    if failed and screenshot_config["on_failure"]:
+        return "failed"
+    if changed and screenshot_config["on_change"]:
+        return "changed"
+    if screenshot_config["sample_rate"] and random.random() < screenshot_config["sample_rate"]:
+        return "sampled"
+    return ""
+
+
+def write_artifact(directory, filename, data, suffixes, max_count, max_total_bytes):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as file:
+        file.write(data)
+    prune_artifacts(directory, suffixes, max_count, max_total_bytes)
+    return path
+
+
+async def capture_screenshot(page, screenshot_config, account, reason):
+    """截取压缩 JPEG 截图，文件写入与目录裁剪放到线程中执行"""
+    if not reason:
+        return ""
+    try:
+        data = await page.screenshot(
+            type="jpeg",
+            quality=screenshot_config["quality"],
+            full_page=screenshot_config["full_page"],
+        )
+    except Exception as exc:
+        print(f"截图失败: {exc}")
+        return ""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    filename = f"{safe_file_part(account)}_{stamp}_{reason}.jpg"
+    try:
+        return await asyncio.to_thread(
+            write_artifact,
+            screenshot_config["dir"],
+            filename,
+            data,
+            (".jpg",),
+            screenshot_config["max_count"],
+            screenshot_config["max_total_mb"] * 1024 * 1024,
+        )
+    except Exception as exc:
+        print(f"保存截图失败: {exc}")
+        return ""
@@ -0,0 +1,303 @@
+"""基于本地模拟教务系统的抓取与登录基准测试，结果追加到历史文件以便发现性能回归"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from playwright.async_api import async_playwright
+
+import spider
+from mock_portal import MockPortal, solve_expression
+from replay import working_directory
+
+BENCH_HISTORY_FILE = "bench_history.jsonl"
+ROW_INDEPENDENT = ("login",)
+
+
+def build_bench_config(portal, sequential_login=False, rate_limit=False):
+    config = spider.load_json_file("config.json.example", {})
+    portal.apply_to_config(config)
+    config["desktop_notification"] = False
+    # 恢复旧的顺序登录流程，用于对比流水线登录的收益
+    config["login_pipeline"] = not sequential_login
+    # 模拟门户只有一个主机，限流开启时测到的是令牌桶速率而不是抓取耗时
+    config["rate_limit"] = dict(config.get("rate_limit", {}), enabled=rate_limit)
+    # 每一轮都要真实执行检查，不复用上一轮的结果
+    config["single_flight"] = {"result_ttl_seconds": 0}
+    config["ocr"]["batch"] = {"enabled": False}
+    return config
+
+
+def build_bench_secrets():
+    return {
+        "login": {"username": "20260001", "password": "bench"},
+        "ocr": {"api_key": "bench"},
+    }
+
+
+def summarize(samples, failures=0):
+    """只统计成功的样本；失败（通常很快报错）单独计数，不参与分位数"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"rounds": 0, "failures": failures, "mean": 0.0, "p50": 0.0, "p95": 0.0, "min": 0.0}
+    return {
+        "rounds": len(ordered),
+        "failures": failures,
+        "mean": statistics.mean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min": ordered[0],
+    }
+
+
+async def new_logged_in_context(browser, portal):
+    """通过登录接口直接建立会话，跳过登录页，用于只测抓取部分"""
+    context = await browser.new_context()
+    await context.request.post(
+        f"{portal.base_url}/api/login",
+        data=json.dumps({"captcha": solve_expression(portal.captcha_expression)}),
+        headers={"Content-Type": "application/json"},
+    )
+    return context
+
+
+async def open_grades(context, config):
+    page = await context.new_page()
+    await page.goto(config["grades_url"], wait_until="domcontentloaded")
+    await page.click(spider.get_selector(config, "search_button"))
+    await page.wait_for_selector(spider.get_selector(config, "course_name_cell"))
+    return page
+
+
+async def bench_login(browser, portal, config, secrets, rounds):
+    samples, failures = [], 0
+    for _ in range(rounds):
+        context = await browser.new_context()
+        page = await context.new_page()
+        await page.goto(config["login_url"], wait_until="domcontentloaded")
+        started = time.perf_counter()
+        result = await spider.attempt_login(page, config, secrets)
+        elapsed = time.perf_counter() - started
+        await context.close()
+        if result != spider.LOGIN_OK:
+            failures += 1
+            print(f"登录未成功: {result}")
+        else:
+            samples.append(elapsed)
+    return samples, failures
+
+
+async def bench_detail(browser, portal, config, secrets, rounds):
+    samples = []
+    context = await new_logged_in_context(browser, portal)
+    page = await open_grades(context, config)
+    rows = page.locator(spider.get_selector(config, "course_row"))
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await spider.fetch_detail_components(page, rows.first, config)
+        samples.append(time.perf_counter() - started)
+    await context.close()
+    return samples, 0
+
+
+async def bench_scrape(browser, portal, config, secrets, rounds):
+    samples, failures = [], 0
+    context = await new_logged_in_context(browser, portal)
+    page = await open_grades(context, config)
+    for _ in range(rounds):
+        started = time.perf_counter()
+        courses = await spider.scrape_courses(page, config)
+        elapsed = time.perf_counter() - started
+        if len(courses) != len(portal.courses):
+            failures += 1
+            print(f"抓取课程数不一致: {len(courses)} != {len(portal.courses)}")
+        else:
+            samples.append(elapsed)
+    await context.close()
+    return samples, failures
+
+
+async def bench_check(browser, portal, config, secrets, rounds):
+    samples, failures = [], 0
+    for _ in range(rounds):
+        context = await browser.new_context()
+        with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+            started = time.perf_counter()
+            result = await spider.check_grades(context, {}, config, secrets)
+            elapsed = time.perf_counter() - started
+        await context.close()
+        # 首次检查时所有课程都是新的，成功的检查必然报告全部课程
+        if not result["ok"] or len(result["changed"]) != len(portal.courses):
+            failures += 1
+            print(f"检查未成功: ok={result['ok']} 课程数={len(result['changed'])}")
+        else:
+            samples.append(elapsed)
+    return samples, failures
+
+
+BENCHMARKS = {
+    "login": bench_login,
+    "detail": bench_detail,
+    "scrape": bench_scrape,
+    "check": bench_check,
+}
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def load_history(path):
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        print(f"读取基准历史失败: {path} ({exc})")
+    return records
+
+
+def append_history(path, records):
+    with open(path, "a", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def history_key(record):
+    return (
+        record["benchmark"],
+        record["rows"],
+        record["components"],
+        record["latency"],
+        record["ocr_latency"],
+        record["iframe"],
+        record.get("hidden_toggle", False),
+        record.get("login_pipeline", True),
+        record.get("rate_limit", False),
+    )
+
+
+def compare_with_history(records, history, tolerance):
+    """与历史中最近一次相同参数的结果比较 p50，超过容差即视为回归；有失败轮次的结果既不比较也不作为基线"""
+    latest = {}
+    for record in history:
+        if not record.get("failures"):
+            latest[history_key(record)] = record
+    regressions = []
+    for record in records:
+        previous = latest.get(history_key(record))
+        if record["failures"] or previous is None or previous["p50"] <= 0:
+            record["change"] = None
+            continue
+        record["change"] = record["p50"] / previous["p50"] - 1
+        if record["change"] > tolerance:
+            regressions.append((record, previous))
+    return regressions
+
+
+async def run_suite(args):
+    records = []
+    secrets = build_bench_secrets()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        for name in args.only:
+            sizes = [0] if name in ROW_INDEPENDENT else args.rows
+            for rows in sizes:
+                # detail 基准中 rows 表示弹窗内分项条数
+                course_count = 1 if name == "detail" else max(1, rows)
+                component_count = rows if name == "detail" else args.components
+                portal = MockPortal(
+                    latency=args.latency,
+                    ocr_latency=args.ocr_latency,
+                    course_count=course_count,
+                    component_count=component_count,
+                    use_iframe=args.iframe,
+                    hidden_login_toggle=args.hidden_toggle,
+                ).start()
+                try:
+                    config = build_bench_config(portal, args.sequential_login, args.rate_limit)
+                    samples, failures = await BENCHMARKS[name](
+                        browser, portal, config, secrets, args.rounds
+                    )
+                finally:
+                    portal.stop()
+                record = {
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "commit": current_commit(),
+                    "benchmark": name,
+                    "rows": rows,
+                    "components": args.components,
+                    "latency": args.latency,
+                    "ocr_latency": args.ocr_latency,
+                    "iframe": args.iframe,
+                    "hidden_toggle": args.hidden_toggle,
+                    "login_pipeline": not args.sequential_login,
+                    "rate_limit": args.rate_limit,
+                }
+                record.update(summarize(samples, failures))
+                records.append(record)
+                print(
+                    f"{name:<8} rows={rows:<5} p50={record['p50']:.3f}s mean={record['mean']:.3f}s "
+                    f"p95={record['p95']:.3f}s failures={failures}"
+                )
+        await browser.close()
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟教务系统上的抓取与登录基准测试")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--components", type=int, default=3, help="每门课程的分项数")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.01, help="模拟服务器每个请求的延迟（秒）")
+    parser.add_argument("--ocr-latency", type=float, default=0.8, help="模拟 OCR 接口延迟（秒）")
+    parser.add_argument("--iframe", action="store_true", help="登录表单嵌入 iframe")
+    parser.add_argument(
+        "--hidden-toggle", action="store_true", help="登录页在输入框之前放一个隐藏的切换按钮"
+    )
+    parser.add_argument(
+        "--sequential-login", action="store_true", help="使用旧的顺序登录流程（先填表再识别验证码、提交后固定等待）作为对照"
+    )
+    parser.add_argument("--rate-limit", action="store_true", help="保留默认限流设置（默认关闭）")
+    parser.add_argument("--history", default=BENCH_HISTORY_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p50 变慢超过该比例即报告回归")
+    parser.add_argument("--no-save", action="store_true", help="不写入历史文件")
+    args = parser.parse_args()
+
+    records = asyncio.run(run_suite(args))
+    regressions = compare_with_history(records, load_history(args.history), args.tolerance)
+    for record, previous in regressions:
+        print(
+            f"性能回归: {record['benchmark']} rows={record['rows']} "
+            f"p50 {previous['p50']:.3f}s ({previous['commit']}) -> {record['p50']:.3f}s ({record['commit']})"
+        )
+    failed = [record for record in records if record["failures"]]
+    for record in failed:
+        print(f"基准失败: {record['benchmark']} rows={record['rows']} 失败 {record['failures']} 轮，未计入耗时统计")
+    if not args.no_save:
+        append_history(args.history, records)
+    if regressions or failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
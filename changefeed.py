@@ -0,0 +1,386 @@
+"""只追加、按段轮转的成绩变更日志：每条变更带单调递增的 offset，下游按游标读取、跟随文件或通过长轮询/SSE 接口订阅"""
+
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+CHANGE_FEED_DIR = "changes"
+CURSOR_DIR = "cursors"
+SEGMENT_SUFFIX = ".jsonl"
+CHANGE_NEW = "new"
+CHANGE_UPDATED = "updated"
+
+
+def build_change_feed_config(config):
+    feed = config.get("change_feed", {})
+    server = feed.get("server", {})
+    return {
+        "enabled": bool(feed.get("enabled", True)),
+        "dir": feed.get("dir", CHANGE_FEED_DIR) or CHANGE_FEED_DIR,
+        "segment_max_records": max(1, int(feed.get("segment_max_records", 10000))),
+        "max_segments": max(0, int(feed.get("max_segments", 50))),
+        "server_enabled": bool(server.get("enabled", False)),
+        "server_host": server.get("host", "127.0.0.1"),
+        "server_port": int(server.get("port", 8010)),
+    }
+
+
+def segment_name(base_offset):
+    # 段文件名即该段第一条记录的 offset，补零后按字典序即按 offset 排序
+    return f"{base_offset:020d}{SEGMENT_SUFFIX}"
+
+
+def build_change_events(account, changes, timestamp=None):
+    """把 (课程名, previous, current) 转换为变更事件；previous 为 None 表示新出现的课程"""
+    timestamp = int(timestamp or time.time())
+    events = []
+    for course, previous, current in changes:
+        events.append(
+            {
+                "timestamp": timestamp,
+                "account": account,
+                "course": course,
+                "type": CHANGE_NEW if previous is None else CHANGE_UPDATED,
+                "previous": None
+                if previous is None
+                else {
+                    "total": previous.get("total", ""),
+                    "components": previous.get("components", []),
+                },
+                "current": {
+                    "total": current.get("total", ""),
+                    "components": current.get("components", []),
+                },
+            }
+        )
+    return events
+
+
+class ChangeFeed:
+    """段文件目录上的变更日志；每个目录只允许一个写入进程，读取可以来自任意线程或进程"""
+
+    def __init__(self, directory, segment_max_records=10000, max_segments=50):
+        self.directory = directory
+        self.segment_max_records = segment_max_records
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+        self.next_offset = None
+        self.segment_records = 0
+
+    def segments(self):
+        """返回按 base offset 升序排列的段列表"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        bases = []
+        for name in names:
+            stem, suffix = os.path.splitext(name)
+            if suffix == SEGMENT_SUFFIX and stem.isdigit():
+                bases.append(int(stem))
+        return sorted(bases)
+
+    def segment_path(self, base_offset):
+        return os.path.join(self.directory, segment_name(base_offset))
+
+    def load_tail(self):
+        """启动时从最后一段恢复下一个 offset；只读取最后一段，并截掉上次写入被中断留下的半行"""
+        bases = self.segments()
+        self.next_offset = 0
+        self.segment_records = 0
+        if not bases:
+            return
+        last = bases[-1]
+        path = self.segment_path(last)
+        last_offset = last - 1
+        valid_size = 0
+        with open(path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+                try:
+                    last_offset = json.loads(line)["offset"]
+                except (ValueError, KeyError):
+                    continue
+                self.segment_records += 1
+        if valid_size < os.path.getsize(path):
+            with open(path, "r+b") as file:
+                file.truncate(valid_size)
+        self.next_offset = last_offset + 1
+
+    def append(self, events):
+        """追加一批事件，返回分配的 offset 列表；同一批事件写入同一段"""
+        if not events:
+            return []
+        with self.lock:
+            if self.next_offset is None:
+                self.load_tail()
+            os.makedirs(self.directory, exist_ok=True)
+            bases = self.segments()
+            if not bases or self.segment_records >= self.segment_max_records:
+                bases.append(self.next_offset)
+                self.segment_records = 0
+            offsets = []
+            lines = []
+            for event in events:
+                record = dict(event, offset=self.next_offset)
+                offsets.append(self.next_offset)
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                self.next_offset += 1
+            with open(self.segment_path(bases[-1]), "a", encoding="utf-8") as file:
+                file.write("".join(lines))
+                file.flush()
+                os.fsync(file.fileno())
+            self.segment_records += len(lines)
+            self.prune(bases)
+            self.appended.notify_all()
+        return offsets
+
+    def prune(self, bases):
+        if not self.max_segments or len(bases) <= self.max_segments:
+            return
+        for base in bases[: len(bases) - self.max_segments]:
+            try:
+                os.remove(self.segment_path(base))
+            except OSError:
+                pass
+
+    def read(self, cursor=0, limit=1000):
+        """读取 offset >= cursor 的事件，返回 (events, next_cursor)
+
+        cursor 早于最早保留的段时从最早的记录开始，调用方可根据第一条记录的 offset 判断是否有缺失。
+        """
+        bases = self.segments()
+        if not bases:
+            return [], cursor
+        index = max(0, bisect.bisect_right(bases, cursor) - 1)
+        events = []
+        for base in bases[index:]:
+            try:
+                file = open(self.segment_path(base), "r", encoding="utf-8")
+            except FileNotFoundError:
+                # 读取过程中该段已被清理
+                continue
+            with file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("offset", -1) < cursor:
+                        continue
+                    events.append(record)
+                    if len(events) >= limit:
+                        return events, record["offset"] + 1
+        next_cursor = events[-1]["offset"] + 1 if events else cursor
+        return events, next_cursor
+
+    def wait(self, cursor=0, timeout=30.0, limit=1000, poll_interval=1.0):
+        """长轮询：有新事件立即返回，否则最多等待 timeout 秒
+
+        同进程写入通过条件变量唤醒；其他进程写入的事件按 poll_interval 重新读取文件发现。
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            events, next_cursor = self.read(cursor, limit)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events, next_cursor
+            with self.appended:
+                self.appended.wait(min(poll_interval, remaining))
+
+    def follow(self, cursor=0, poll_interval=1.0, limit=1000):
+        """持续跟随日志，逐条产出事件（类似 tail -f）"""
+        while True:
+            events, cursor = self.wait(
+                cursor, timeout=poll_interval * 30, limit=limit, poll_interval=poll_interval
+            )
+            yield from events
+
+
+_CHANGE_FEEDS = {}
+_CHANGE_FEEDS_LOCK = threading.Lock()
+
+
+def get_change_feed(feed_config):
+    """同一目录在进程内只对应一个 ChangeFeed 实例，保证 offset 分配不冲突"""
+    directory = os.path.abspath(feed_config["dir"])
+    with _CHANGE_FEEDS_LOCK:
+        feed = _CHANGE_FEEDS.get(directory)
+        if feed is None:
+            feed = ChangeFeed(
+                directory,
+                feed_config["segment_max_records"],
+                feed_config["max_segments"],
+            )
+            _CHANGE_FEEDS[directory] = feed
+        else:
+            feed.segment_max_records = feed_config["segment_max_records"]
+            feed.max_segments = feed_config["max_segments"]
+    return feed
+
+
+def publish_changes(feed_config, account, changes):
+    """check_grades 检测到变化后调用；写入失败只打印，不影响检查结果"""
+    if not feed_config["enabled"] or not changes:
+        return []
+    try:
+        return get_change_feed(feed_config).append(build_change_events(account, changes))
+    except Exception as exc:
+        print(f"写入变更日志失败: {feed_config['dir']} ({exc})")
+        return []
+
+
+def cursor_path(directory, name):
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name) or "default"
+    return os.path.join(directory, CURSOR_DIR, f"{safe}.json")
+
+
+def load_cursor(directory, name):
+    try:
+        with open(cursor_path(directory, name), "r", encoding="utf-8") as file:
+            return int(json.load(file).get("cursor", 0))
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def commit_cursor(directory, name, cursor):
+    """原子地保存消费者游标（写临时文件后替换）"""
+    path = cursor_path(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump({"cursor": cursor, "updated_at": int(time.time())}, file)
+    os.replace(temp_path, path)
+
+
+def parse_cursor(value, default=0):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def start_feed_server(feed, host="127.0.0.1", port=8010, max_wait=60.0):
+    """启动变更订阅接口：
+    GET /changes?cursor=N&limit=M&wait=S   长轮询，返回 {"events": [...], "next_cursor": N}
+    GET /changes/stream?cursor=N           SSE，事件 id 为 offset，断线重连时支持 Last-Event-ID
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {key: value[0] for key, value in parse_qs(parts.query).items()}
+            cursor = parse_cursor(query.get("cursor"))
+            if parts.path == "/changes":
+                self.handle_poll(cursor, query)
+            elif parts.path == "/changes/stream":
+                last_event_id = self.headers.get("Last-Event-ID")
+                if last_event_id is not None:
+                    cursor = parse_cursor(last_event_id, -1) + 1
+                self.handle_stream(cursor)
+            else:
+                self.send_response(404)
+                self.end_headers()
+
+        def handle_poll(self, cursor, query):
+            limit = max(1, min(1000, parse_cursor(query.get("limit"), 100)))
+            try:
+                wait = min(max_wait, max(0.0, float(query.get("wait", 0))))
+            except ValueError:
+                wait = 0.0
+            events, next_cursor = feed.wait(cursor, timeout=wait, limit=limit)
+            body = json.dumps(
+                {"events": events, "next_cursor": next_cursor}, ensure_ascii=False
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_stream(self, cursor):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            try:
+                while True:
+                    events, cursor = feed.wait(cursor, timeout=15.0)
+                    if not events:
+                        # 心跳注释行，及时发现已断开的连接
+                        self.wfile.write(b": keepalive\n\n")
+                    for event in events:
+                        data = json.dumps(event, ensure_ascii=False)
+                        self.wfile.write(
+                            f"id: {event['offset']}\nevent: change\ndata: {data}\n\n".encode("utf-8")
+                        )
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((host, port), FeedHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"变更订阅接口已启动: http://{host}:{server.server_address[1]}/changes")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="成绩变更日志的读取、跟随与订阅服务")
+    parser.add_argument("--dir", default=CHANGE_FEED_DIR, help="变更日志目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    read_parser = subparsers.add_parser("read", help="按游标读取一批事件")
+    read_parser.add_argument("--cursor", type=int, default=0)
+    read_parser.add_argument("--limit", type=int, default=100)
+
+    tail_parser = subparsers.add_parser("tail", help="持续跟随新事件")
+    tail_parser.add_argument("--cursor", type=int, default=None, help="起始游标，默认使用已保存的消费者游标")
+    tail_parser.add_argument("--consumer", default="", help="消费者名称，设置后每处理一条事件即保存游标")
+    tail_parser.add_argument("--poll-interval", type=float, default=1.0)
+
+    serve_parser = subparsers.add_parser("serve", help="启动长轮询/SSE 订阅接口")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8010)
+    args = parser.parse_args()
+
+    feed = ChangeFeed(args.dir)
+    if args.command == "read":
+        events, next_cursor = feed.read(args.cursor, args.limit)
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+        print(f"next_cursor={next_cursor}")
+    elif args.command == "tail":
+        cursor = args.cursor
+        if cursor is None:
+            cursor = load_cursor(args.dir, args.consumer) if args.consumer else 0
+        try:
+            for event in feed.follow(cursor, poll_interval=args.poll_interval):
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+                if args.consumer:
+                    commit_cursor(args.dir, args.consumer, event["offset"] + 1)
+        except KeyboardInterrupt:
+            pass
+    else:
+        server = start_feed_server(feed, args.host, args.port)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""监视 config.json 的变化：校验通过后在两次检查之间原子替换配置并输出差异，无效配置保留上一份有效配置"""
+
+import asyncio
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from artifacts import build_screenshot_config, build_trace_config
+from changefeed import build_change_feed_config
+from notifier import build_webhook_config
+from ocrbatch import build_ocr_batch_config
+from propagation import build_release_propagation_config
+from ratelimit import build_rate_limit_config
+from resources import build_resource_config
+from selectorplan import SelectorPlan
+from singleflight import build_single_flight_config
+
+# 这些配置项在浏览器启动或订阅接口启动时读取，修改后需要重启才能生效
+RESTART_REQUIRED_KEYS = ("user_data_dir", "headless", "change_feed.server")
+# 差异日志中需要隐藏的值：键名包含这些词，或位于 webhook.targets 下（URL 常带 access_token，headers 常带 Authorization）
+SENSITIVE_KEY_PATTERN = re.compile(r"token|key|password|secret|authorization", re.IGNORECASE)
+MASKED_VALUE = "***"
+SECTION_BUILDERS = (
+    ("trace", build_trace_config),
+    ("screenshots", build_screenshot_config),
+    ("rate_limit", build_rate_limit_config),
+    ("resources", build_resource_config),
+    ("change_feed", build_change_feed_config),
+    ("webhook", build_webhook_config),
+    ("single_flight", build_single_flight_config),
+    ("ocr", build_ocr_batch_config),
+    ("release_propagation", build_release_propagation_config),
+)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_optional_text(value):
+    # cas 等配置项为空时使用默认值
+    return not value or isinstance(value, str)
+
+
+# run_check 直接读取、没有 build_*_config 的配置项：(键路径, 校验, 要求)；未配置的项使用默认值，不校验
+OBJECT_SECTIONS = ("session_probe", "cas", "email_config")
+FIELD_RULES = (
+    ("manual_login_timeout_seconds", lambda value: is_number(value) and value >= 0, "非负数"),
+    ("history_file", lambda value: isinstance(value, str), "字符串"),
+    ("login_endpoint", lambda value: isinstance(value, str), "字符串"),
+    ("session_probe.url", is_optional_text, "字符串"),
+    ("session_probe.timeout_seconds", lambda value: is_number(value) and value > 0, "正数"),
+    ("cas.auth_url", is_optional_text, "字符串"),
+    ("cas.portal_host", is_optional_text, "字符串"),
+    ("cas.success_text", is_optional_text, "字符串"),
+    (
+        "cas.markers",
+        lambda value: not value
+        or (isinstance(value, list) and all(isinstance(item, str) and item for item in value)),
+        "非空字符串列表",
+    ),
+    ("email_config.smtp_server", lambda value: isinstance(value, str), "字符串"),
+    (
+        "email_config.smtp_port",
+        lambda value: isinstance(value, int) and not isinstance(value, bool) and 0 < value < 65536,
+        "1~65535 的整数",
+    ),
+    ("ocr.base_url", is_optional_text, "字符串"),
+    ("ocr.model", is_optional_text, "字符串"),
+)
+
+
+def validate_fields(config):
+    errors = []
+    for section in OBJECT_SECTIONS:
+        if not isinstance(config.get(section, {}), dict):
+            errors.append(f"{section} 必须是对象")
+    for path, check, requirement in FIELD_RULES:
+        container = config
+        *parents, key = path.split(".")
+        for parent in parents:
+            container = container.get(parent, {})
+            if not isinstance(container, dict):
+                break
+        if not isinstance(container, dict) or key not in container:
+            continue
+        if not check(container[key]):
+            errors.append(f"{path} 必须是{requirement}")
+    return errors
+
+
+def build_config_reload_config(config):
+    reload = config.get("config_reload", {})
+    return {
+        "enabled": bool(reload.get("enabled", True)),
+        "poll_seconds": max(0.2, float(reload.get("poll_seconds", 1.0))),
+    }
+
+
+def validate_config(config):
+    """返回错误信息列表，为空表示配置可用"""
+    if not isinstance(config, dict):
+        return ["配置文件顶层必须是 JSON 对象"]
+    errors = []
+    interval = config.get("check_interval_seconds", 1800)
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+        errors.append("check_interval_seconds 必须是正数")
+    for key in ("login_url", "grades_url", "url"):
+        if not isinstance(config.get(key, ""), str):
+            errors.append(f"{key} 必须是字符串")
+    errors.extend(validate_fields(config))
+    try:
+        SelectorPlan(config)
+    except ValueError as exc:
+        errors.append(str(exc))
+    ocr = config.get("ocr", {})
+    if not isinstance(ocr, dict):
+        errors.append("ocr 必须是对象")
+    else:
+        for key in ("timeout_seconds", "max_retries"):
+            value = ocr.get(key, 1)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                errors.append(f"ocr.{key} 必须是非负数")
+    for section, builder in SECTION_BUILDERS:
+        if not isinstance(config.get(section, {}), dict):
+            errors.append(f"{section} 必须是对象")
+            continue
+        try:
+            builder(config)
+        except (TypeError, ValueError, AttributeError) as exc:
+            errors.append(f"{section} 配置无效: {exc}")
+    return errors
+
+
+def flatten_config(config, prefix=""):
+    items = {}
+    for key, value in config.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            items.update(flatten_config(value, f"{path}."))
+        else:
+            items[path] = value
+    return items
+
+
+def diff_config(old, new):
+    """返回 [(键, 旧值, 新值)]，嵌套键以点号连接；新增或删除的键对应值为 None"""
+    old_items = flatten_config(old)
+    new_items = flatten_config(new)
+    changes = []
+    for key in sorted(set(old_items) | set(new_items)):
+        if old_items.get(key) != new_items.get(key):
+            changes.append((key, old_items.get(key), new_items.get(key)))
+    return changes
+
+
+def mask_webhook_target(target):
+    if not isinstance(target, dict):
+        return MASKED_VALUE
+    parts = urlsplit(str(target.get("url", "")))
+    return {
+        "name": target.get("name", ""),
+        "template": target.get("template", "generic"),
+        "url": f"{parts.scheme}://{parts.netloc}/{MASKED_VALUE}" if parts.netloc else MASKED_VALUE,
+    }
+
+
+def mask_config_value(key, value):
+    """日志用：隐藏密钥类配置与 webhook 目标中的地址参数和请求头"""
+    if value is None:
+        return None
+    if key == "webhook.targets" or key.startswith("webhook.targets."):
+        if isinstance(value, list):
+            return [mask_webhook_target(target) for target in value]
+        return MASKED_VALUE
+    if SENSITIVE_KEY_PATTERN.search(key.rsplit(".", 1)[-1]):
+        return MASKED_VALUE
+    return value
+
+
+def requires_restart(changes):
+    return sorted(
+        {
+            key
+            for key, _, _ in changes
+            for restart_key in RESTART_REQUIRED_KEYS
+            if key == restart_key or key.startswith(f"{restart_key}.")
+        }
+    )
+
+
+class ConfigWatcher:
+    """按文件修改时间与大小轮询配置文件；load 负责读取并应用环境变量覆盖，失败时抛出异常
+
+    ignored(key, old, new) 返回非空原因时表示该项的修改不会生效（例如被 secrets 中的值覆盖），日志中单独标出。
+    """
+
+    def __init__(self, path, load, current, poll_seconds=1.0, ignored=None):
+        self.path = path
+        self.load = load
+        self.current = current
+        self.poll_seconds = poll_seconds
+        self.ignored = ignored
+        self.signature = self.file_signature()
+        self.stats = {"applied": 0, "rejected": 0}
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """文件有变化时重新加载；返回新的有效配置，否则返回 None"""
+        signature = self.file_signature()
+        if signature is None or signature == self.signature:
+            return None
+        self.signature = signature
+        try:
+            config = self.load()
+        except Exception as exc:
+            # 编辑器保存到一半时也会走到这里，写完后文件签名再次变化会重新加载
+            self.stats["rejected"] += 1
+            print(f"配置文件重新加载失败，继续使用上一份有效配置: {exc}")
+            return None
+        errors = validate_config(config)
+        if errors:
+            self.stats["rejected"] += 1
+            print("配置文件校验失败，继续使用上一份有效配置：")
+            for error in errors:
+                print(f"  - {error}")
+            return None
+        changes = diff_config(self.current, config)
+        if not changes:
+            return None
+        print(f"配置文件已更新（{len(changes)} 项）：")
+        ignored = 0
+        for key, old_value, new_value in changes:
+            old_value = mask_config_value(key, old_value)
+            new_value = mask_config_value(key, new_value)
+            reason = self.ignored(key, self.current, config) if self.ignored else ""
+            if reason:
+                ignored += 1
+                print(f"  {key}: {old_value!r} -> {new_value!r}（不生效：{reason}）")
+            else:
+                print(f"  {key}: {old_value!r} -> {new_value!r}")
+        restart_keys = requires_restart(changes)
+        if restart_keys:
+            print(f"注意: {', '.join(restart_keys)} 需要重启脚本后才能生效。")
+        self.current = config
+        if ignored == len(changes):
+            return None
+        self.stats["applied"] += 1
+        return config
+
+    async def wait(self, timeout):
+        """等待到 timeout 秒或配置发生有效变化，返回新配置或 None"""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_seconds, remaining))
+            config = await asyncio.to_thread(self.poll)
+            if config is not None:
+                return config
@@ -0,0 +1,245 @@
+"""多账号压测：在本地模拟门户、OCR 与 SMTP 接收端上运行真实检查流程，输出吞吐与资源报告"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+
+from playwright.async_api import async_playwright
+
+import spider
+from artifacts import CheckTracer, build_trace_config
+from mock_portal import MockPortal, SmtpSink
+from propagation import build_release_propagation_config, get_release_propagator
+from ratelimit import rate_limit_summary
+from replay import working_directory
+from resources import format_mb, process_tree_stats
+
+
+def percentile(samples, ratio):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def build_load_config(portal, sink, args):
+    config = spider.load_json_file("config.json.example", {})
+    portal.apply_to_config(config)
+    config["email_config"] = {
+        "smtp_server": "127.0.0.1",
+        "smtp_port": sink.port,
+        "smtp_ssl": False,
+    }
+    config["check_interval_seconds"] = args.interval
+    config["desktop_notification"] = False
+    # 验证码连续识别失败时不要无限等待手动登录
+    config["manual_login_timeout_seconds"] = args.manual_timeout
+    # 所有模拟流量都落在同一主机上；默认关闭限流，报告反映的是本机承载能力而不是令牌桶速率
+    config["rate_limit"] = dict(config.get("rate_limit", {}), enabled=args.rate_limit)
+    config["release_propagation"] = dict(
+        config.get("release_propagation", {}),
+        enabled=not args.no_propagation,
+        checks_per_second=args.propagation_rate,
+    )
+    return config
+
+
+def build_account_secrets(index):
+    return {
+        "login": {"username": f"2026{index:05d}", "password": "load"},
+        "email": {
+            "sender_email": "sender@example.com",
+            "sender_password": "load",
+            "receiver_email": f"student{index}@example.com",
+        },
+        "ocr": {"api_key": "load"},
+    }
+
+
+async def monitor_event_loop(stop, lags, interval=0.1):
+    """测量事件循环延迟：sleep 实际醒来时间比预期晚多少"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - started - interval))
+
+
+async def monitor_resources(stop, peaks, interval=1.0):
+    while not stop.is_set():
+        stats = await asyncio.to_thread(process_tree_stats)
+        for key, value in stats.items():
+            peaks[key] = max(peaks.get(key, 0), value)
+        await asyncio.sleep(interval)
+
+
+async def release_grades(stop, portal, every, releases):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        await asyncio.sleep(every)
+        releases[portal.release()] = loop.time()
+
+
+async def run_account(index, browser, config, args, deadline, stats):
+    loop = asyncio.get_running_loop()
+    secrets = build_account_secrets(index)
+    context = await browser.new_context()
+    seen_courses = {}
+    seen_file = f"seen_courses_{index}.json"
+    tracer = CheckTracer(build_trace_config(config))
+    account = spider.get_account_id(secrets)
+    propagation_config = build_release_propagation_config(config)
+    propagator = (
+        get_release_propagator(propagation_config) if propagation_config["enabled"] else None
+    )
+    # 将各账号的首次检查均匀分布在一个检查间隔内
+    next_run = loop.time() + args.interval * index / max(1, args.accounts)
+    try:
+        while next_run < deadline:
+            delay = max(0.0, next_run - loop.time())
+            if propagator is None:
+                await asyncio.sleep(delay)
+            elif await propagator.wait(account, delay):
+                stats["early_checks"] += 1
+            had_baseline = bool(seen_courses)
+            started = loop.time()
+            result = await spider.check_grades(
+                context, seen_courses, config, secrets, tracer, seen_file
+            )
+            elapsed = loop.time() - started
+            stats["latencies"].append(elapsed)
+            stats["ok" if result["ok"] else "failed"] += 1
+            if elapsed > args.interval:
+                stats["overruns"] += 1
+            if result["source"] == "executed" and had_baseline:
+                # 从成绩发布到该账号检测到变化的延迟
+                for name in result["changed"]:
+                    if name in stats["releases"]:
+                        stats["detection_lags"].append(loop.time() - stats["releases"][name])
+            next_run = max(started + args.interval, loop.time())
+    finally:
+        if propagator is not None:
+            propagator.unregister(account)
+        await context.close()
+
+
+async def run_load(args):
+    portal = MockPortal(
+        latency=args.latency,
+        ocr_latency=args.ocr_latency,
+        course_count=args.courses,
+        component_count=args.components,
+        captcha_failure_rate=args.captcha_failure_rate,
+        session_expiry_rate=args.session_expiry_rate,
+    ).start()
+    sink = SmtpSink().start()
+    config = build_load_config(portal, sink, args)
+    stats = {
+        "latencies": [],
+        "ok": 0,
+        "failed": 0,
+        "overruns": 0,
+        "early_checks": 0,
+        "releases": {},
+        "detection_lags": [],
+    }
+    lags = []
+    peaks = {}
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=True)
+                monitors = [
+                    asyncio.create_task(monitor_event_loop(stop, lags)),
+                    asyncio.create_task(monitor_resources(stop, peaks)),
+                ]
+                if args.release_every > 0:
+                    monitors.append(
+                        asyncio.create_task(
+                            release_grades(stop, portal, args.release_every, stats["releases"])
+                        )
+                    )
+                started = loop.time()
+                deadline = started + args.duration
+                await asyncio.gather(
+                    *(
+                        run_account(index, browser, config, args, deadline, stats)
+                        for index in range(args.accounts)
+                    )
+                )
+                wall = loop.time() - started
+                stop.set()
+                for task in monitors:
+                    task.cancel()
+                await asyncio.gather(*monitors, return_exceptions=True)
+                await browser.close()
+    finally:
+        sink.stop()
+        portal.stop()
+
+    latencies = stats["latencies"]
+    detection_lags = stats["detection_lags"]
+    propagation_config = build_release_propagation_config(config)
+    checks = stats["ok"] + stats["failed"]
+    return {
+        "accounts": args.accounts,
+        "interval_seconds": args.interval,
+        "wall_seconds": round(wall, 1),
+        "checks": checks,
+        "failed_checks": stats["failed"],
+        "overruns": stats["overruns"],
+        "accounts_per_minute": round(checks / wall * 60, 2) if wall else 0.0,
+        "latency_p50": round(percentile(latencies, 0.50), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "latency_p99": round(percentile(latencies, 0.99), 3),
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "peak_python_rss": format_mb(peaks.get("python_rss", 0)),
+        "peak_browser_rss": format_mb(peaks.get("browser_rss", 0)),
+        "peak_browser_processes": peaks.get("browser_processes", 0),
+        "releases": len(stats["releases"]),
+        "release_detection_p50": round(percentile(detection_lags, 0.50), 1),
+        "release_detection_p95": round(percentile(detection_lags, 0.95), 1),
+        "early_checks": stats["early_checks"],
+        "propagation": propagation_config["enabled"],
+        "event_loop_lag_p99": round(percentile(lags, 0.99), 4),
+        "event_loop_lag_max": round(max(lags), 4) if lags else 0.0,
+        "portal": dict(portal.stats),
+        "emails_received": sink.messages,
+        "rate_limit": rate_limit_summary(),
+        "falls_behind": stats["overruns"] > 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多账号压测与吞吐报告")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=60, help="每个账号的检查间隔（秒）")
+    parser.add_argument("--duration", type=float, default=300, help="压测总时长（秒）")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务器单请求延迟（秒）")
+    parser.add_argument("--ocr-latency", type=float, default=0.8)
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--components", type=int, default=3)
+    parser.add_argument("--captcha-failure-rate", type=float, default=0.1)
+    parser.add_argument("--session-expiry-rate", type=float, default=0.2)
+    parser.add_argument("--release-every", type=float, default=0, help="每隔多少秒随机发布一门成绩，0 表示不发布")
+    parser.add_argument("--rate-limit", action="store_true", help="保留默认限流设置（默认关闭）")
+    parser.add_argument("--no-propagation", action="store_true", help="关闭跨账号发布传播，用于对比")
+    parser.add_argument("--propagation-rate", type=float, default=2.0, help="发布传播每秒唤醒的账号数")
+    parser.add_argument("--manual-timeout", type=float, default=30, help="等待手动登录的超时（秒）")
+    parser.add_argument("--output", default="", help="将报告另存为 JSON 文件")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else ""
+    report = asyncio.run(run_load(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if output:
+        spider.save_json_file(output, report)
+
+
+if __name__ == "__main__":
+    main()
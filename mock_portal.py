@@ -0,0 +1,590 @@
+"""本地模拟教务系统：登录页（可嵌入 iframe）、CAS 中间页、jqGrid 成绩表、成绩详情弹窗、OCR 接口与 Webhook 接收端"""
+
+import json
+import random
+import secrets as token_source
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SUCCESS_TEXT = "广东技术师范大学教务系统"
+CAS_TEXT = "CAS统一身份认证登录"
+COMPONENT_NAMES = ["平时成绩", "期中成绩", "实验成绩", "期末成绩"]
+
+
+def render_login_form(redirect_path, hidden_toggle=False):
+    # 隐藏的“扫码/密码登录”切换按钮排在输入框之前，用于验证登录表单探测不会只看第一个匹配元素
+    toggle = (
+        '<span class="index-qr_btn-3JpGS index-sj_btn-11Xsa" style="display:none">密码登录</span>'
+        if hidden_toggle
+        else ""
+    )
+    return f"""<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8" /><title>统一身份认证</title></head>
+<body>
+  {toggle}
+  <form id="login-form">
+    <input id="userName" autocomplete="off" />
+    <input id="password" type="password" />
+    <input id="captcha" autocomplete="off" />
+    <div class="index-captcha-2FKeU"><img alt="captcha" /></div>
+    <span class="index-codeMask-20jm4">换一张</span>
+    <button class="index-submit-1UOCo index-logining-HO9Db" type="submit">登录</button>
+    <div id="error"></div>
+  </form>
+  <script>
+    const image = document.querySelector(".index-captcha-2FKeU img");
+    function loadCaptcha() {{ image.src = "/captcha.svg?t=" + Date.now(); }}
+    document.querySelector(".index-codeMask-20jm4").addEventListener("click", loadCaptcha);
+    document.getElementById("login-form").addEventListener("submit", async (event) => {{
+      event.preventDefault();
+      const response = await fetch("/api/login", {{
+        method: "POST",
+        headers: {{"Content-Type": "application/json"}},
+        body: JSON.stringify({{
+          username: document.getElementById("userName").value,
+          password: document.getElementById("password").value,
+          captcha: document.getElementById("captcha").value,
+        }}),
+      }});
+      if (response.ok) {{
+        window.top.location.href = "{redirect_path}";
+      }} else {{
+        document.getElementById("error").textContent = "验证码错误";
+        loadCaptcha();
+      }}
+    }});
+    loadCaptcha();
+  </script>
+</body>
+</html>"""
+
+
+def render_login_frame_page():
+    return """<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8" /><title>统一身份认证</title></head>
+<body><iframe src="/login/form" width="480" height="320"></iframe></body>
+</html>"""
+
+
+def render_cas_page():
+    return f"""<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8" /><title>应用认证平台</title></head>
+<body><h1>{CAS_TEXT}</h1><p>应用认证平台正在授权，请稍候……</p></body>
+</html>"""
+
+
+def render_search_shell(extra=""):
+    # 查询按钮位于 /html/body/div[2]/div/div/div[3]/div[2]/button，与默认配置一致
+    return f"""<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8" /><title>{SUCCESS_TEXT}</title></head>
+<body>
+  <div>{SUCCESS_TEXT}</div>
+  <div><div><div>
+    <div></div><div></div>
+    <div><div></div><div><button id="search" type="button">查询</button></div></div>
+  </div></div></div>
+{extra}
+</body>
+</html>"""
+
+
+def render_home_page():
+    return render_search_shell()
+
+
+def render_grades_page():
+    return render_search_shell("""  <table id="grid"><tbody></tbody></table>
+  <div role="dialog" style="display:none">
+    <div>查看成绩详情</div>
+    <table><tbody></tbody></table>
+    <button type="button" id="close">关闭</button>
+  </div>
+  <script>
+    const grid = document.querySelector("#grid tbody");
+    const dialog = document.querySelector("div[role='dialog']");
+    function cell(field, text) {
+      const td = document.createElement("td");
+      td.setAttribute("aria-describedby", "grid_" + field);
+      td.textContent = text;
+      return td;
+    }
+    async function openDetail(index) {
+      const response = await fetch("/api/detail?index=" + index);
+      const components = await response.json();
+      const body = dialog.querySelector("tbody");
+      body.innerHTML = "";
+      for (const item of components) {
+        const tr = document.createElement("tr");
+        for (const value of [item.name, item.ratio, item.score]) {
+          const td = document.createElement("td");
+          td.textContent = value;
+          tr.appendChild(td);
+        }
+        body.appendChild(tr);
+      }
+      dialog.style.display = "block";
+    }
+    document.getElementById("close").addEventListener("click", () => {
+      dialog.style.display = "none";
+    });
+    document.getElementById("search").addEventListener("click", async () => {
+      const response = await fetch("/api/grades");
+      const courses = await response.json();
+      grid.innerHTML = "";
+      courses.forEach((course, index) => {
+        const tr = document.createElement("tr");
+        tr.className = "jqgrow";
+        tr.appendChild(cell("kcmc", course.name));
+        tr.appendChild(cell("cj", course.total));
+        const action = document.createElement("td");
+        const link = document.createElement("a");
+        link.title = "查看成绩详情";
+        link.textContent = "查看成绩详情";
+        link.href = "javascript:void(0)";
+        link.addEventListener("click", () => openDetail(index));
+        action.appendChild(link);
+        tr.appendChild(action);
+        grid.appendChild(tr);
+      });
+    });
+  </script>""")
+
+
+def render_captcha_svg(expression):
+    return f"""<svg xmlns="http://www.w3.org/2000/svg" width="100" height="36">
+<rect width="100%" height="100%" fill="#f3f4f6"/>
+<text x="10" y="25" font-size="20" font-family="monospace">{expression}=?</text>
+</svg>"""
+
+
+def solve_expression(expression):
+    for symbol, apply in (
+        ("+", lambda a, b: a + b),
+        ("-", lambda a, b: a - b),
+        ("*", lambda a, b: a * b),
+    ):
+        if symbol in expression:
+            left, right = expression.split(symbol, 1)
+            return str(apply(int(left), int(right)))
+    return expression
+
+
+def build_courses(course_count, component_count):
+    courses = []
+    for index in range(course_count):
+        components = []
+        for part in range(component_count):
+            name = COMPONENT_NAMES[part % len(COMPONENT_NAMES)]
+            if part >= len(COMPONENT_NAMES):
+                name = f"{name}{part // len(COMPONENT_NAMES) + 1}"
+            components.append(
+                {
+                    "name": name,
+                    "ratio": f"{100 // max(1, component_count)}%",
+                    "score": str(60 + (index * 7 + part * 3) % 40),
+                }
+            )
+        courses.append(
+            {
+                "name": f"课程{index + 1:04d}",
+                "total": str(60 + (index * 11) % 40),
+                "components": components,
+            }
+        )
+    return courses
+
+
+class MockPortal:
+    """模拟统一认证登录、CAS 授权、成绩查询与 OpenAI 兼容 OCR 接口"""
+
+    def __init__(
+        self,
+        latency=0.0,
+        ocr_latency=0.0,
+        ocr_image_latency=0.0,
+        ocr_concurrency=0,
+        ocr_batch_mode="json",
+        captcha_expression="12+8",
+        ocr_responses=None,
+        course_count=10,
+        component_count=3,
+        use_iframe=False,
+        use_cas=True,
+        hidden_login_toggle=False,
+        captcha_failure_rate=0.0,
+        session_expiry_rate=0.0,
+    ):
+        self.latency = latency
+        self.ocr_latency = ocr_latency
+        # 批量请求中每多一张图片增加的延迟；并发上限模拟 OCR 服务的限流
+        self.ocr_image_latency = ocr_image_latency
+        self.ocr_slots = threading.Semaphore(ocr_concurrency) if ocr_concurrency > 0 else None
+        self.ocr_batch_mode = ocr_batch_mode
+        self.captcha_expression = captcha_expression
+        # 回放模式下按顺序返回录制时的 OCR 结果
+        self.ocr_responses = list(ocr_responses or [])
+        self.ocr_calls = 0
+        self.courses = build_courses(course_count, component_count)
+        self.use_iframe = use_iframe
+        self.use_cas = use_cas
+        self.hidden_login_toggle = hidden_login_toggle
+        self.captcha_failure_rate = captcha_failure_rate
+        self.session_expiry_rate = session_expiry_rate
+        self.random = random.Random(0)
+        self.stats = {"logins": 0, "failed_logins": 0, "expired_sessions": 0, "ocr_requests": 0, "ocr_images": 0}
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def host(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def apply_to_config(self, config):
+        """把配置中的 URL、CAS 与 OCR 地址指向本模拟门户"""
+        config["login_url"] = f"{self.base_url}/login"
+        config["grades_url"] = f"{self.base_url}/grades"
+        config["cas"] = dict(
+            config.get("cas", {}),
+            auth_url=f"{self.base_url}/cas/authorize",
+            portal_host=self.host,
+        )
+        config["ocr"] = dict(config.get("ocr", {}), base_url=self.base_url, model="mock")
+        return config
+
+    def start(self, host="127.0.0.1", port=0):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                portal.handle(self, "GET")
+
+            def do_POST(self):
+                portal.handle(self, "POST")
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def chance(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def release(self):
+        """随机修改一门课程的总评，模拟成绩发布"""
+        with self.lock:
+            course = self.random.choice(self.courses)
+            course["total"] = str(60 + self.random.randrange(40))
+        return course["name"]
+
+    def expire_session(self, token):
+        with self.lock:
+            self.sessions.discard(token)
+
+    def create_session(self):
+        token = token_source.token_hex(8)
+        with self.lock:
+            self.sessions.add(token)
+        return token
+
+    def session_of(self, handler):
+        for part in handler.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "session":
+                with self.lock:
+                    if value in self.sessions:
+                        return value
+        return ""
+
+    def reply(self, handler, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def reply_json(self, handler, data, status=200, headers=None):
+        self.reply(handler, status, json.dumps(data, ensure_ascii=False), "application/json", headers)
+
+    def read_json(self, handler):
+        length = int(handler.headers.get("Content-Length", "0"))
+        raw = handler.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw.decode("utf-8") or "{}")
+        except ValueError:
+            return {}
+
+    def handle(self, handler, method):
+        parsed = urlparse(handler.path)
+        path = parsed.path
+        if path == "/v1/chat/completions" and method == "POST":
+            self.handle_ocr(handler)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        session = self.session_of(handler)
+        if path == "/login" and method == "GET":
+            if self.use_iframe:
+                self.reply(handler, 200, render_login_frame_page())
+            else:
+                self.reply(handler, 200, self.render_login_form())
+        elif path == "/login/form":
+            self.reply(handler, 200, self.render_login_form())
+        elif path == "/captcha.svg":
+            self.reply(handler, 200, render_captcha_svg(self.captcha_expression), "image/svg+xml")
+        elif path == "/api/login" and method == "POST":
+            payload = self.read_json(handler)
+            if payload.get("captcha") != solve_expression(self.captcha_expression):
+                self.count("failed_logins")
+                self.reply_json(handler, {}, status=401)
+                return
+            self.count("logins")
+            token = self.create_session()
+            self.reply_json(handler, {}, headers={"Set-Cookie": f"session={token}; Path=/"})
+        elif path == "/cas":
+            self.reply(handler, 200, render_cas_page())
+        elif path == "/cas/authorize":
+            self.reply(handler, 302, headers={"Location": "/home" if session else "/login"})
+        elif path in ("/home", "/grades"):
+            if session and path == "/grades" and self.chance(self.session_expiry_rate):
+                self.expire_session(session)
+                self.count("expired_sessions")
+                session = ""
+            if not session:
+                self.reply(handler, 302, headers={"Location": "/login"})
+                return
+            page = render_home_page() if path == "/home" else render_grades_page()
+            self.reply(handler, 200, page)
+        elif path == "/api/grades":
+            if not session:
+                self.reply_json(handler, [], status=401)
+                return
+            self.reply_json(
+                handler,
+                [{"name": course["name"], "total": course["total"]} for course in self.courses],
+            )
+        elif path == "/api/detail":
+            if not session:
+                self.reply_json(handler, [], status=401)
+                return
+            index = int(parse_qs(parsed.query).get("index", ["0"])[0])
+            course = self.courses[index] if 0 <= index < len(self.courses) else {}
+            self.reply_json(handler, course.get("components", []))
+        else:
+            self.reply(handler, 404, "not found", "text/plain; charset=utf-8")
+
+    def render_login_form(self):
+        return render_login_form(self.after_login_path(), self.hidden_login_toggle)
+
+    def after_login_path(self):
+        return "/cas" if self.use_cas else "/home"
+
+    def recognize_captcha(self):
+        content = self.captcha_expression
+        if self.chance(self.captcha_failure_rate):
+            # 模拟 OCR 识别错误：返回一个结果不同的算式
+            content = "99*99" if self.captcha_expression != "99*99" else "1+1"
+        with self.lock:
+            if self.ocr_responses and content == self.captcha_expression:
+                content = self.ocr_responses[self.ocr_calls % len(self.ocr_responses)]
+            self.ocr_calls += 1
+            self.stats["ocr_images"] += 1
+        return content
+
+    def handle_ocr(self, handler):
+        payload = self.read_json(handler)
+        images = sum(
+            1
+            for message in payload.get("messages", [])
+            if isinstance(message.get("content"), list)
+            for part in message["content"]
+            if part.get("type") == "image_url"
+        )
+        images = max(1, images)
+        if self.ocr_slots is not None:
+            self.ocr_slots.acquire()
+        try:
+            delay = self.ocr_latency + self.ocr_image_latency * (images - 1)
+            if delay:
+                time.sleep(delay)
+        finally:
+            if self.ocr_slots is not None:
+                self.ocr_slots.release()
+        self.count("ocr_requests")
+        answers = [self.recognize_captcha() for _ in range(images)]
+        if images == 1:
+            content = answers[0]
+        elif self.ocr_batch_mode == "lines":
+            content = "\n".join(f"{index}: {answer}" for index, answer in enumerate(answers, 1))
+        elif self.ocr_batch_mode == "invalid":
+            # 模拟模型没有按要求输出编号，批量结果无法拆分
+            content = " ".join(answers[:-1])
+        else:
+            content = json.dumps(
+                {str(index): answer for index, answer in enumerate(answers, 1)}, ensure_ascii=False
+            )
+        body = {"choices": [{"message": {"content": content}}]}
+        self.reply_json(handler, body)
+
+
+class SmtpSink:
+    """最小化的明文 SMTP 接收端，只计数收到的邮件，供压测使用"""
+
+    def __init__(self):
+        self.messages = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self, host="127.0.0.1", port=0):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def send(self, line):
+                self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+            def handle(self):
+                self.send("220 mock smtp ready")
+                while True:
+                    raw = self.rfile.readline()
+                    if not raw:
+                        return
+                    command = raw.decode("utf-8", "replace").strip()
+                    verb = command.split(" ", 1)[0].upper()
+                    if verb == "EHLO":
+                        self.send("250-mock")
+                        self.send("250 AUTH PLAIN LOGIN")
+                    elif verb == "AUTH":
+                        self.send("235 authenticated")
+                    elif verb == "DATA":
+                        self.send("354 end with .")
+                        while self.rfile.readline().rstrip(b"\r\n") != b".":
+                            pass
+                        with sink.lock:
+                            sink.messages += 1
+                        self.send("250 queued")
+                    elif verb == "QUIT":
+                        self.send("221 bye")
+                        return
+                    else:
+                        self.send("250 ok")
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class WebhookReceiver:
+    """记录收到的 Webhook 请求；前 fail_first 个请求返回 503，用于验证重试与死信"""
+
+    def __init__(self, fail_first=0, latency=0.0):
+        self.fail_first = fail_first
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self.payloads = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self, host="127.0.0.1", port=0):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with receiver.lock:
+                    receiver.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                raw = self.rfile.read(length) if length else b""
+                if receiver.latency:
+                    time.sleep(receiver.latency)
+                with receiver.lock:
+                    receiver.requests += 1
+                    failed = receiver.requests <= receiver.fail_first
+                    if not failed:
+                        try:
+                            receiver.payloads.append((self.path, json.loads(raw.decode("utf-8"))))
+                        except ValueError:
+                            failed = True
+                status = 503 if failed else 200
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+if __name__ == "__main__":
+    portal = MockPortal().start(port=8765)
+    print(f"模拟门户已启动: {portal.base_url}/login")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        portal.stop()
@@ -0,0 +1,383 @@
+"""Webhook 与聊天机器人推送：合并短时间内的多次变更、复用 HTTP 连接、失败重试并写入死信文件，不阻塞成绩检查"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+from changefeed import build_change_events
+
+DEAD_LETTER_FILE = "webhook_dead_letter.jsonl"
+RETRYABLE_STATUS = (408, 425, 429)
+
+
+def build_webhook_config(config):
+    webhook = config.get("webhook", {})
+    targets = []
+    for index, target in enumerate(webhook.get("targets", [])):
+        if not isinstance(target, dict) or not target.get("url"):
+            continue
+        targets.append(
+            {
+                "name": target.get("name") or f"target{index}",
+                "url": target["url"],
+                "template": target.get("template", "generic"),
+                "headers": dict(target.get("headers", {})),
+            }
+        )
+    return {
+        "enabled": bool(webhook.get("enabled", True)) and bool(targets),
+        "targets": targets,
+        "coalesce_seconds": max(0.0, float(webhook.get("coalesce_seconds", 5))),
+        "timeout_seconds": max(1.0, float(webhook.get("timeout_seconds", 10))),
+        "max_retries": max(0, int(webhook.get("max_retries", 4))),
+        "backoff_seconds": max(0.1, float(webhook.get("backoff_seconds", 1))),
+        "max_backoff_seconds": max(0.1, float(webhook.get("max_backoff_seconds", 60))),
+        "max_connections": max(1, int(webhook.get("max_connections", 8))),
+        "dead_letter_file": webhook.get("dead_letter_file", DEAD_LETTER_FILE),
+    }
+
+
+def format_change_line(event):
+    current = event["current"]
+    previous = event.get("previous")
+    line = f"[{event['account']}] {event['course']} 总评: {current.get('total', '')}"
+    if previous is not None and previous.get("total", "") != current.get("total", ""):
+        line += f"（原 {previous.get('total', '')}）"
+    for component in current.get("components", []):
+        line += (
+            f"\n  {component.get('name', '')} {component.get('ratio', '')}"
+            f" {component.get('score', '')}"
+        )
+    return line
+
+
+def format_changes_text(events):
+    return "发现成绩更新：\n" + "\n".join(format_change_line(event) for event in events)
+
+
+def render_generic(events):
+    return {"event": "grade_changes", "count": len(events), "changes": events}
+
+
+def render_text_message(events):
+    # 钉钉与企业微信群机器人的文本消息格式相同
+    return {"msgtype": "text", "text": {"content": format_changes_text(events)}}
+
+
+def render_feishu(events):
+    return {"msg_type": "text", "content": {"text": format_changes_text(events)}}
+
+
+def render_slack(events):
+    return {"text": format_changes_text(events)}
+
+
+def render_discord(events):
+    return {"content": format_changes_text(events)[:2000]}
+
+
+TEMPLATES = {
+    "generic": render_generic,
+    "dingtalk": render_text_message,
+    "wecom": render_text_message,
+    "feishu": render_feishu,
+    "slack": render_slack,
+    "discord": render_discord,
+}
+
+
+class HttpConnectionPool:
+    """按 (协议, 主机, 端口) 复用 keep-alive 连接；请求在线程中执行，不占用事件循环"""
+
+    def __init__(self, max_connections=8, timeout=10.0):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.slots = asyncio.Semaphore(max_connections)
+
+    def acquire_connection(self, key):
+        import http.client
+
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+        scheme, host, port = key
+        connection_class = (
+            http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        )
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def release_connection(self, key, connection):
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+
+    def post_sync(self, url, body, headers):
+        import http.client
+
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        while True:
+            connection, reused = self.acquire_connection(key)
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if reused:
+                    # 空闲连接可能已被对端关闭，换一个新连接重发
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release_connection(key, connection)
+            return response.status, dict(response.getheaders()), payload
+
+    async def post(self, url, body, headers):
+        async with self.slots:
+            return await asyncio.to_thread(self.post_sync, url, body, headers)
+
+    def close(self):
+        with self.lock:
+            connections = [conn for group in self.idle.values() for conn in group]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+def append_dead_letter(path, record):
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as exc:
+        print(f"写入死信文件失败: {path} ({exc})")
+
+
+class WebhookNotifier:
+    """每个目标一个缓冲区：第一条变更到达后等待 coalesce_seconds，把期间的所有变更合并为一次推送
+
+    进行中的推送按任务记录 (目标, 事件, 已尝试次数, 最近错误)；close() 超时取消的推送据此写入死信，不会丢失。
+    """
+
+    def __init__(self, webhook_config):
+        self.config = webhook_config
+        self.pool = HttpConnectionPool(
+            webhook_config["max_connections"], webhook_config["timeout_seconds"]
+        )
+        self.buffers = {}
+        self.tasks = set()
+        self.deliveries = {}
+        self.stats = {"submitted": 0, "delivered": 0, "retries": 0, "dead_letters": 0}
+
+    def update_config(self, webhook_config):
+        self.config = webhook_config
+        self.pool.timeout = webhook_config["timeout_seconds"]
+
+    def submit(self, events):
+        """只把事件放入缓冲区并安排后台推送，立即返回"""
+        if not events:
+            return
+        self.stats["submitted"] += len(events)
+        for target in self.config["targets"]:
+            name = target["name"]
+            buffer = self.buffers.get(name)
+            if buffer is None:
+                buffer = self.buffers[name] = {"target": target, "events": []}
+                buffer["timer"] = self.spawn(self.flush_later(name))
+            buffer["target"] = target
+            buffer["events"].extend(events)
+
+    def spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def flush_later(self, name):
+        await asyncio.sleep(self.config["coalesce_seconds"])
+        buffer = self.buffers.pop(name, None)
+        if buffer is not None:
+            await self.deliver(buffer["target"], buffer["events"])
+
+    async def deliver(self, target, events):
+        render = TEMPLATES.get(target["template"], render_generic)
+        body = json.dumps(render(events), ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", **target["headers"]}
+        delivery = {"target": target, "events": events, "attempts": 0, "error": ""}
+        task = asyncio.current_task()
+        # 被取消时（close 超时）记录保留在 deliveries 中，由 close 写入死信
+        self.deliveries[task] = delivery
+        for attempt in range(self.config["max_retries"] + 1):
+            delivery["attempts"] = attempt + 1
+            retry_after = None
+            try:
+                status, response_headers, _ = await self.pool.post(target["url"], body, headers)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                delivery["error"] = f"{type(exc).__name__}: {exc}"
+            else:
+                if 200 <= status < 300:
+                    self.deliveries.pop(task, None)
+                    self.stats["delivered"] += 1
+                    return True
+                delivery["error"] = f"HTTP {status}"
+                if status < 500 and status not in RETRYABLE_STATUS:
+                    break
+                retry_after = response_headers.get("Retry-After")
+            if attempt == self.config["max_retries"]:
+                break
+            self.stats["retries"] += 1
+            delay = min(
+                self.config["max_backoff_seconds"],
+                self.config["backoff_seconds"] * 2**attempt,
+            )
+            try:
+                delay = max(delay, float(retry_after)) if retry_after else delay
+            except ValueError:
+                pass
+            # 加入抖动，避免多个目标同时重试
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+
+        self.deliveries.pop(task, None)
+        await asyncio.to_thread(self.dead_letter, delivery)
+        return False
+
+    def dead_letter(self, delivery, note=""):
+        target = delivery["target"]
+        error = delivery["error"] or "未完成"
+        if note:
+            error = f"{error}（{note}）"
+        self.stats["dead_letters"] += 1
+        print(
+            f"Webhook 推送失败（{target['name']}，尝试 {delivery['attempts']} 次）：{error}，已写入死信文件。"
+        )
+        append_dead_letter(
+            self.config["dead_letter_file"],
+            {
+                "timestamp": int(time.time()),
+                "target": target["name"],
+                "template": target["template"],
+                "attempts": delivery["attempts"],
+                "error": error,
+                "events": delivery["events"],
+            },
+        )
+
+    async def close(self, timeout=30.0):
+        """立即推送所有缓冲区中的变更，并等待进行中的推送完成；超时仍未完成的推送写入死信"""
+        for name in list(self.buffers):
+            buffer = self.buffers.pop(name)
+            buffer["timer"].cancel()
+            self.spawn(self.deliver(buffer["target"], buffer["events"]))
+        pending = [task for task in self.tasks if not task.done()]
+        if pending:
+            _, still_pending = await asyncio.wait(pending, timeout=timeout)
+            for task in still_pending:
+                task.cancel()
+            await asyncio.gather(*still_pending, return_exceptions=True)
+        # 取消时可能正在发送的请求仍会在线程中完成，因此接收端可能收到一次死信里也有的推送
+        for delivery in self.deliveries.values():
+            self.dead_letter(delivery, "关闭时仍未送达")
+        self.deliveries.clear()
+        self.pool.close()
+
+
+_NOTIFIERS = weakref.WeakKeyDictionary()
+
+
+def get_webhook_notifier(webhook_config):
+    """每个事件循环一个推送器，连接池与后台任务都绑定在该循环上"""
+    loop = asyncio.get_running_loop()
+    notifier = _NOTIFIERS.get(loop)
+    if notifier is None:
+        notifier = WebhookNotifier(webhook_config)
+        _NOTIFIERS[loop] = notifier
+    else:
+        notifier.update_config(webhook_config)
+    return notifier
+
+
+def notify_webhooks(config, account, changes):
+    """check_grades 检测到变化后调用；只入队，不等待推送结果"""
+    webhook_config = build_webhook_config(config)
+    if not webhook_config["enabled"] or not changes:
+        return
+    get_webhook_notifier(webhook_config).submit(build_change_events(account, changes))
+
+
+async def close_webhook_notifier():
+    notifier = _NOTIFIERS.pop(asyncio.get_running_loop(), None)
+    if notifier is not None:
+        await notifier.close()
+
+
+async def run_self_test(args):
+    """向本地接收端发送模拟变更，验证合并、重试与死信"""
+    from mock_portal import WebhookReceiver
+
+    receiver = WebhookReceiver(fail_first=args.fail_first).start()
+    try:
+        config = {
+            "webhook": {
+                "targets": [
+                    {"name": name, "url": f"{receiver.base_url}/{name}", "template": name}
+                    for name in args.templates
+                ],
+                "coalesce_seconds": args.coalesce,
+                "backoff_seconds": 0.2,
+                "max_retries": args.max_retries,
+                "dead_letter_file": args.dead_letter,
+            }
+        }
+        current = {"total": "92", "components": [{"name": "期末成绩", "ratio": "60%", "score": "95"}]}
+        started = time.monotonic()
+        for index in range(args.changes):
+            notify_webhooks(config, f"student{index % 3}", [(f"课程{index}", None, current)])
+        submit_seconds = time.monotonic() - started
+        notifier = _NOTIFIERS.get(asyncio.get_running_loop())
+        # 等待合并窗口结束与全部重试完成
+        while notifier is not None and notifier.tasks:
+            await asyncio.sleep(0.1)
+        stats = dict(notifier.stats) if notifier else {}
+        await close_webhook_notifier()
+        return {
+            "submit_seconds": round(submit_seconds, 4),
+            "requests_received": receiver.requests,
+            "connections_opened": receiver.connections,
+            "payloads_accepted": len(receiver.payloads),
+            "paths": sorted({path for path, _ in receiver.payloads}),
+            "notifier": stats,
+        }
+    finally:
+        receiver.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook 推送自测：向本地接收端发送模拟成绩变更")
+    parser.add_argument("--changes", type=int, default=10, help="短时间内提交的变更条数")
+    parser.add_argument("--templates", nargs="*", default=sorted(TEMPLATES))
+    parser.add_argument("--coalesce", type=float, default=1.0)
+    parser.add_argument("--fail-first", type=int, default=2, help="接收端对前 N 个请求返回 503")
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--dead-letter", default=DEAD_LETTER_FILE)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run_self_test(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
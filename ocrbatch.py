@@ -0,0 +1,239 @@
+"""验证码 OCR 微批处理：短时间窗口内到达的多张验证码合并为一次请求，按编号拆分结果，解析失败时逐张重试"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import weakref
+
+CAPTCHA_PROMPT = "请识别图片中的算式，只输出算式，例如 12+8，不要输出其他文字。"
+BATCH_LINE_PATTERN = re.compile(r"^\s*(\d+)\s*[:：.、)）]\s*(.+?)\s*$")
+
+
+def build_ocr_batch_config(config):
+    batch = config.get("ocr", {}).get("batch", {})
+    return {
+        "enabled": bool(batch.get("enabled", True)),
+        "window_seconds": max(0.0, float(batch.get("window_ms", 150)) / 1000),
+        "max_images": max(1, int(batch.get("max_images", 8))),
+    }
+
+
+def build_batch_prompt(count):
+    return (
+        f"下面依次给出 {count} 张验证码图片，编号为 1 到 {count}。"
+        "请分别识别每张图片中的算式，只输出一个 JSON 对象，键为图片编号，值为算式，"
+        '例如 {"1": "12+8", "2": "7*3"}，不要输出其他文字。'
+    )
+
+
+def parse_batch_answer(text, count):
+    """把批量结果拆分为与图片顺序一致的列表；编号缺失、重复或格式不对时返回 None"""
+    if not text:
+        return None
+    answers = {}
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(text[start : end + 1])
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if str(key).strip().isdigit() and isinstance(value, (str, int, float)):
+                    answers[int(str(key).strip())] = str(value).strip()
+    if not answers:
+        # 部分模型不按 JSON 输出，而是逐行输出 “1: 12+8”
+        for line in text.splitlines():
+            match = BATCH_LINE_PATTERN.match(line)
+            if match:
+                index = int(match.group(1))
+                if index in answers:
+                    return None
+                answers[index] = match.group(2)
+    if set(answers) != set(range(1, count + 1)) or not all(answers.values()):
+        return None
+    return [answers[index] for index in range(1, count + 1)]
+
+
+class OcrBatcher:
+    """按 OCR 服务（地址、模型、密钥）分组缓冲验证码；request(ocr_config, prompt, images) 同步返回模型输出文本"""
+
+    def __init__(self, request):
+        self.request = request
+        self.pending = {}
+        self.active = {}
+        self.tasks = set()
+        self.stats = {"images": 0, "requests": 0, "batches": 0, "batched_images": 0, "fallbacks": 0}
+
+    async def recognize(self, ocr_config, image_base64):
+        batch_config = ocr_config["batch"]
+        loop = asyncio.get_running_loop()
+        key = (ocr_config["base_url"], ocr_config["model"], ocr_config["api_key"])
+        future = loop.create_future()
+        self.stats["images"] += 1
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = {"config": ocr_config, "items": [], "timer": None}
+        pending["items"].append((image_base64, future))
+        # 没有其他识别在进行时立即发送，单账号登录不为等待窗口付出延迟；
+        # 只有已有请求在途（多个账号同时登录）时才在窗口内攒批
+        if not self.active.get(key) or len(pending["items"]) >= batch_config["max_images"]:
+            if pending["timer"] is not None:
+                pending["timer"].cancel()
+            self.flush(key)
+        elif pending["timer"] is None:
+            pending["timer"] = loop.call_later(batch_config["window_seconds"], self.flush, key)
+        return await future
+
+    def flush(self, key):
+        pending = self.pending.pop(key, None)
+        if pending is None:
+            return
+        # 等待方已取消（例如验证码在识别前消失）的图片不再发送
+        items = [item for item in pending["items"] if not item[1].done()]
+        if items:
+            self.active[key] = self.active.get(key, 0) + 1
+            task = asyncio.ensure_future(self.run_batch(pending["config"], items))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            task.add_done_callback(lambda _: self.finished(key))
+
+    def finished(self, key):
+        self.active[key] -= 1
+        if not self.active[key]:
+            del self.active[key]
+
+    async def request_text(self, ocr_config, prompt, images):
+        self.stats["requests"] += 1
+        return await asyncio.to_thread(self.request, ocr_config, prompt, images)
+
+    async def run_batch(self, ocr_config, items):
+        images = [image for image, _ in items]
+        try:
+            if len(items) == 1:
+                answers = [await self.request_text(ocr_config, CAPTCHA_PROMPT, images)]
+            else:
+                self.stats["batches"] += 1
+                self.stats["batched_images"] += len(items)
+                text = await self.request_text(ocr_config, build_batch_prompt(len(items)), images)
+                answers = parse_batch_answer(text, len(items))
+                if answers is None:
+                    self.stats["fallbacks"] += 1
+                    print(f"批量 OCR 结果无法解析，改为逐张识别 {len(items)} 张验证码: {text!r}")
+                    answers = await asyncio.gather(
+                        *(self.request_text(ocr_config, CAPTCHA_PROMPT, [image]) for image in images)
+                    )
+        except Exception as exc:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), answer in zip(items, answers):
+            if not future.done():
+                future.set_result(answer)
+
+
+_BATCHERS = weakref.WeakKeyDictionary()
+
+
+def get_ocr_batcher(request):
+    """每个事件循环一个批处理器，定时器与后台任务都绑定在该循环上"""
+    loop = asyncio.get_running_loop()
+    batcher = _BATCHERS.get(loop)
+    if batcher is None:
+        batcher = OcrBatcher(request)
+        _BATCHERS[loop] = batcher
+    return batcher
+
+
+async def simulate_login(portal, ocr_config, call_ocr_text, solve):
+    """不启动浏览器的登录：获取验证码、识别、提交，返回是否登录成功"""
+    import base64
+    import urllib.request
+
+    def fetch_captcha():
+        with urllib.request.urlopen(f"{portal.base_url}/captcha.svg", timeout=10) as response:
+            return base64.b64encode(response.read()).decode("ascii")
+
+    def submit(answer):
+        request = urllib.request.Request(
+            f"{portal.base_url}/api/login",
+            data=json.dumps({"captcha": answer}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10):
+                return True
+        except Exception:
+            return False
+
+    image = await asyncio.to_thread(fetch_captcha)
+    answer = solve(await call_ocr_text(ocr_config, image))
+    return bool(answer) and await asyncio.to_thread(submit, answer)
+
+
+async def run_mass_login(args, batch_enabled):
+    import spider
+    from mock_portal import MockPortal
+
+    portal = MockPortal(
+        ocr_latency=args.ocr_latency,
+        ocr_image_latency=args.ocr_image_latency,
+        ocr_concurrency=args.ocr_concurrency,
+        ocr_batch_mode=args.batch_mode,
+    ).start()
+    try:
+        config = portal.apply_to_config({})
+        config["ocr"]["batch"] = {
+            "enabled": batch_enabled,
+            "window_ms": args.window_ms,
+            "max_images": args.max_images,
+        }
+        ocr_config = spider.build_ocr_config(config, {"ocr": {"api_key": "mock"}})
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *(
+                simulate_login(portal, ocr_config, spider.call_ocr_text, spider.solve_math_from_text)
+                for _ in range(args.logins)
+            )
+        )
+        wall = time.monotonic() - started
+        # 以脚本运行时本模块是 __main__，要通过 spider 取到它实际使用的批处理器
+        stats = spider.get_ocr_batcher(spider.request_ocr_completion).stats
+        return {
+            "batch": batch_enabled,
+            "wall_seconds": round(wall, 3),
+            "logins_per_second": round(len(results) / wall, 2) if wall else 0.0,
+            "successful_logins": sum(results),
+            "ocr_requests": portal.stats["ocr_requests"],
+            "batcher": dict(stats) if batch_enabled else {},
+        }
+    finally:
+        portal.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量 OCR 自测：模拟大量账号同时重新登录，比较逐张与批量识别的吞吐")
+    parser.add_argument("--logins", type=int, default=40, help="同时重新登录的账号数")
+    parser.add_argument("--window-ms", type=float, default=150)
+    parser.add_argument("--max-images", type=int, default=8)
+    parser.add_argument("--ocr-latency", type=float, default=0.8, help="模拟 OCR 单次请求延迟（秒）")
+    parser.add_argument("--ocr-image-latency", type=float, default=0.05, help="批量请求中每多一张图片增加的延迟（秒）")
+    parser.add_argument("--ocr-concurrency", type=int, default=4, help="模拟 OCR 服务的并发上限，0 表示不限")
+    parser.add_argument(
+        "--batch-mode", choices=("json", "lines", "invalid"), default="json", help="模拟 OCR 服务的批量输出格式"
+    )
+    args = parser.parse_args()
+    report = {
+        "single": asyncio.run(run_mass_login(args, False)),
+        "batched": asyncio.run(run_mass_login(args, True)),
+    }
+    single, batched = report["single"]["wall_seconds"], report["batched"]["wall_seconds"]
+    report["speedup"] = round(single / batched, 2) if batched else 0.0
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""跨账号成绩发布传播：维护课程到账号的索引，某个账号发现新总评后，按限速唤醒选了同一课程的其他账号提前检查"""
+
+import asyncio
+import sys
+import time
+import weakref
+from collections import deque
+
+from singleflight import get_single_flight
+
+
+def build_release_propagation_config(config):
+    propagation = config.get("release_propagation", {})
+    return {
+        "enabled": bool(propagation.get("enabled", True)),
+        "checks_per_second": max(0.01, float(propagation.get("checks_per_second", 1.0))),
+        "account_cooldown_seconds": max(
+            0.0, float(propagation.get("account_cooldown_seconds", 60))
+        ),
+        "course_cooldown_seconds": max(
+            0.0, float(propagation.get("course_cooldown_seconds", 600))
+        ),
+    }
+
+
+def course_key(name):
+    # 成绩表只提供课程名，同名课程视为同一门课
+    return sys.intern(" ".join(str(name).split()))
+
+
+def released_courses(changes):
+    """新出现总评或总评发生变化的课程；只有分项变化不算发布"""
+    names = []
+    for name, previous, current in changes:
+        total = current.get("total", "")
+        if total and (previous is None or previous.get("total", "") != total):
+            names.append(name)
+    return names
+
+
+class CourseIndex:
+    """课程 -> 账号集合，同时保存账号 -> 课程集合以便账号课程变化时增量更新"""
+
+    def __init__(self):
+        self.accounts = {}
+        self.courses = {}
+
+    def update(self, account, names):
+        keys = frozenset(course_key(name) for name in names)
+        old_keys = self.courses.get(account, frozenset())
+        for key in old_keys - keys:
+            accounts = self.accounts.get(key)
+            if accounts is not None:
+                accounts.discard(account)
+                if not accounts:
+                    del self.accounts[key]
+        for key in keys - old_keys:
+            self.accounts.setdefault(key, set()).add(account)
+        self.courses[account] = keys
+
+    def classmates(self, account, name):
+        return sorted(self.accounts.get(course_key(name), set()) - {account})
+
+
+class ReleasePropagator:
+    """同一事件循环内的账号在这里登记唤醒事件；发布传播按 checks_per_second 逐个唤醒，不改变各账号的检查间隔"""
+
+    def __init__(self, propagation_config):
+        self.config = propagation_config
+        self.index = CourseIndex()
+        self.wakers = {}
+        self.queue = deque()
+        self.queued = {}
+        self.last_triggered = {}
+        self.last_propagated = {}
+        self.dispatcher = None
+        self.stats = {"releases": 0, "suppressed": 0, "enqueued": 0, "triggered": 0, "skipped": 0}
+
+    def register(self, account):
+        return self.wakers.setdefault(account, asyncio.Event())
+
+    def unregister(self, account):
+        self.wakers.pop(account, None)
+
+    async def wait(self, account, timeout):
+        """等待到 timeout 秒或被发布传播唤醒；被唤醒时返回 True"""
+        waker = self.register(account)
+        try:
+            await asyncio.wait_for(waker.wait(), max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waker.clear()
+
+    def observe(self, account, course_names, changes):
+        """每次成功检查后调用：更新课程索引，并为新发布的课程安排同课程账号的提前检查"""
+        self.index.update(account, course_names)
+        now = time.monotonic()
+        self.prune(now)
+        for name in released_courses(changes):
+            key = course_key(name)
+            # 被唤醒的账号检查到同一次发布时不再向外扩散
+            if now - self.last_propagated.get(key, float("-inf")) < self.config["course_cooldown_seconds"]:
+                self.stats["suppressed"] += 1
+                continue
+            self.last_propagated[key] = now
+            self.stats["releases"] += 1
+            targets = [
+                other
+                for other in self.index.classmates(account, name)
+                if other in self.wakers and other not in self.queued
+            ]
+            for other in targets:
+                self.queue.append(other)
+                self.queued[other] = name
+            self.stats["enqueued"] += len(targets)
+            if targets:
+                print(f"[{account}] 发现 {name} 已发布，安排 {len(targets)} 个同课程账号提前检查。")
+        if self.queue and (self.dispatcher is None or self.dispatcher.done()):
+            self.dispatcher = asyncio.ensure_future(self.dispatch())
+
+    def prune(self, now):
+        """丢弃已过冷却期的记录：它们不再影响判断，长期运行时课程与账号会不断更替"""
+        for records, cooldown in (
+            (self.last_propagated, self.config["course_cooldown_seconds"]),
+            (self.last_triggered, self.config["account_cooldown_seconds"]),
+        ):
+            for key in [key for key, at in records.items() if now - at >= cooldown]:
+                del records[key]
+
+    async def dispatch(self):
+        while self.queue:
+            account = self.queue.popleft()
+            self.queued.pop(account, None)
+            waker = self.wakers.get(account)
+            now = time.monotonic()
+            last = self.last_triggered.get(account, float("-inf"))
+            if waker is None or now - last < self.config["account_cooldown_seconds"]:
+                self.stats["skipped"] += 1
+                continue
+            self.last_triggered[account] = now
+            self.stats["triggered"] += 1
+            # 该账号若在 result_ttl_seconds 内刚检查过，被唤醒的检查会直接复用缓存结果而错过这次发布
+            get_single_flight().forget_prefix(("check", account))
+            waker.set()
+            await asyncio.sleep(1 / self.config["checks_per_second"])
+
+
+_PROPAGATORS = weakref.WeakKeyDictionary()
+
+
+def get_release_propagator(propagation_config):
+    loop = asyncio.get_running_loop()
+    propagator = _PROPAGATORS.get(loop)
+    if propagator is None:
+        propagator = ReleasePropagator(propagation_config)
+        _PROPAGATORS[loop] = propagator
+    else:
+        propagator.config = propagation_config
+    return propagator
+
+
+def observe_courses(config, account, course_names, changes):
+    """run_check 成功抓取成绩后调用；changes 为空时只更新课程索引"""
+    propagation_config = build_release_propagation_config(config)
+    if not propagation_config["enabled"]:
+        return
+    get_release_propagator(propagation_config).observe(account, course_names, changes)
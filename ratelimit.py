@@ -0,0 +1,246 @@
+"""按主机共享的令牌桶限流与熔断器：在页面导航、会话预检与触发 XHR 的操作前取令牌，按响应事件统计熔断
+
+每个主机有两个令牌桶：page 用于导航、预检、登录提交与查询，detail 用于成绩详情弹窗，
+一次检查要打开每门课程的详情，单独的桶避免详情点击耗尽页面请求的令牌、把整次检查拉长。
+"""
+
+import asyncio
+import time
+import weakref
+from urllib.parse import urlsplit
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+GUARDED_RESOURCE_TYPES = ("document", "xhr", "fetch")
+PAGE_BUCKET = "page"
+DETAIL_BUCKET = "detail"
+FAILURE_MARKERS = ("TIMED_OUT", "CONNECTION_", "NAME_NOT_RESOLVED", "EMPTY_RESPONSE")
+
+
+def build_rate_limit_config(config):
+    rate_limit = config.get("rate_limit", {})
+    return {
+        "enabled": bool(rate_limit.get("enabled", True)),
+        "requests_per_second": max(0.01, float(rate_limit.get("requests_per_second", 2.0))),
+        "burst": max(1, int(rate_limit.get("burst", 10))),
+        "detail_requests_per_second": max(
+            0.01, float(rate_limit.get("detail_requests_per_second", 10.0))
+        ),
+        "detail_burst": max(1, int(rate_limit.get("detail_burst", 60))),
+        "failure_threshold": max(1, int(rate_limit.get("failure_threshold", 5))),
+        "open_seconds": max(1.0, float(rate_limit.get("open_seconds", 30))),
+        "max_open_seconds": max(1.0, float(rate_limit.get("max_open_seconds", 600))),
+        "probe_timeout_seconds": max(1.0, float(rate_limit.get("probe_timeout_seconds", 30))),
+    }
+
+
+def bucket_limits(rate_limit_config, bucket):
+    if bucket == DETAIL_BUCKET:
+        return rate_limit_config["detail_requests_per_second"], rate_limit_config["detail_burst"]
+    return rate_limit_config["requests_per_second"], rate_limit_config["burst"]
+
+
+class HostGuard:
+    """单个主机的令牌桶与熔断器；同一事件循环内所有账号与页面共享"""
+
+    def __init__(self, host, rate_limit_config):
+        self.host = host
+        self.config = rate_limit_config
+        self.buckets = {}
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.open_seconds = rate_limit_config["open_seconds"]
+        self.probe_started_at = None
+        self.changed = asyncio.Condition()
+        self.stats = {"requests": 0, "failures": 0, "opened": 0, "delayed_seconds": 0.0}
+
+    def refill(self, bucket=PAGE_BUCKET):
+        """补充令牌并返回当前令牌数；桶第一次使用时是满的"""
+        rate, burst = bucket_limits(self.config, bucket)
+        now = time.monotonic()
+        tokens, refilled_at = self.buckets.get(bucket, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - refilled_at) * rate)
+        self.buckets[bucket] = (tokens, now)
+        return tokens
+
+    async def wait_until_available(self):
+        """熔断打开时等待到可以探测为止；返回等待的秒数"""
+        started = time.monotonic()
+        async with self.changed:
+            while True:
+                now = time.monotonic()
+                if self.state == CIRCUIT_CLOSED:
+                    break
+                if self.state == CIRCUIT_OPEN:
+                    if now >= self.open_until:
+                        self.state = CIRCUIT_HALF_OPEN
+                        self.probe_started_at = None
+                        continue
+                    await self.wait_changed(self.open_until - now)
+                    continue
+                # 半开状态：只放行一个探测请求，其余请求等待探测结果
+                if (
+                    self.probe_started_at is None
+                    or now - self.probe_started_at > self.config["probe_timeout_seconds"]
+                ):
+                    self.probe_started_at = now
+                    print(f"[{self.host}] 熔断半开，发送探测请求...")
+                    break
+                await self.wait_changed(self.config["probe_timeout_seconds"])
+        waited = time.monotonic() - started
+        self.stats["delayed_seconds"] += waited
+        return waited
+
+    async def wait_while_open(self):
+        """检查开始前调用：熔断打开期间延后整个检查，但不占用半开探测名额"""
+        started = time.monotonic()
+        async with self.changed:
+            while self.state == CIRCUIT_OPEN and time.monotonic() < self.open_until:
+                await self.wait_changed(self.open_until - time.monotonic())
+        return time.monotonic() - started
+
+    async def wait_changed(self, timeout):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout=max(0.01, timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def acquire(self, bucket=PAGE_BUCKET):
+        await self.wait_until_available()
+        while True:
+            tokens = self.refill(bucket)
+            if tokens >= 1:
+                self.buckets[bucket] = (tokens - 1, self.buckets[bucket][1])
+                self.stats["requests"] += 1
+                return
+            rate, _ = bucket_limits(self.config, bucket)
+            await asyncio.sleep((1 - tokens) / rate)
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != CIRCUIT_CLOSED:
+            print(f"[{self.host}] 探测成功，熔断关闭。")
+            self.state = CIRCUIT_CLOSED
+            self.open_seconds = self.config["open_seconds"]
+            self.probe_started_at = None
+            asyncio.ensure_future(self.notify())
+
+    def record_failure(self, reason=""):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN:
+            # 探测失败：重新打开并指数退避
+            self.open_seconds = min(self.open_seconds * 2, self.config["max_open_seconds"])
+            self.trip(reason)
+        elif (
+            self.state == CIRCUIT_CLOSED
+            and self.consecutive_failures >= self.config["failure_threshold"]
+        ):
+            self.trip(reason)
+
+    def trip(self, reason):
+        self.state = CIRCUIT_OPEN
+        self.open_until = time.monotonic() + self.open_seconds
+        self.probe_started_at = None
+        self.stats["opened"] += 1
+        print(
+            f"[{self.host}] 连续失败 {self.consecutive_failures} 次（{reason}），"
+            f"熔断 {self.open_seconds:.0f} 秒，期间的请求与检查将延后。"
+        )
+        asyncio.ensure_future(self.notify())
+
+    def record_status(self, status):
+        if status >= 500:
+            self.record_failure(f"HTTP {status}")
+        else:
+            self.record_success()
+
+
+# 熔断器里的 asyncio.Condition 绑定在创建它的事件循环上，每个循环一组
+_HOST_GUARDS = weakref.WeakKeyDictionary()
+_WATCHED_CONTEXTS = weakref.WeakKeyDictionary()
+
+
+def host_guards():
+    loop = asyncio.get_running_loop()
+    guards = _HOST_GUARDS.get(loop)
+    if guards is None:
+        guards = _HOST_GUARDS[loop] = {}
+    return guards
+
+
+def get_host_guard(host, rate_limit_config):
+    guards = host_guards()
+    guard = guards.get(host)
+    if guard is None:
+        guard = HostGuard(host, rate_limit_config)
+        guards[host] = guard
+    else:
+        guard.config = rate_limit_config
+    return guard
+
+
+def guard_for_url(url, rate_limit_config):
+    if not rate_limit_config["enabled"] or not url:
+        return None
+    host = urlsplit(url).netloc
+    return get_host_guard(host, rate_limit_config) if host else None
+
+
+async def throttle(url, rate_limit_config, bucket=PAGE_BUCKET):
+    """在导航或会触发 XHR 的页面操作之前调用，按目标主机取得一个令牌"""
+    guard = guard_for_url(url, rate_limit_config)
+    if guard is not None:
+        await guard.acquire(bucket)
+    return guard
+
+
+def install_breaker_listeners(context, rate_limit_config, urls):
+    """只监听 response / requestfailed 事件为熔断计数，不拦截请求，浏览器 HTTP 缓存照常生效
+
+    每次检查都会调用：监听器只安装一次，但受监视的主机与配置每次都会更新，热更新后的新 URL 同样计入熔断。
+    """
+    hosts = {urlsplit(url).netloc for url in urls if url}
+    hosts.discard("")
+    watched = _WATCHED_CONTEXTS.get(context)
+    if watched is not None:
+        watched["hosts"].update(hosts)
+        watched["config"] = rate_limit_config
+        return
+    if not rate_limit_config["enabled"] or not hosts:
+        return
+    watched = _WATCHED_CONTEXTS[context] = {"hosts": hosts, "config": rate_limit_config}
+
+    def guarded(request):
+        host = urlsplit(request.url).netloc
+        if (
+            watched["config"]["enabled"]
+            and host in watched["hosts"]
+            and request.resource_type in GUARDED_RESOURCE_TYPES
+        ):
+            return get_host_guard(host, watched["config"])
+        return None
+
+    def on_response(response):
+        guard = guarded(response.request)
+        if guard is not None:
+            guard.record_status(response.status)
+
+    def on_request_failed(request):
+        guard = guarded(request)
+        failure = request.failure or ""
+        if guard is not None and any(marker in failure for marker in FAILURE_MARKERS):
+            guard.record_failure(failure)
+
+    context.on("response", on_response)
+    context.on("requestfailed", on_request_failed)
+
+
+def rate_limit_summary():
+    return {host: dict(guard.stats, state=guard.state) for host, guard in host_guards().items()}
@@ -0,0 +1,305 @@
+"""录制真实检查的 HAR（脱敏后保存），并离线回放完整的登录 → CAS → 成绩 → 详情流程"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from playwright.async_api import async_playwright
+
+import spider
+from mock_portal import MockPortal
+
+REDACTED = "REDACTED"
+USERNAME_PLACEHOLDER = "__USERNAME__"
+PASSWORD_PLACEHOLDER = "__PASSWORD__"
+SENSITIVE_HEADERS = ("cookie", "set-cookie", "authorization", "proxy-authorization")
+TEXT_MIME_MARKERS = ("text/", "json", "javascript", "xml", "x-www-form-urlencoded")
+
+
+def ocr_sidecar_path(har_path):
+    return f"{har_path}.ocr.json"
+
+
+@contextmanager
+def working_directory(path):
+    """在临时目录中运行检查，避免覆盖真实的 seen_courses.json 与截图"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+def build_replacements(secrets):
+    login = secrets.get("login", {})
+    email = secrets.get("email", {})
+    pairs = [
+        (login.get("password", ""), PASSWORD_PLACEHOLDER),
+        (login.get("username", ""), USERNAME_PLACEHOLDER),
+        (email.get("sender_password", ""), REDACTED),
+        (email.get("sender_email", ""), REDACTED),
+        (email.get("receiver_email", ""), REDACTED),
+        (secrets.get("ocr", {}).get("api_key", ""), REDACTED),
+    ]
+    # 长字符串优先替换，避免短值先命中长值的一部分
+    return sorted(
+        [(value, placeholder) for value, placeholder in pairs if value and len(value) >= 3],
+        key=lambda pair: len(pair[0]),
+        reverse=True,
+    )
+
+
+def redact_text(text, replacements):
+    if not text:
+        return text
+    for value, placeholder in replacements:
+        text = text.replace(value, placeholder)
+    return text
+
+
+def redact_headers(headers, replacements):
+    for header in headers:
+        if header.get("name", "").lower() in SENSITIVE_HEADERS:
+            header["value"] = REDACTED
+        else:
+            header["value"] = redact_text(header.get("value", ""), replacements)
+
+
+def redact_content(content, replacements):
+    text = content.get("text")
+    if not text:
+        return
+    mime = content.get("mimeType", "")
+    if not any(marker in mime for marker in TEXT_MIME_MARKERS):
+        return
+    if content.get("encoding") == "base64":
+        try:
+            decoded = base64.b64decode(text).decode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            return
+        content["text"] = base64.b64encode(
+            redact_text(decoded, replacements).encode("utf-8")
+        ).decode("ascii")
+        content.pop("size", None)
+    else:
+        content["text"] = redact_text(text, replacements)
+
+
+def redact_har(har, secrets):
+    """抹去账号、密码、邮箱、cookie 与鉴权头；账号密码替换为回放时使用的占位符"""
+    replacements = build_replacements(secrets)
+    for entry in har.get("log", {}).get("entries", []):
+        request = entry.get("request", {})
+        response = entry.get("response", {})
+        request["url"] = redact_text(request.get("url", ""), replacements)
+        redact_headers(request.get("headers", []), replacements)
+        redact_headers(response.get("headers", []), replacements)
+        for item in request.get("queryString", []):
+            item["value"] = redact_text(item.get("value", ""), replacements)
+        for cookie in request.get("cookies", []) + response.get("cookies", []):
+            cookie["value"] = REDACTED
+        post_data = request.get("postData")
+        if post_data:
+            post_data["text"] = redact_text(post_data.get("text", ""), replacements)
+            for param in post_data.get("params", []):
+                param["value"] = redact_text(param.get("value", ""), replacements)
+        if response.get("redirectURL"):
+            response["redirectURL"] = redact_text(response["redirectURL"], replacements)
+        redact_content(response.get("content", {}), replacements)
+    return har
+
+
+def replay_secrets():
+    return {
+        "login": {"username": USERNAME_PLACEHOLDER, "password": PASSWORD_PLACEHOLDER},
+        "ocr": {"api_key": "replay"},
+    }
+
+
+def prepare_check_config(config, rate_limit=False):
+    """回放/录制期间关闭会话预检、桌面弹窗与结果复用，保证每一轮都真实执行且不阻塞
+
+    回放时所有请求都落在同一主机上，限流会把耗时变成令牌桶的速率，默认关闭；录制真实检查时保留限流。
+    """
+    prepared = json.loads(json.dumps(config))
+    if not rate_limit:
+        prepared["rate_limit"] = dict(prepared.get("rate_limit", {}), enabled=False)
+    prepared["session_probe"] = dict(prepared.get("session_probe", {}), enabled=False)
+    prepared["desktop_notification"] = False
+    prepared["single_flight"] = dict(prepared.get("single_flight", {}), result_ttl_seconds=0)
+    # 录制按单张识别记录 OCR 结果，回放时也必须逐张请求
+    prepared["ocr"] = dict(prepared.get("ocr", {}), batch={"enabled": False})
+    return prepared
+
+
+async def record(args):
+    config = spider.load_config()
+    secrets = spider.merge_secrets(spider.load_user_secrets(), {})
+    har_path = os.path.abspath(args.har)
+    os.makedirs(os.path.dirname(har_path), exist_ok=True)
+    raw_path = f"{har_path}.raw"
+    check_config = prepare_check_config(config, rate_limit=True)
+    check_secrets = dict(secrets, email={})
+
+    recorded_ocr = []
+    original_request_ocr_text = spider.request_ocr_text
+
+    def recording_request_ocr_text(ocr_config, image_base64):
+        text = original_request_ocr_text(ocr_config, image_base64)
+        recorded_ocr.append(text)
+        return text
+
+    spider.request_ocr_text = recording_request_ocr_text
+    try:
+        with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=False, channel=args.channel)
+                context = await browser.new_context(
+                    record_har_path=raw_path, record_har_content="embed"
+                )
+                await spider.check_grades(context, {}, check_config, check_secrets)
+                await context.close()
+                await browser.close()
+    finally:
+        spider.request_ocr_text = original_request_ocr_text
+
+    har = spider.load_json_file(raw_path, {})
+    os.remove(raw_path)
+    spider.save_json_file(har_path, redact_har(har, secrets))
+    spider.save_json_file(ocr_sidecar_path(har_path), recorded_ocr)
+    print(f"已保存脱敏 HAR: {har_path}（{len(har.get('log', {}).get('entries', []))} 条请求）")
+
+
+def index_har_entries(har_path):
+    """按方法与 URL（以及忽略查询参数的路径）索引 HAR 条目，作为严格匹配失败后的兜底"""
+    har = spider.load_json_file(har_path, {})
+    exact = {}
+    by_path = {}
+    for entry in har.get("log", {}).get("entries", []):
+        request = entry.get("request", {})
+        method = request.get("method", "GET")
+        url = request.get("url", "")
+        parts = urlsplit(url)
+        exact.setdefault((method, url), []).append(entry)
+        by_path.setdefault((method, parts.scheme, parts.netloc, parts.path), []).append(entry)
+    return exact, by_path
+
+
+def entry_body(entry):
+    content = entry.get("response", {}).get("content", {})
+    text = content.get("text", "")
+    if content.get("encoding") == "base64":
+        return base64.b64decode(text)
+    return text.encode("utf-8")
+
+
+async def install_replay_routes(context, har_path, latency):
+    exact, by_path = index_har_entries(har_path)
+    served = {}
+
+    async def lenient_handler(route):
+        request = route.request
+        parts = urlsplit(request.url)
+        key = (request.method, request.url)
+        candidates = exact.get(key)
+        if not candidates:
+            key = (request.method, parts.scheme, parts.netloc, parts.path)
+            candidates = by_path.get(key)
+        if not candidates:
+            await route.abort()
+            return
+        index = served.get(key, 0)
+        served[key] = index + 1
+        entry = candidates[min(index, len(candidates) - 1)]
+        response = entry.get("response", {})
+        headers = {
+            header["name"]: header["value"]
+            for header in response.get("headers", [])
+            if header.get("name", "").lower() not in ("content-length", "content-encoding")
+        }
+        await route.fulfill(
+            status=response.get("status", 200), headers=headers, body=entry_body(entry)
+        )
+
+    async def latency_handler(route):
+        await asyncio.sleep(latency)
+        await route.fallback()
+
+    # 路由按注册的逆序执行：延迟注入 → Playwright HAR 严格匹配 → 宽松兜底 → 中止
+    await context.route("**/*", lenient_handler)
+    await context.route_from_har(har_path, not_found="fallback")
+    if latency > 0:
+        await context.route("**/*", latency_handler)
+
+
+async def replay(args):
+    config = spider.load_config()
+    har_path = os.path.abspath(args.har)
+    ocr_texts = spider.load_json_file(ocr_sidecar_path(har_path), [])
+    ocr_server = MockPortal(ocr_responses=ocr_texts).start()
+    check_config = prepare_check_config(config, rate_limit=args.rate_limit)
+    check_config["ocr"] = dict(
+        check_config.get("ocr", {}), base_url=ocr_server.base_url, model="replay"
+    )
+    results = {}
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=not args.headed)
+            for latency in args.latency:
+                samples = []
+                for _ in range(args.rounds):
+                    ocr_server.ocr_calls = 0
+                    context = await browser.new_context()
+                    await install_replay_routes(context, har_path, latency)
+                    with tempfile.TemporaryDirectory() as workdir, working_directory(workdir):
+                        started = time.perf_counter()
+                        await spider.check_grades(context, {}, check_config, replay_secrets())
+                        samples.append(time.perf_counter() - started)
+                    await context.close()
+                results[str(latency)] = {
+                    "rounds": len(samples),
+                    "mean": statistics.mean(samples),
+                    "p50": statistics.median(samples),
+                    "max": max(samples),
+                }
+            await browser.close()
+    finally:
+        ocr_server.stop()
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HAR 录制与离线回放")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="录制一次真实检查并脱敏保存 HAR")
+    record_parser.add_argument("--har", default="recordings/check.har")
+    record_parser.add_argument("--channel", default="msedge")
+
+    replay_parser = subparsers.add_parser("replay", help="离线回放 HAR 并测量检查耗时")
+    replay_parser.add_argument("--har", default="recordings/check.har")
+    replay_parser.add_argument("--rounds", type=int, default=3)
+    replay_parser.add_argument(
+        "--latency", type=float, nargs="+", default=[0.0], help="每个请求注入的延迟（秒），可给多个值"
+    )
+    replay_parser.add_argument("--headed", action="store_true")
+    replay_parser.add_argument("--rate-limit", action="store_true", help="回放时保留 config.json 中的限流设置")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        asyncio.run(record(args))
+    else:
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""进程内存与子进程统计：优先使用 psutil，缺失时在 Linux 上读取 /proc"""
+
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def read_status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def process_rss_bytes(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    return read_status_kb(pid, "VmRSS") * 1024
+
+
+def descendant_pids(pid):
+    """返回 pid 的全部后代进程（Playwright 驱动与浏览器进程都在其中）"""
+    if psutil is not None:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    if not os.path.isdir("/proc"):
+        return []
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "r", encoding="utf-8") as file:
+                # comm 字段可能包含空格，从最后一个右括号之后解析
+                fields = file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+    result = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def process_tree_stats(pid=None):
+    """统计当前 Python 进程与其子进程（浏览器）的常驻内存与子进程数量"""
+    pid = pid or os.getpid()
+    children = descendant_pids(pid)
+    return {
+        "python_rss": process_rss_bytes(pid),
+        "browser_rss": sum(process_rss_bytes(child) for child in children),
+        "browser_processes": len(children),
+    }
+
+
+def process_start_time(pid=None):
+    """返回进程启动时的 Unix 时间戳，无法获取时返回 None"""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).create_time()
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as file:
+            # starttime 是第 22 个字段，单位为系统启动以来的时钟滴答
+            start_ticks = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat", "r", encoding="utf-8") as file:
+            boot_time = next(int(line.split()[1]) for line in file if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return None
+
+
+def format_mb(value):
+    return f"{value / 1024 / 1024:.1f}MB"
+
+
+def merged_limit(resources, keys, default):
+    """多个旧配置项表示同一个水位时取最严格的正值；都为 0 表示关闭，都未配置时用默认值"""
+    values = [float(resources[key]) for key in keys if key in resources]
+    if not values:
+        return default
+    positive = [value for value in values if value > 0]
+    return min(positive) if positive else 0
+
+
+def build_resource_config(config):
+    resources = config.get("resources", {})
+    # 持久化上下文与浏览器进程一一对应，重启上下文就是重启浏览器；
+    # 旧版本分开的 context/browser 水位效果相同，合并为一组，取较严格的一个
+    return {
+        "enabled": bool(resources.get("enabled", True)),
+        "max_pages": max(1, int(resources.get("max_pages", 3))),
+        "page_rss_mb": float(resources.get("page_rss_mb", 500)),
+        "max_checks_per_browser": max(
+            0,
+            int(merged_limit(resources, ("max_checks_per_browser", "max_checks_per_context"), 200)),
+        ),
+        "browser_rss_mb": merged_limit(resources, ("browser_rss_mb", "context_rss_mb"), 800),
+        "python_rss_mb": float(resources.get("python_rss_mb", 500)),
+    }
+
+
+RECYCLE_NONE = ""
+RECYCLE_PAGE = "page"
+RECYCLE_BROWSER = "browser"
+
+
+class ResourceGovernor:
+    """每次检查后采样内存，超过检查次数或内存水位时给出回收级别，并报告每次检查的内存增长
+
+    - page：检查结束后仍打开的页面超过 max_pages，或浏览器内存超过 page_rss_mb 且有工作页以外的页面时，
+      关闭工作页（第一个页面）以外的遗留页面；
+    - browser：检查次数或浏览器内存达到水位时保存会话并重启浏览器；
+    - Python 进程超过 python_rss_mb 时先执行一次完整垃圾回收，仍超过才警告（浏览器回收无法释放 Python 内存）。
+    """
+
+    def __init__(self, resource_config):
+        self.config = resource_config
+        self.checks = 0
+        self.checks_since_browser = 0
+        self.baseline = None
+        self.previous = None
+
+    def check_python_memory(self, python_rss):
+        limit = self.config["python_rss_mb"] * 1024 * 1024
+        if not limit or python_rss <= limit:
+            return
+        import gc
+
+        collected = gc.collect()
+        after = process_rss_bytes(os.getpid())
+        print(
+            f"Python 进程内存 {format_mb(python_rss)} 超过 {self.config['python_rss_mb']}MB，"
+            f"已执行垃圾回收（回收 {collected} 个对象，现为 {format_mb(after)}）。"
+        )
+        if after > limit:
+            print("警告: 垃圾回收后 Python 进程内存仍超过水位，可能存在泄漏。")
+
+    def evaluate(self, open_pages=0):
+        if not self.config["enabled"]:
+            return RECYCLE_NONE
+        stats = process_tree_stats()
+        self.checks += 1
+        self.checks_since_browser += 1
+        if self.baseline is None:
+            self.baseline = stats
+        previous = self.previous or stats
+        self.previous = stats
+
+        delta = stats["browser_rss"] - previous["browser_rss"]
+        per_check = (stats["browser_rss"] - self.baseline["browser_rss"]) / max(
+            1, self.checks_since_browser
+        )
+        print(
+            f"内存: Python {format_mb(stats['python_rss'])}，"
+            f"浏览器 {format_mb(stats['browser_rss'])}（本次 {delta / 1024 / 1024:+.1f}MB，"
+            f"回收后平均每次 {per_check / 1024 / 1024:+.2f}MB），"
+            f"浏览器进程 {stats['browser_processes']} 个，页面 {open_pages} 个"
+        )
+        self.check_python_memory(stats["python_rss"])
+
+        browser_rss_mb = self.config["browser_rss_mb"]
+        max_browser_checks = self.config["max_checks_per_browser"]
+        if (browser_rss_mb and stats["browser_rss"] > browser_rss_mb * 1024 * 1024) or (
+            max_browser_checks and self.checks_since_browser >= max_browser_checks
+        ):
+            return RECYCLE_BROWSER
+        # 第一个页面是持久化上下文自带的工作页，不计入遗留页面
+        if open_pages > self.config["max_pages"] or (
+            open_pages > 1
+            and self.config["page_rss_mb"]
+            and stats["browser_rss"] > self.config["page_rss_mb"] * 1024 * 1024
+        ):
+            return RECYCLE_PAGE
+        return RECYCLE_NONE
+
+    def mark_recycled(self, level):
+        if level == RECYCLE_BROWSER:
+            self.checks_since_browser = 0
+            self.baseline = None
+            self.previous = None
@@ -0,0 +1,160 @@
+"""把配置中的选择器一次性编译为不可变的选择器计划，并缓存登录表单所在的 frame"""
+
+import weakref
+from types import MappingProxyType
+
+GRADES_SECTION = "xpath"
+LOGIN_SECTION = "login"
+# 这些键历史上总是按 XPath 解析，即使没有以 / 开头
+XPATH_ONLY_KEYS = frozenset({"search_button"})
+ENGINE_PREFIXES = ("xpath=", "css=", "text=", "id=", "internal:")
+# 任一可见即认为登录表单存在
+LOGIN_PROBE_KEYS = ("switch_to_password", "username_input", "password_input", "switch_account_btn")
+DEFAULT_GRADES_SELECTORS = {"course_row": "tr"}
+
+
+def normalize_locator(selector, xpath=False):
+    """补全 xpath= 前缀：以 / 或 (/ 开头，或该键只接受 XPath 时按 XPath 解析"""
+    selector = selector.strip()
+    if not selector or selector.startswith(ENGINE_PREFIXES):
+        return selector
+    if xpath or selector.startswith(("/", "(/")):
+        return f"xpath={selector}"
+    return selector
+
+
+def compile_section(config, section, defaults=None):
+    values = config.get(section, {})
+    if not isinstance(values, dict):
+        raise ValueError(f"{section} 必须是对象")
+    compiled = dict(defaults or {})
+    for key, value in values.items():
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f"{section}.{key} 必须是字符串")
+        if value.strip():
+            compiled[key] = normalize_locator(value, xpath=key in XPATH_ONLY_KEYS)
+    return MappingProxyType(compiled)
+
+
+class SelectorPlan:
+    """已校验、已补全引擎前缀的选择器；创建后不可修改，可在多个账号与检查之间共享"""
+
+    __slots__ = ("grades", "login", "login_probe", "success_probe")
+
+    def __init__(self, config):
+        grades = compile_section(config, GRADES_SECTION, DEFAULT_GRADES_SELECTORS)
+        login = compile_section(config, LOGIN_SECTION)
+        object.__setattr__(self, "grades", grades)
+        object.__setattr__(self, "login", login)
+        object.__setattr__(
+            self, "login_probe", tuple(login[key] for key in LOGIN_PROBE_KEYS if key in login)
+        )
+        object.__setattr__(
+            self,
+            "success_probe",
+            tuple(grades[key] for key in ("search_button", "course_name_cell") if key in grades),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SelectorPlan 不可修改")
+
+    def grade(self, key, fallback=""):
+        return self.grades.get(key) or normalize_locator(fallback)
+
+    def login_selector(self, key, fallback=""):
+        return self.login.get(key) or normalize_locator(fallback)
+
+
+_PLAN_CACHE = {}
+_PLAN_CACHE_LIMIT = 8
+
+
+def get_selector_plan(config):
+    """按配置对象缓存编译结果；热更新替换配置对象后自动重新编译"""
+    cached = _PLAN_CACHE.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    plan = SelectorPlan(config)
+    if len(_PLAN_CACHE) >= _PLAN_CACHE_LIMIT:
+        _PLAN_CACHE.clear()
+    _PLAN_CACHE[id(config)] = (config, plan)
+    return plan
+
+
+def combined_locator(frame, selectors):
+    """把多个选择器合并为一个 locator，一次往返即可判断其中任一是否可见
+
+    先按可见性过滤再取 first：否则 first 是文档顺序中的第一个匹配元素，排在前面的隐藏按钮会掩盖后面可见的输入框。
+    """
+    locator = None
+    for selector in selectors:
+        current = frame.locator(selector)
+        locator = current if locator is None else locator.or_(current)
+    return locator.filter(visible=True).first if locator is not None else None
+
+
+class LoginFrameCache:
+    """记住上次找到登录表单的 frame；任何 frame 导航或卸载后失效"""
+
+    def __init__(self, page):
+        self.plan = None
+        self.frame = None
+        self.locator = None
+        self.stats = {"hits": 0, "scans": 0, "invalidations": 0}
+        page.on("framenavigated", self.invalidate)
+        page.on("framedetached", self.invalidate)
+
+    def invalidate(self, frame=None):
+        if self.frame is not None:
+            self.stats["invalidations"] += 1
+        self.frame = None
+        self.locator = None
+
+    def remember(self, plan, frame, locator):
+        self.plan = plan
+        self.frame = frame
+        self.locator = locator
+
+
+_LOGIN_FRAME_CACHES = weakref.WeakKeyDictionary()
+
+
+def get_login_frame_cache(page):
+    cache = _LOGIN_FRAME_CACHES.get(page)
+    if cache is None:
+        cache = LoginFrameCache(page)
+        _LOGIN_FRAME_CACHES[page] = cache
+    return cache
+
+
+async def is_probe_visible(locator):
+    try:
+        return await locator.is_visible()
+    except Exception:
+        return False
+
+
+async def find_login_frame(page, plan):
+    """返回承载登录表单的 page 或 frame，找不到时返回 None
+
+    命中缓存时只对缓存的 frame 做一次探测；未命中时每个 frame 各探测一次（所有登录选择器合并为一个 locator）。
+    """
+    if not plan.login_probe:
+        return None
+    cache = get_login_frame_cache(page)
+    if cache.frame is not None and cache.plan is plan:
+        cache.stats["hits"] += 1
+        # frame 未导航也未卸载时，表单只可能在原 frame 中出现或消失
+        if await is_probe_visible(cache.locator):
+            return page if cache.frame is page.main_frame else cache.frame
+        return None
+
+    cache.stats["scans"] += 1
+    for frame in [page.main_frame] + [frame for frame in page.frames if frame != page.main_frame]:
+        locator = combined_locator(frame, plan.login_probe)
+        if await is_probe_visible(locator):
+            cache.remember(plan, frame, locator)
+            return page if frame is page.main_frame else frame
+    return None
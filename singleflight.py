@@ -0,0 +1,95 @@
+"""按键合并并发调用：同一键已有调用在进行时等待并共享其结果，成功结果可在短时间内直接复用"""
+
+import asyncio
+import itertools
+import time
+import weakref
+
+
+def build_single_flight_config(config):
+    single_flight = config.get("single_flight", {})
+    return {
+        "enabled": bool(single_flight.get("enabled", True)),
+        "result_ttl_seconds": max(0.0, float(single_flight.get("result_ttl_seconds", 15))),
+    }
+
+
+class SingleFlight:
+    """同一事件循环内按键去重的调用组"""
+
+    def __init__(self):
+        self.inflight = {}
+        self.results = {}
+        self.stats = {"calls": 0, "executed": 0, "shared": 0, "cached": 0}
+
+    async def do(self, key, factory, ttl=0.0, cacheable=None):
+        """执行 factory() 并返回 (结果, 来源)，来源为 "executed"、"shared" 或 "cached"
+
+        cacheable(result) 为假的结果（例如失败的检查）不会被缓存，下一次调用会重新执行。
+        等待方被取消时不会取消正在进行的调用。
+        """
+        self.stats["calls"] += 1
+        self.purge_expired()
+        cached = self.results.get(key)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached[1], "cached"
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats["shared"] += 1
+            return await asyncio.shield(task), "shared"
+
+        self.stats["executed"] += 1
+        task = asyncio.ensure_future(factory())
+        self.inflight[key] = task
+
+        def finished(done):
+            if self.inflight.get(key) is done:
+                del self.inflight[key]
+            if ttl > 0 and not done.cancelled() and done.exception() is None:
+                result = done.result()
+                if cacheable is None or cacheable(result):
+                    self.results[key] = (time.monotonic() + ttl, result)
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task), "executed"
+
+    def purge_expired(self):
+        """丢弃所有过期结果，避免已关闭的浏览器上下文等不再出现的键一直留在缓存中"""
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self.results.items() if now >= expires_at]:
+            del self.results[key]
+
+    def forget(self, key):
+        self.results.pop(key, None)
+
+    def forget_prefix(self, prefix):
+        """丢弃键以 prefix 开头的缓存结果，例如某个账号在所有浏览器上下文中的检查结果"""
+        for key in [key for key in self.results if key[: len(prefix)] == prefix]:
+            del self.results[key]
+
+
+_GROUPS = weakref.WeakKeyDictionary()
+_SCOPE_TOKENS = weakref.WeakKeyDictionary()
+_SCOPE_COUNTER = itertools.count(1)
+
+
+def scope_token(scope):
+    """为对象（例如浏览器上下文）分配进程内唯一的编号，用作键的一部分
+
+    与 id() 不同，对象被回收后编号不会被新对象复用，旧对象的缓存结果不会被误认为新对象的。
+    """
+    token = _SCOPE_TOKENS.get(scope)
+    if token is None:
+        token = _SCOPE_TOKENS[scope] = next(_SCOPE_COUNTER)
+    return token
+
+
+def get_single_flight():
+    loop = asyncio.get_running_loop()
+    group = _GROUPS.get(loop)
+    if group is None:
+        group = SingleFlight()
+        _GROUPS[loop] = group
+    return group
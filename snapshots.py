@@ -0,0 +1,133 @@
+"""紧凑的课程快照：名称与分项在所有账号间驻留共享，每门课程预先计算哈希，可与原 JSON 格式无损互转"""
+
+import json
+import sys
+
+COMPONENT_FIELDS = ("name", "ratio", "score")
+RAW_MARKER = "__raw__"
+
+# 相同的分项元组、分项列表在所有账号之间只保存一份；池子只用于节省内存，
+# 达到上限时整体清空（已有快照仍持有各自的元组），不影响相等比较的正确性
+_COMPONENTS = {}
+_COMPONENT_LISTS = {}
+_POOL_LIMIT = 65536
+
+
+def pooled(pool, key):
+    value = pool.get(key)
+    if value is None:
+        if len(pool) >= _POOL_LIMIT:
+            pool.clear()
+        value = pool[key] = key
+    return value
+
+
+def intern_text(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_component(component):
+    """标准分项 {"name", "ratio", "score"}（均为字符串，键顺序不限）压缩为三元组；
+    其他形式按排序后的键保存为 JSON，与字典比较一样不受键顺序影响"""
+    if (
+        isinstance(component, dict)
+        and len(component) == len(COMPONENT_FIELDS)
+        and all(isinstance(component.get(field), str) for field in COMPONENT_FIELDS)
+    ):
+        key = tuple(sys.intern(component[field]) for field in COMPONENT_FIELDS)
+    else:
+        key = (RAW_MARKER, sys.intern(json.dumps(component, ensure_ascii=False, sort_keys=True)))
+    return pooled(_COMPONENTS, key)
+
+
+def component_to_dict(component):
+    if len(component) == 2:
+        return json.loads(component[1])
+    return dict(zip(COMPONENT_FIELDS, component))
+
+
+def intern_components(components):
+    key = tuple(intern_component(component) for component in components or ())
+    return pooled(_COMPONENT_LISTS, key)
+
+
+class CourseSnapshot:
+    """单门课程的总评与分项；不可修改，相等比较为常数时间"""
+
+    __slots__ = ("total", "components", "extra", "digest")
+
+    def __init__(self, total="", components=(), extra=None):
+        object.__setattr__(self, "total", intern_text(total))
+        object.__setattr__(self, "components", intern_components(components))
+        object.__setattr__(self, "extra", sys.intern(extra) if extra else None)
+        object.__setattr__(self, "digest", hash((self.total, self.components, self.extra)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CourseSnapshot 不可修改")
+
+    def __eq__(self, other):
+        if not isinstance(other, CourseSnapshot):
+            return NotImplemented
+        # 分项元组经过驻留，内容相同时通常是同一对象，元组比较先比身份，只有池子清空后才会逐项比较
+        return (
+            self.digest == other.digest
+            and self.total == other.total
+            and self.components == other.components
+            and self.extra == other.extra
+        )
+
+    def __hash__(self):
+        return self.digest
+
+    def __repr__(self):
+        return f"CourseSnapshot(total={self.total!r}, components={len(self.components)})"
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 seen_courses.json 中的课程记录（或 scrape_courses 的结果）构建"""
+        data = data if isinstance(data, dict) else {}
+        extra = {
+            key: value for key, value in data.items() if key not in ("total", "components")
+        }
+        return cls(
+            data.get("total", ""),
+            data.get("components", []),
+            json.dumps(extra, ensure_ascii=False, sort_keys=True) if extra else None,
+        )
+
+    def to_dict(self):
+        data = {
+            "total": self.total,
+            "components": [component_to_dict(component) for component in self.components],
+        }
+        if self.extra:
+            data.update(json.loads(self.extra))
+        return data
+
+
+def as_snapshot(value):
+    if value is None or isinstance(value, CourseSnapshot):
+        return value
+    return CourseSnapshot.from_dict(value)
+
+
+def snapshots_from_json(data):
+    """兼容旧版的课程名列表与当前的 {课程名: {...}} 格式"""
+    if isinstance(data, list):
+        return {sys.intern(name): CourseSnapshot() for name in data if isinstance(name, str)}
+    if isinstance(data, dict):
+        return {
+            sys.intern(name): CourseSnapshot.from_dict(course) for name, course in data.items()
+        }
+    return {}
+
+
+def snapshots_to_json(courses):
+    return {
+        name: course.to_dict() if isinstance(course, CourseSnapshot) else course
+        for name, course in courses.items()
+    }
+
+
+def pool_stats():
+    return {"components": len(_COMPONENTS), "component_lists": len(_COMPONENT_LISTS)}
@@ -1,22 +1,55 @@
+import time
+
+# 尽早记录，无法获取进程启动时间时以此作为启动耗时的起点
+MODULE_LOADED_AT = time.time()
+
+import argparse
 import asyncio
 import base64
-import ctypes
 import json
 import os
 import re
-import smtplib
+import sys
 import threading
-import urllib.request
-import webbrowser
+from collections import Counter
 from datetime import datetime
-from email.header import Header
-from email.mime.text import MIMEText
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import parse_qs
-
-from playwright.async_api import async_playwright
+from urllib.parse import parse_qs, urlsplit
+
+# Playwright、smtplib、ctypes、urllib.request 与 http.server 只在用到的子命令中导入，
+# 让 cron/systemd 定时执行的单次检查尽快发出第一个请求
+
+from artifacts import (
+    CheckTracer,
+    build_screenshot_config,
+    build_trace_config,
+    capture_screenshot,
+    screenshot_reason,
+)
+from changefeed import build_change_feed_config, get_change_feed, publish_changes, start_feed_server
+from configwatch import ConfigWatcher, build_config_reload_config, validate_config
+from notifier import close_webhook_notifier, notify_webhooks
+from ocrbatch import CAPTCHA_PROMPT, build_ocr_batch_config, get_ocr_batcher
+from propagation import observe_courses
+from snapshots import CourseSnapshot, as_snapshot, snapshots_from_json, snapshots_to_json
+from singleflight import build_single_flight_config, get_single_flight, scope_token
+from selectorplan import find_login_frame, get_selector_plan
+from ratelimit import (
+    DETAIL_BUCKET,
+    build_rate_limit_config,
+    guard_for_url,
+    install_breaker_listeners,
+    throttle,
+)
+from resources import (
+    RECYCLE_BROWSER,
+    RECYCLE_PAGE,
+    ResourceGovernor,
+    build_resource_config,
+    process_start_time,
+)
 
 SEEN_COURSES_FILE = "seen_courses.json"
+GRADE_HISTORY_FILE = "grade_history.jsonl"
 CONFIG_FILE = "config.json"
 SECRETS_FILE = "user_secrets.json"
 INPUT_PORT = 8000
@@ -42,33 +75,111 @@ def save_json_file(path, data):
         print(f"保存文件失败: {path} ({exc})")
 
 
-def load_config():
-    config = load_json_file(CONFIG_FILE, None)
+def load_config(path=CONFIG_FILE):
+    config = load_json_file(path, None)
     if config is None:
-        raise FileNotFoundError(f"未找到配置文件: {CONFIG_FILE}")
+        raise FileNotFoundError(f"未找到配置文件或无法解析: {path}")
+    if not isinstance(config, dict):
+        raise ValueError(f"配置文件必须是 JSON 对象: {path}")
     return config
 
 
-def load_seen_courses():
-    data = load_json_file(SEEN_COURSES_FILE, {})
-    if isinstance(data, list):
-        return {name: {"total": "", "components": []} for name in data}
-    if isinstance(data, dict):
-        return data
-    return {}
+def load_seen_courses(path=SEEN_COURSES_FILE):
+    return snapshots_from_json(load_json_file(path, {}))
+
 
+def save_seen_courses(courses, path=SEEN_COURSES_FILE):
+    save_json_file(path, snapshots_to_json(courses))
 
-def save_seen_courses(courses):
-    save_json_file(SEEN_COURSES_FILE, courses)
+
+def append_grade_history(courses, account, path=GRADE_HISTORY_FILE):
+    """把本次检测到变化的课程快照逐行追加到历史文件，供导出与统计分析使用"""
+    if not path or not courses:
+        return
+    timestamp = int(time.time())
+    try:
+        with open(path, "a", encoding="utf-8") as file:
+            for course in courses:
+                record = {
+                    "timestamp": timestamp,
+                    "account": account,
+                    "course": course["name"],
+                    "total": course.get("total", ""),
+                    "components": course.get("components", []),
+                }
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as exc:
+        print(f"写入成绩历史失败: {path} ({exc})")
 
 
-def load_user_secrets():
-    data = load_json_file(SECRETS_FILE, {})
+def load_user_secrets(path=SECRETS_FILE):
+    data = load_json_file(path, {})
     return data if isinstance(data, dict) else {}
 
 
-def save_user_secrets(secrets):
-    save_json_file(SECRETS_FILE, secrets)
+def save_user_secrets(secrets, path=SECRETS_FILE):
+    save_json_file(path, secrets)
+
+
+ENV_PREFIX = "GRADE_MONITOR_"
+# 环境变量名 -> secrets 中的位置
+ENV_SECRET_FIELDS = {
+    "LOGIN_URL": ("login_url",),
+    "GRADES_URL": ("grades_url",),
+    "USERNAME": ("login", "username"),
+    "PASSWORD": ("login", "password"),
+    "SENDER_EMAIL": ("email", "sender_email"),
+    "SENDER_PASSWORD": ("email", "sender_password"),
+    "RECEIVER_EMAIL": ("email", "receiver_email"),
+    "OCR_BASE_URL": ("ocr", "base_url"),
+    "OCR_MODEL": ("ocr", "model"),
+    "OCR_API_KEY": ("ocr", "api_key"),
+}
+# 环境变量名 -> (config 键, 类型)
+ENV_CONFIG_FIELDS = {
+    "CHECK_INTERVAL_SECONDS": ("check_interval_seconds", int),
+    "USER_DATA_DIR": ("user_data_dir", str),
+    "HEADLESS": ("headless", lambda value: value.strip().lower() in ("1", "true", "yes", "on")),
+    "MANUAL_LOGIN_TIMEOUT_SECONDS": ("manual_login_timeout_seconds", float),
+}
+
+
+def secrets_from_env(environ=None):
+    environ = os.environ if environ is None else environ
+    secrets = {}
+    for name, path in ENV_SECRET_FIELDS.items():
+        value = environ.get(f"{ENV_PREFIX}{name}", "").strip()
+        if not value:
+            continue
+        if len(path) == 1:
+            secrets[path[0]] = value
+        else:
+            secrets.setdefault(path[0], {})[path[1]] = value
+    return secrets
+
+
+def apply_env_config(config, environ=None):
+    environ = os.environ if environ is None else environ
+    for name, (key, cast) in ENV_CONFIG_FIELDS.items():
+        value = environ.get(f"{ENV_PREFIX}{name}")
+        if value is None or value.strip() == "":
+            continue
+        try:
+            config[key] = cast(value)
+        except ValueError:
+            print(f"忽略无效的环境变量 {ENV_PREFIX}{name}={value}")
+    return config
+
+
+def missing_required_secrets(config, secrets):
+    """非交互运行前检查必需项；缺少登录账号时仍可手动登录，因此只要求 URL"""
+    login_url, grades_url = get_runtime_urls(config, secrets)
+    missing = []
+    if not login_url:
+        missing.append("login_url")
+    if not grades_url:
+        missing.append("grades_url")
+    return missing
 
 
 def pick_value(*values):
@@ -167,6 +278,9 @@ def collect_runtime_secrets(config, stored_secrets):
         },
     }
 
+    import webbrowser
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
     result = {}
     event = threading.Event()
 
@@ -232,14 +346,10 @@ def collect_runtime_secrets(config, stored_secrets):
 
 def merge_secrets(base, updates):
     merged = json.loads(json.dumps(base or {}))
-    for key in (
-        "url",
-        "login_url",
-        "grades_url",
-        "login",
-        "email",
-        "ocr",
-    ):
+    for key in ("url", "login_url", "grades_url"):
+        if not isinstance(merged.get(key), str):
+            merged[key] = ""
+    for key in ("login", "email", "ocr"):
         if key not in merged:
             merged[key] = {}
     if updates.get("url"):
@@ -277,6 +387,7 @@ def build_ocr_config(config, secrets):
         "api_key": pick_value(secrets_ocr.get("api_key")),
         "timeout_seconds": config_ocr.get("timeout_seconds", 30),
         "max_retries": config_ocr.get("max_retries", 3),
+        "batch": build_ocr_batch_config(config),
     }
 
 
@@ -298,23 +409,29 @@ def is_ocr_configured(ocr_config):
 
 
 def request_ocr_text(ocr_config, image_base64):
+    return request_ocr_completion(ocr_config, CAPTCHA_PROMPT, [image_base64])
+
+
+def request_ocr_completion(ocr_config, prompt, images_base64):
+    import urllib.request
+
     if not is_ocr_configured(ocr_config):
         return ""
     endpoint = build_openai_endpoint(ocr_config["base_url"])
     if not endpoint:
         return ""
-    prompt = "请识别图片中的算式，只输出算式，例如 12+8，不要输出其他文字。"
     payload = {
         "model": ocr_config["model"],
         "messages": [
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
+                "content": [{"type": "text", "text": prompt}]
+                + [
                     {
                         "type": "image_url",
                         "image_url": {"url": f"data:image/png;base64,{image_base64}"},
-                    },
+                    }
+                    for image_base64 in images_base64
                 ],
             }
         ],
@@ -391,9 +508,33 @@ def solve_math_from_text(text):
 
 
 async def call_ocr_text(ocr_config, image_base64):
+    if ocr_config.get("batch", {}).get("enabled"):
+        # 大量账号同时重新登录时，相近时间到达的验证码合并为一次请求
+        return await get_ocr_batcher(request_ocr_completion).recognize(ocr_config, image_base64)
     return await asyncio.to_thread(request_ocr_text, ocr_config, image_base64)
 
 
+async def wait_for_captcha_loaded(container, image_selector, fallback_selector, timeout=5000):
+    """等待验证码图片真正加载完成（complete 且有尺寸）"""
+    selectors = [selector for selector in (image_selector, fallback_selector) if selector]
+    if not selectors:
+        return False
+    locator = container.locator(selectors[0])
+    for selector in selectors[1:]:
+        locator = locator.or_(container.locator(selector))
+    try:
+        await locator.first.wait_for(state="visible", timeout=timeout)
+        handle = await locator.first.element_handle(timeout=timeout)
+        await container.wait_for_function(
+            "img => !(img instanceof HTMLImageElement) || (img.complete && img.naturalWidth > 0)",
+            arg=handle,
+            timeout=timeout,
+        )
+        return True
+    except Exception:
+        return False
+
+
 async def extract_captcha_base64(container, image_selector, fallback_selector):
     selector = image_selector or ""
     locator = container.locator(selector) if selector else container.locator(fallback_selector)
@@ -414,16 +555,36 @@ async def extract_captcha_base64(container, image_selector, fallback_selector):
 
 
 async def refresh_captcha(container, refresh_selector, image_selector, fallback_selector):
+    selector = image_selector or fallback_selector
+    image = container.locator(selector).first if selector else None
+    previous_src = None
+    if image is not None:
+        try:
+            previous_src = await image.get_attribute("src", timeout=1000)
+        except Exception:
+            previous_src = None
+
+    clicked = False
     if refresh_selector:
         refresh = container.locator(refresh_selector)
         if await refresh.count() > 0:
             await refresh.first.click()
-            return
-    selector = image_selector or fallback_selector
-    if selector:
-        image = container.locator(selector)
-        if await image.count() > 0:
-            await image.first.click()
+            clicked = True
+    if not clicked and image is not None and await image.count() > 0:
+        await image.click()
+        clicked = True
+
+    # 等待图片地址变化，避免下一轮读到旧验证码
+    if clicked and image is not None and previous_src is not None:
+        try:
+            handle = await image.element_handle(timeout=1000)
+            await container.wait_for_function(
+                "([img, src]) => img.getAttribute('src') !== src",
+                arg=[handle, previous_src],
+                timeout=3000,
+            )
+        except Exception:
+            pass
 
 
 async def solve_captcha(container, config, secrets, image_selector, fallback_selector):
@@ -431,6 +592,7 @@ async def solve_captcha(container, config, secrets, image_selector, fallback_sel
     if not is_ocr_configured(ocr_config):
         print("OCR 配置不完整，无法自动识别验证码。")
         return ""
+    await wait_for_captcha_loaded(container, image_selector, fallback_selector)
     image_base64 = await extract_captcha_base64(container, image_selector, fallback_selector)
     if not image_base64:
         return ""
@@ -458,6 +620,10 @@ def format_course_details(course):
 
 
 def send_email(changed_courses, email_config):
+    import smtplib
+    from email.header import Header
+    from email.mime.text import MIMEText
+
     required = ["sender_email", "sender_password", "receiver_email"]
     if any(not email_config.get(key) for key in required):
         print("跳过邮件发送：请先在网页中填写邮箱信息。")
@@ -475,9 +641,12 @@ def send_email(changed_courses, email_config):
     msg["Subject"] = str(Header("教务系统成绩更新提醒", "utf-8"))
 
     try:
-        server = smtplib.SMTP_SSL(
-            email_config["smtp_server"], email_config["smtp_port"]
-        )
+        if email_config.get("smtp_ssl", True):
+            server = smtplib.SMTP_SSL(
+                email_config["smtp_server"], email_config["smtp_port"]
+            )
+        else:
+            server = smtplib.SMTP(email_config["smtp_server"], email_config["smtp_port"])
         server.login(email_config["sender_email"], email_config["sender_password"])
         server.sendmail(
             email_config["sender_email"],
@@ -497,6 +666,11 @@ def show_notification(changed_courses):
         for component in course.get("components", []):
             message_lines.append(f"  {format_component(component)}")
     message = "\n".join(message_lines)
+    if os.name != "nt":
+        print(message)
+        return
+    import ctypes
+
     ctypes.windll.user32.MessageBoxW(0, message, "新成绩通知", 0x40 | 0x1)
 
 
@@ -505,7 +679,8 @@ def normalize_text(text):
 
 
 def course_changed(previous, current):
-    return previous != current
+    # 快照预先计算了哈希，内容未变时比较为常数时间
+    return as_snapshot(previous) != as_snapshot(current)
 
 
 def build_course_snapshot(name, total, components):
@@ -517,18 +692,24 @@ def build_course_snapshot(name, total, components):
 
 
 def merge_course_details(snapshot):
-    return {
-        "total": snapshot.get("total", ""),
-        "components": snapshot.get("components", []),
-    }
+    return CourseSnapshot(snapshot.get("total", ""), snapshot.get("components", []))
 
 
 def get_selector(config, key, fallback=""):
-    return config.get("xpath", {}).get(key) or fallback
+    return get_selector_plan(config).grade(key, fallback)
 
 
 def get_login_selector(config, key, fallback=""):
-    return config.get("login", {}).get(key) or fallback
+    return get_selector_plan(config).login_selector(key, fallback)
+
+
+def get_account_id(secrets):
+    return pick_value(secrets.get("login", {}).get("username")) or "default"
+
+
+def get_manual_wait_timeout(config):
+    """等待手动登录的最长时间（毫秒），0 表示一直等待"""
+    return max(0, int(float(config.get("manual_login_timeout_seconds", 0)) * 1000))
 
 
 def should_attempt_login(secrets):
@@ -547,20 +728,34 @@ def get_runtime_urls(config, secrets):
     return login_url, grades_url
 
 
+DEFAULT_CAS_SETTINGS = {
+    "auth_url": "https://webauth.gpnu.edu.cn/wengine-auth/login?cas_login=true",
+    "portal_host": "jwglxt.gpnu.edu.cn",
+    "success_text": "广东技术师范大学教务系统",
+    "markers": ["CAS统一身份认证登录", "应用认证平台"],
+}
+
+
+def get_cas_settings(config):
+    cas = (config or {}).get("cas", {})
+    settings = dict(DEFAULT_CAS_SETTINGS)
+    for key, value in cas.items():
+        if value:
+            settings[key] = value
+    return settings
+
+
+def has_cas_marker(content, cas_settings):
+    return any(marker in content for marker in cas_settings["markers"])
+
+
 LOGIN_OK = "ok"
 LOGIN_MANUAL = "manual"
 LOGIN_FAILED = "failed"
 
 
 async def wait_for_login_success(page, config, timeout=10000):
-    selectors = []
-    search_xpath = get_selector(config, "search_button")
-    if search_xpath:
-        selectors.append(f"xpath={search_xpath}")
-    course_selector = get_selector(config, "course_name_cell")
-    if course_selector:
-        selectors.append(course_selector)
-    for selector in selectors:
+    for selector in get_selector_plan(config).success_probe:
         try:
             await page.wait_for_selector(selector, timeout=timeout)
             return True
@@ -570,13 +765,7 @@ async def wait_for_login_success(page, config, timeout=10000):
 
 
 async def wait_for_login_success_forever(page, config):
-    selectors = []
-    search_xpath = get_selector(config, "search_button")
-    if search_xpath:
-        selectors.append(f"xpath={search_xpath}")
-    course_selector = get_selector(config, "course_name_cell")
-    if course_selector:
-        selectors.append(course_selector)
+    selectors = get_selector_plan(config).success_probe
     if not selectors:
         return False
     tasks = [
@@ -598,53 +787,104 @@ async def is_login_form_visible(page, config):
 
 
 async def get_login_target(page, config):
-    selectors = [
-        get_login_selector(config, "switch_to_password"),
-        get_login_selector(config, "username_input"),
-        get_login_selector(config, "password_input"),
-    ]
-    
-    # 增加切换账号按钮的选择器
-    switch_account_sel = get_login_selector(config, "switch_account_btn")
-    if switch_account_sel:
-        if switch_account_sel.startswith("/"):
-            selectors.append(f"xpath={switch_account_sel}")
-        else:
-            selectors.append(switch_account_sel)
+    """返回登录表单所在的 page 或 frame；frame 位置会被缓存，直到有 frame 导航或卸载"""
+    return await find_login_frame(page, get_selector_plan(config))
 
-    # 检查主页面
-    for selector in selectors:
-        if not selector:
-            continue
-        try:
-            locator = page.locator(selector)
-            if await locator.count() > 0 and await locator.first.is_visible():
-                return page
-        except Exception:
-            continue
 
-    # 检查所有 iframe
-    for frame in page.frames:
-        if frame == page.main_frame:
-            continue
-        for selector in selectors:
-            if not selector:
-                continue
+async def wait_for_page_text(page, text, timeout=10000):
+    """等待主页面出现指定文本；页面跳转导致执行上下文销毁时继续等待"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout / 1000
+    while True:
+        remaining = int((deadline - loop.time()) * 1000)
+        if remaining <= 0:
+            return False
+        try:
+            await page.wait_for_function(
+                "text => document.documentElement.outerHTML.includes(text)",
+                arg=text,
+                timeout=remaining,
+            )
+            return True
+        except Exception as exc:
+            if "Timeout" in type(exc).__name__:
+                return False
             try:
-                locator = frame.locator(selector)
-                if await locator.count() > 0 and await locator.first.is_visible():
-                    return frame
+                await page.wait_for_load_state(
+                    "domcontentloaded", timeout=max(1, remaining)
+                )
             except Exception:
-                continue
-    return None
+                return False
 
 
-async def check_and_handle_cas_jump(page):
+def is_login_response(response, frame, endpoint=""):
+    """判断响应是否来自登录提交：配置了 login_endpoint 时按地址匹配，
+    否则要求是登录表单所在 frame 发往同一主机的 POST 表单或 XHR，统计上报（sendBeacon 或第三方主机）不算"""
+    request = response.request
+    if request.method != "POST" or request.resource_type not in ("document", "xhr", "fetch"):
+        return False
+    if endpoint:
+        return endpoint in response.url
+    try:
+        if request.frame != frame:
+            return False
+    except Exception:
+        return False
+    return urlsplit(response.url).netloc == urlsplit(frame.url).netloc
+
+
+async def wait_for_submit_settle(
+    page, submit, frame=None, endpoint="", timeout=5000, redirect_timeout=1000
+):
+    """提交前挂上导航与登录接口响应监听，提交后等待真实事件而不是固定睡眠
+
+    XHR 登录在接口返回后才由页面脚本跳转，先等到响应时再给跳转 redirect_timeout 毫秒，
+    否则后续的 CAS 检测会落在即将离开的登录页上；登录失败不跳转时最多多等这一段时间。
+    """
+    frame = frame or page.main_frame
+    navigation = asyncio.create_task(page.wait_for_event("framenavigated", timeout=timeout))
+    waiters = [
+        navigation,
+        asyncio.create_task(
+            page.wait_for_event(
+                "response",
+                predicate=lambda response: is_login_response(response, frame, endpoint),
+                timeout=timeout,
+            )
+        ),
+    ]
+    settled = False
+    try:
+        await submit()
+        done, _ = await asyncio.wait(
+            waiters, timeout=timeout / 1000, return_when=asyncio.FIRST_COMPLETED
+        )
+        settled = any(not task.cancelled() and task.exception() is None for task in done)
+        if settled and navigation not in done:
+            await asyncio.wait([navigation], timeout=redirect_timeout / 1000)
+    finally:
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+    if settled:
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=timeout)
+        except Exception:
+            pass
+    return settled
+
+
+async def check_and_handle_cas_jump(page, config=None):
     """检测并处理 CAS 统一身份认证跳转"""
+    cas_settings = get_cas_settings(config)
+    success_text = cas_settings["success_text"]
     try:
-        # 增加一个小的延迟，确保 frame 加载
-        await asyncio.sleep(0.5)
-        
+        # 等待当前文档解析完成，确保 frame 已挂载
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=5000)
+        except Exception:
+            pass
+
         # 检查所有 frame 中的内容
         all_frames = page.frames
         cas_found = False
@@ -653,7 +893,7 @@ async def check_and_handle_cas_jump(page):
         for frame in all_frames:
             try:
                 content = await frame.content()
-                if "CAS统一身份认证登录" in content or "应用认证平台" in content:
+                if has_cas_marker(content, cas_settings):
                     cas_found = True
                     target_frame = frame
                     break
@@ -665,20 +905,20 @@ async def check_and_handle_cas_jump(page):
             print(f"检测到 CAS 状态 (URL: {current_url})")
             
             # 如果当前 URL 已经是登录成功后的 URL 或者是教务系统主页，就不再跳转
-            if "jwglxt.gpnu.edu.cn" in current_url and "cas_login=true" not in current_url:
+            if cas_settings["portal_host"] in current_url and "cas_login=true" not in current_url:
                 content = await page.content()
-                if "广东技术师范大学教务系统" in content:
+                if success_text in content:
                     print("已经在教务系统主页，无需再次跳转。")
                     return "SUCCESS"
 
             print("正在执行 CAS 跳转授权...")
             
             # 记录跳转前的状态
-            auth_url = "https://webauth.gpnu.edu.cn/wengine-auth/login?cas_login=true"
+            auth_url = cas_settings["auth_url"]
             
             try:
                 # 尝试跳转，如果已经在跳转中，goto 可能会抛出错误，这里捕获它
-                await page.goto(auth_url, wait_until="networkidle", timeout=15000)
+                await throttled_goto(page, config, auth_url, wait_until="networkidle", timeout=15000)
             except Exception as e:
                 if "navigation" in str(e).lower():
                     print(f"跳转过程中检测到并发导航: {e}，尝试等待加载完成")
@@ -689,38 +929,18 @@ async def check_and_handle_cas_jump(page):
                 else:
                     print(f"跳转 CAS 授权页面失败: {e}，尝试 domcontentloaded 模式")
                     try:
-                        await page.goto(auth_url, wait_until="domcontentloaded", timeout=10000)
+                        await throttled_goto(
+                            page, config, auth_url, wait_until="domcontentloaded", timeout=10000
+                        )
                     except Exception as e2:
                         print(f"二次尝试跳转也失败: {e2}")
 
-            # 轮询检查是否到达成功页面，最多等待 10 秒
+            # 等待成功页面文本出现（跨导航重试），最多等待 10 秒
             print("正在验证登录成功状态...")
-            for _ in range(20): # 0.5s * 20 = 10s
-                await asyncio.sleep(0.5)
-                try:
-                    content = await page.content()
-                    if "广东技术师范大学教务系统" in content:
-                        print("检测到“广东技术师范大学教务系统”文本，登录成功！")
-                        return "SUCCESS"
-                    
-                    # 检查是否还在 CAS 页面
-                    all_frames = page.frames
-                    still_on_cas = False
-                    for frame in all_frames:
-                        try:
-                            f_content = await frame.content()
-                            if "CAS统一身份认证登录" in f_content or "应用认证平台" in f_content:
-                                still_on_cas = True
-                                break
-                        except:
-                            continue
-                    
-                    if not still_on_cas and "jwglxt.gpnu.edu.cn" in page.url:
-                        # 虽然没看到文本，但 URL 对了，可能还在加载
-                        continue
-                except:
-                    continue
-            
+            if await wait_for_page_text(page, success_text, timeout=10000):
+                print(f"检测到“{success_text}”文本，登录成功！")
+                return "SUCCESS"
+
             return True # 返回 True 表示处理过 CAS，但没确认最终成功，让外层重试
     except Exception as exc:
         print(f"检查 CAS 文本或跳转时出错: {exc}")
@@ -738,6 +958,11 @@ async def wait_for_login_exit(page, config, timeout=15000):
 
 
 async def wait_for_login_exit_forever(page, config):
+    limit = get_manual_wait_timeout(config)
+    if limit:
+        if await wait_for_login_exit(page, config, timeout=limit):
+            return True
+        raise TimeoutError("等待手动登录超时")
     while True:
         if not await is_login_form_visible(page, config):
             return True
@@ -765,15 +990,23 @@ async def attempt_login(page, config, secrets):
     switch_account_sel = get_login_selector(config, "switch_account_btn")
     if switch_account_sel:
         try:
-            selector = f"xpath={switch_account_sel}" if switch_account_sel.startswith("/") else switch_account_sel
-            switch_account_btn = target.locator(selector)
+            switch_account_btn = target.locator(switch_account_sel)
             if await switch_account_btn.count() > 0:
                 # 检查文本是否匹配，确保是“切换账号登录”
                 text = await switch_account_btn.inner_text()
                 if "切换账号登录" in text:
                     print("检测到“切换账号登录”按钮，正在点击...")
                     await switch_account_btn.click()
-                    await asyncio.sleep(1)  # 等待切换动画或加载
+                    # 等待切换后的账号密码输入框出现
+                    try:
+                        await page.wait_for_load_state("domcontentloaded", timeout=3000)
+                        username_sel = get_login_selector(config, "username_input")
+                        if username_sel:
+                            await target.locator(username_sel).first.wait_for(
+                                state="visible", timeout=3000
+                            )
+                    except Exception:
+                        pass
                     # 点击后可能 target 发生了变化，重新获取
                     new_target = await get_login_target(page, config)
                     if new_target:
@@ -797,7 +1030,12 @@ async def attempt_login(page, config, secrets):
         switch_button = target.locator(switch_selector)
         if await switch_button.count() > 0:
             await switch_button.first.click()
-            await asyncio.sleep(0.5)
+            try:
+                await target.locator(username_selector).first.wait_for(
+                    state="visible", timeout=2000
+                )
+            except Exception:
+                pass
             # 再次检查
             username_field = await target.query_selector(username_selector)
             password_field = await target.query_selector(password_selector)
@@ -832,40 +1070,65 @@ async def attempt_login(page, config, secrets):
     ocr_config = build_ocr_config(config, secrets)
     max_retries = max(1, int(ocr_config.get("max_retries", 3)))
 
-    for attempt in range(max_retries):
-        await target.fill(username_selector, login.get("username", ""))
-        await target.fill(password_selector, login.get("password", ""))
-
-        captcha_required = False
-        if captcha_input_selector:
-            captcha_input = target.locator(captcha_input_selector)
-            if (
-                await captcha_input.count() > 0
-                and await captcha_input.first.is_visible()
-            ):
-                captcha_required = True
-                captcha_answer = await solve_captcha(
-                    target, # solve_captcha 也需要支持 target (page 或 frame)
-                    config,
-                    secrets,
-                    captcha_image_selector,
-                    captcha_fallback_selector,
-                )
-                if captcha_answer:
-                    await captcha_input.first.fill(captcha_answer)
-                else:
-                    return LOGIN_MANUAL
+    async def is_captcha_visible():
+        if not captcha_input_selector:
+            return False
+        captcha_input = target.locator(captcha_input_selector)
+        return await captcha_input.count() > 0 and await captcha_input.first.is_visible()
+
+    def start_captcha_task():
+        return asyncio.create_task(
+            solve_captcha(
+                target,  # solve_captcha 也需要支持 target (page 或 frame)
+                config,
+                secrets,
+                captcha_image_selector,
+                captcha_fallback_selector,
+            )
+        )
+
+    # login_pipeline 为 false 时恢复原先的顺序流程（填完账号密码再识别验证码、提交后固定等待 2 秒），仅供基准对比
+    pipeline = bool(config.get("login_pipeline", True))
 
+    for attempt in range(max_retries):
+        # 验证码提取与 OCR 在后台进行，与账号密码填写并行
+        captcha_task = start_captcha_task() if pipeline and await is_captcha_visible() else None
+        try:
+            await target.fill(username_selector, login.get("username", ""))
+            await target.fill(password_selector, login.get("password", ""))
+            if captcha_task is None and await is_captcha_visible():
+                captcha_task = start_captcha_task()
+        except BaseException:
+            if captcha_task is not None:
+                captcha_task.cancel()
+                await asyncio.gather(captcha_task, return_exceptions=True)
+            raise
+
+        captcha_required = captcha_task is not None
         if captcha_required:
-            await target.locator(captcha_input_selector).first.press("Enter")
+            captcha_answer = await captcha_task
+            if not captcha_answer:
+                return LOGIN_MANUAL
+            await target.locator(captcha_input_selector).first.fill(captcha_answer)
+            submit_field = target.locator(captcha_input_selector).first
         else:
-            await target.locator(password_selector).first.press("Enter")
-        
-        # 统一认证可能需要点跳转，等待一下
-        await asyncio.sleep(2)
+            submit_field = target.locator(password_selector).first
+
+        await throttle(page.url, build_rate_limit_config(config))
+        if pipeline:
+            # 提交后等待真实的导航或登录接口响应
+            await wait_for_submit_settle(
+                page,
+                lambda: submit_field.press("Enter"),
+                frame=target if target is not page else page.main_frame,
+                endpoint=config.get("login_endpoint", ""),
+            )
+        else:
+            await submit_field.press("Enter")
+            await asyncio.sleep(2)
 
         # 检测是否有 "CAS统一身份认证登录" 文本并处理跳转
-        cas_status = await check_and_handle_cas_jump(page)
+        cas_status = await check_and_handle_cas_jump(page, config)
         if cas_status == "SUCCESS":
             return LOGIN_OK
         
@@ -889,139 +1152,258 @@ async def attempt_login(page, config, secrets):
 
 
 async def fetch_detail_components(page, row, config):
-    detail_button = row.locator(get_selector(config, "detail_button"))
+    plan = get_selector_plan(config)
+    detail_button = row.locator(plan.grade("detail_button"))
     if await detail_button.count() == 0:
         return []
     try:
+        # 详情弹窗通过 XHR 加载分项，使用单独的 detail 令牌桶
+        await throttle(page.url, build_rate_limit_config(config), DETAIL_BUCKET)
         await detail_button.first.click()
     except Exception:
         return []
 
-    modal_selector = get_selector(config, "detail_modal")
+    modal_selector = plan.grade("detail_modal")
     modal = page.locator(modal_selector) if modal_selector else page
     try:
         await modal.wait_for(state="visible", timeout=5000)
     except Exception:
         return []
 
-    rows = modal.locator(get_selector(config, "detail_rows"))
+    rows = modal.locator(plan.grade("detail_rows"))
     components = []
     count = await rows.count()
     for index in range(count):
         row_item = rows.nth(index)
         name = normalize_text(
-            await row_item.locator(
-                get_selector(config, "detail_item_cell")
-            ).inner_text()
+            await row_item.locator(plan.grade("detail_item_cell")).inner_text()
         )
         ratio = normalize_text(
-            await row_item.locator(
-                get_selector(config, "detail_ratio_cell")
-            ).inner_text()
+            await row_item.locator(plan.grade("detail_ratio_cell")).inner_text()
         )
         score = normalize_text(
-            await row_item.locator(
-                get_selector(config, "detail_score_cell")
-            ).inner_text()
+            await row_item.locator(plan.grade("detail_score_cell")).inner_text()
         )
         if name or ratio or score:
             components.append({"name": name, "ratio": ratio, "score": score})
 
-    close_button = modal.locator(get_selector(config, "detail_close_button"))
+    close_button = modal.locator(plan.grade("detail_close_button"))
     if await close_button.count() > 0:
         await close_button.first.click()
     return components
 
 
 async def scrape_courses(page, config):
-    row_selector = get_selector(config, "course_row", "tr")
+    plan = get_selector_plan(config)
+    row_selector = plan.grade("course_row")
     rows = page.locator(row_selector)
     count = await rows.count()
     courses = []
     for index in range(count):
         row = rows.nth(index)
         name = normalize_text(
-            await row.locator(get_selector(config, "course_name_cell")).inner_text()
+            await row.locator(plan.grade("course_name_cell")).inner_text()
         )
         if not name:
             continue
         total = normalize_text(
-            await row.locator(get_selector(config, "total_score_cell")).inner_text()
+            await row.locator(plan.grade("total_score_cell")).inner_text()
         )
         components = await fetch_detail_components(page, row, config)
         courses.append(build_course_snapshot(name, total, components))
     return courses
 
 
-async def check_grades(context, seen_courses, config, secrets):
-    page = await context.new_page()
-    login_url, grades_url = get_runtime_urls(config, secrets)
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 正在检查成绩...")
+SESSION_PROBE_STATS = Counter()
 
-    # 确保成绩查询 URL 正确
-    target_grades_url = grades_url
-    
+
+async def probe_session(context, config, secrets):
+    """在任何导航之前检查 cookie 有效期并发送一次轻量请求，返回 (会话是否有效, 原因)"""
+    probe_config = config.get("session_probe", {})
+    if not probe_config.get("enabled", True):
+        return False, "disabled"
+    _, grades_url = get_runtime_urls(config, secrets)
+    probe_url = pick_value(probe_config.get("url"), grades_url)
+    if not probe_url:
+        return False, "no_probe_url"
+
+    cookies = await context.cookies([probe_url])
+    if not cookies:
+        return False, "no_cookies"
+    now = time.time()
+    if all(0 <= cookie.get("expires", -1) <= now for cookie in cookies):
+        return False, "cookies_expired"
+
+    timeout = float(probe_config.get("timeout_seconds", 10)) * 1000
+    # 预检请求不产生页面事件，熔断计数需要在这里手动记录
+    guard = await throttle(probe_url, build_rate_limit_config(config))
     try:
-        await page.goto(login_url, wait_until="domcontentloaded")
-
-        # 增加循环处理逻辑，支持多次账号密码登录（应对多次跳转至登录页的情况）
-        max_login_rounds = 5
-        for round in range(max_login_rounds):
-            # 每一轮开始前先检查是否出现了 CAS 提示界面
-            cas_status = await check_and_handle_cas_jump(page)
-            if cas_status == "SUCCESS":
-                # 如果检测到教务系统文本，说明登录成功，直接退出循环
-                break
-            elif cas_status:
-                # 如果发生了跳转，给一点时间让新页面加载，然后重新开始本轮检测
-                await asyncio.sleep(1)
+        response = await context.request.get(
+            probe_url, max_redirects=0, timeout=timeout, fail_on_status_code=False
+        )
+    except Exception as exc:
+        if guard is not None and "Timeout" in type(exc).__name__:
+            guard.record_failure("预检超时")
+        return False, f"request_error: {exc}"
+    if guard is not None:
+        guard.record_status(response.status)
+    try:
+        if 300 <= response.status < 400:
+            return False, f"redirect: {response.headers.get('location', '')}"
+        if response.status != 200:
+            return False, f"status_{response.status}"
+        body = await response.text()
+    finally:
+        await response.dispose()
+    if has_cas_marker(body, get_cas_settings(config)):
+        return False, "login_page"
+    return True, "alive"
 
-            # 检查当前页面是否已经出现了教务系统文本（可能是不经过 CAS 跳转直接进入的情况）
-            if "广东技术师范大学教务系统" in (await page.content()):
-                print("检测到“广东技术师范大学教务系统”文本，登录成功！")
-                break
 
-            await wait_for_login_form_ready(page, config, timeout=1000)
-            login_form_visible = await is_login_form_visible(page, config)
+async def throttled_goto(page, config, url, **kwargs):
+    """按目标主机取得令牌后再导航"""
+    await throttle(url, build_rate_limit_config(config or {}))
+    return await page.goto(url, **kwargs)
 
-            if login_form_visible:
-                print(f"检测到登录界面 (第 {round + 1} 轮)，正在执行登录...")
-                login_result = await attempt_login(page, config, secrets)
-                if login_result == LOGIN_MANUAL:
-                    print("需要手动干预，脚本将等待登录成功后继续。")
-                    break
-                # 如果是 LOGIN_OK，说明已经到达成功页面，下一轮循环会通过 wait_for_login_success 退出
-                # 如果是 LOGIN_FAILED，说明可能还没到成功页面，也可能出现了新的登录框，继续下一轮检测
-            else:
-                # 检查是否已经处于成功状态
-                logged_in = await wait_for_login_success(page, config, timeout=2000)
-                if logged_in:
-                    print("登录成功，进入主界面。")
-                    break
-                
-                # 如果既没看到登录框也没看到成功标志，且是第一轮，尝试再次检测登录框
-                if round == 0:
-                    continue
+
+async def run_login_flow(page, config, secrets, login_url):
+    """打开登录入口并处理多轮登录与 CAS 跳转，直到离开登录界面"""
+    await throttled_goto(page, config, login_url, wait_until="domcontentloaded")
+
+    # 增加循环处理逻辑，支持多次账号密码登录（应对多次跳转至登录页的情况）
+    max_login_rounds = 5
+    for round in range(max_login_rounds):
+        # 每一轮开始前先检查是否出现了 CAS 提示界面
+        cas_status = await check_and_handle_cas_jump(page, config)
+        if cas_status == "SUCCESS":
+            # 如果检测到教务系统文本，说明登录成功，直接退出循环
+            break
+        elif cas_status:
+            # 如果发生了跳转，给一点时间让新页面加载，然后重新开始本轮检测
+            await asyncio.sleep(1)
+
+        # 检查当前页面是否已经出现了教务系统文本（可能是不经过 CAS 跳转直接进入的情况）
+        success_text = get_cas_settings(config)["success_text"]
+        if success_text in (await page.content()):
+            print(f"检测到“{success_text}”文本，登录成功！")
+            break
+
+        await wait_for_login_form_ready(page, config, timeout=1000)
+        login_form_visible = await is_login_form_visible(page, config)
+
+        if login_form_visible:
+            print(f"检测到登录界面 (第 {round + 1} 轮)，正在执行登录...")
+            login_result = await attempt_login(page, config, secrets)
+            if login_result == LOGIN_MANUAL:
+                print("需要手动干预，脚本将等待登录成功后继续。")
+                break
+            # 如果是 LOGIN_OK，说明已经到达成功页面，下一轮循环会通过 wait_for_login_success 退出
+            # 如果是 LOGIN_FAILED，说明可能还没到成功页面，也可能出现了新的登录框，继续下一轮检测
+        else:
+            # 检查是否已经处于成功状态
+            logged_in = await wait_for_login_success(page, config, timeout=2000)
+            if logged_in:
+                print("登录成功，进入主界面。")
                 break
+            
+            # 如果既没看到登录框也没看到成功标志，且是第一轮，尝试再次检测登录框
+            if round == 0:
+                continue
+            break
 
-        if not await wait_for_login_exit(page, config, timeout=15000):
-            await wait_for_login_exit_forever(page, config)
+    if not await wait_for_login_exit(page, config, timeout=15000):
+        await wait_for_login_exit_forever(page, config)
 
-        # 等待页面加载完成后再跳转
-        try:
-            await page.wait_for_load_state("networkidle", timeout=10000)
-        except Exception:
-            pass
+    # 等待页面加载完成后再跳转
+    try:
+        await page.wait_for_load_state("networkidle", timeout=10000)
+    except Exception:
+        pass
+
+
+def check_flight_key(context, secrets):
+    """检查合并的键：账号 + 浏览器上下文
+
+    未配置账号（手动登录）时账号名都是 "default"，不同上下文里登录的可能是不同的人，不能共享结果；
+    同一上下文的登录会话与 seen_courses 都相同，合并是安全的。登录流程在检查内部，随检查一起合并，无需单独去重。
+    上下文用 scope_token 编号而不是 id()：回收重建的上下文可能复用旧地址，但不会复用编号。
+    """
+    return ("check", get_account_id(secrets), scope_token(context))
+
+
+async def check_grades(
+    context, seen_courses, config, secrets, tracer=None, seen_file=SEEN_COURSES_FILE
+):
+    """按账号合并并发的检查请求：已有检查在进行时等待并共享其结果，
+    上次成功结果在 result_ttl_seconds 内直接复用；返回值额外包含 "source"（executed/shared/cached）"""
+    flight_config = build_single_flight_config(config)
+    if not flight_config["enabled"]:
+        result = await run_check(context, seen_courses, config, secrets, tracer, seen_file)
+        return dict(result, source="executed")
+    result, source = await get_single_flight().do(
+        check_flight_key(context, secrets),
+        lambda: run_check(context, seen_courses, config, secrets, tracer, seen_file),
+        ttl=flight_config["result_ttl_seconds"],
+        cacheable=lambda result: result["ok"],
+    )
+    if source != "executed":
+        print(f"该账号已有检查{'在进行' if source == 'shared' else '刚刚完成'}，复用其结果。")
+    return dict(result, source=source)
+
+
+async def run_check(
+    context, seen_courses, config, secrets, tracer=None, seen_file=SEEN_COURSES_FILE
+):
+    """执行一次完整检查，返回 {"ok", "changed", "session_reason"} 供调用方统计"""
+    if tracer is None:
+        tracer = CheckTracer(build_trace_config(config))
+    trace = await tracer.start(context, title="check_grades")
+    failed = False
+    changed = False
+    changed_names = []
+    session_reason = ""
+    login_url, grades_url = get_runtime_urls(config, secrets)
+    rate_limit_config = build_rate_limit_config(config)
+    grades_guard = guard_for_url(grades_url, rate_limit_config)
+    page = None
+
+    # 确保成绩查询 URL 正确
+    target_grades_url = grades_url
+    
+    try:
+        # trace 已开始录制，之后的任何异常都必须经过 finally 结束录制
+        install_breaker_listeners(
+            context,
+            rate_limit_config,
+            [login_url, grades_url, get_cas_settings(config)["auth_url"]],
+        )
+        if grades_guard is not None:
+            waited = await grades_guard.wait_while_open()
+            if waited >= 1:
+                print(f"成绩系统处于熔断状态，本次检查已延后 {waited:.0f} 秒。")
+        page = await context.new_page()
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 正在检查成绩...")
+
+        session_alive, session_reason = await probe_session(context, config, secrets)
+        if session_alive:
+            print("已有会话仍然有效，跳过登录流程。")
+        else:
+            SESSION_PROBE_STATS[session_reason] += 1
+            print(
+                f"会话无效（原因: {session_reason}），执行完整登录流程。"
+                f"累计: {dict(SESSION_PROBE_STATS)}"
+            )
+            await run_login_flow(page, config, secrets, login_url)
 
         # 登录流程结束，开始成绩查询部分
         print(f"正在转到成绩查询页面: {target_grades_url}")
-        await page.goto(target_grades_url, wait_until="domcontentloaded")
+        await throttled_goto(page, config, target_grades_url, wait_until="domcontentloaded")
         
         # 再次检查是否需要登录（有时跳转到成绩页会重新要求认证）
-        cas_status = await check_and_handle_cas_jump(page)
+        cas_status = await check_and_handle_cas_jump(page, config)
         if cas_status == "SUCCESS":
             # 已经确认登录成功，重新加载成绩页以防万一
-            await page.goto(target_grades_url, wait_until="domcontentloaded")
+            await throttled_goto(page, config, target_grades_url, wait_until="domcontentloaded")
         elif cas_status:
             await asyncio.sleep(1)
         
@@ -1034,80 +1416,347 @@ async def check_grades(context, seen_courses, config, secrets):
                 await wait_for_login_exit_forever(page, config)
 
             # 重新进入成绩页
-            await page.goto(target_grades_url, wait_until="domcontentloaded")
+            await throttled_goto(page, config, target_grades_url, wait_until="domcontentloaded")
 
-        search_xpath = get_selector(config, "search_button")
-        if search_xpath:
+        search_button = get_selector(config, "search_button")
+        if search_button:
             try:
-                await page.wait_for_selector(
-                    f"xpath={search_xpath}", state="visible", timeout=10000
-                )
+                await page.wait_for_selector(search_button, state="visible", timeout=10000)
             except Exception:
                 print("未检测到查询按钮，可能需要手动登录，请在浏览器完成登录。")
-                await page.wait_for_selector(f"xpath={search_xpath}", timeout=0)
-            await page.click(f"xpath={search_xpath}")
+                await page.wait_for_selector(
+                    search_button, timeout=get_manual_wait_timeout(config)
+                )
+            # 查询按钮触发成绩列表 XHR
+            await throttle(page.url, build_rate_limit_config(config))
+            await page.click(search_button)
 
         course_selector = get_selector(config, "course_name_cell")
         try:
             await page.wait_for_selector(course_selector, timeout=15000)
         except Exception:
             print("未检测到成绩表格，可能需要手动登录，请在浏览器完成登录。")
-            await page.wait_for_selector(course_selector, timeout=0)
+            await page.wait_for_selector(
+                course_selector, timeout=get_manual_wait_timeout(config)
+            )
         courses = await scrape_courses(page, config)
 
         current_courses = {}
         changed_courses = []
+        changes = []
+        # 首次检查时所有课程都是新的，不能当作成绩发布向其他账号传播
+        has_baseline = bool(seen_courses)
         for course in courses:
-            current_courses[course["name"]] = merge_course_details(course)
-            previous = seen_courses.get(course["name"])
-            if previous is None or course_changed(
-                previous, current_courses[course["name"]]
-            ):
+            current = merge_course_details(course)
+            current_courses[course["name"]] = current
+            previous = as_snapshot(seen_courses.get(course["name"]))
+            if previous is None or course_changed(previous, current):
                 changed_courses.append(course)
+                changes.append(
+                    (course["name"], previous and previous.to_dict(), current.to_dict())
+                )
+        observe_courses(
+            config, get_account_id(secrets), list(current_courses), changes if has_baseline else []
+        )
 
         if changed_courses:
-            print(f"发现成绩更新: {[course['name'] for course in changed_courses]}")
-            send_email(changed_courses, build_email_config(config, secrets))
-            show_notification(changed_courses)
+            changed = True
+            changed_names = [course["name"] for course in changed_courses]
+            print(f"发现成绩更新: {changed_names}")
+            # Webhook 只入队，由后台任务合并、推送与重试
+            notify_webhooks(config, get_account_id(secrets), changes)
+            await asyncio.to_thread(
+                send_email, changed_courses, build_email_config(config, secrets)
+            )
+            if config.get("desktop_notification", True):
+                show_notification(changed_courses)
             seen_courses.update(current_courses)
-            save_seen_courses(seen_courses)
+            save_seen_courses(seen_courses, seen_file)
+            await asyncio.to_thread(
+                append_grade_history,
+                changed_courses,
+                get_account_id(secrets),
+                config.get("history_file", GRADE_HISTORY_FILE),
+            )
+            await asyncio.to_thread(
+                publish_changes,
+                build_change_feed_config(config),
+                get_account_id(secrets),
+                changes,
+            )
         else:
             print("未发现新成绩。")
-
-        await page.screenshot(path="last_check.png")
     except Exception as exc:
+        failed = True
+        if grades_guard is not None and "Timeout" in type(exc).__name__:
+            grades_guard.record_failure("检查超时")
         print(f"检查过程中发生错误: {exc}")
     finally:
-        await page.close()
+        try:
+            if page is not None:
+                screenshot_config = build_screenshot_config(config)
+                await capture_screenshot(
+                    page,
+                    screenshot_config,
+                    get_account_id(secrets),
+                    screenshot_reason(screenshot_config, failed, changed),
+                )
+                await page.close()
+        finally:
+            await tracer.finish(trace, failed, label=get_account_id(secrets))
+    return {"ok": not failed, "changed": changed_names, "session_reason": session_reason}
 
 
-async def run():
-    config = load_config()
-    stored_secrets = load_user_secrets()
-    runtime_secrets = collect_runtime_secrets(config, stored_secrets)
-    secrets = merge_secrets(stored_secrets, runtime_secrets)
-    save_user_secrets(secrets)
+async def launch_context(playwright, user_data_dir, storage_state=None, headless=False):
+    context = await playwright.chromium.launch_persistent_context(
+        user_data_dir, headless=headless, channel="msedge"
+    )
+    # 回收后恢复会话 cookie（包括未落盘的会话级 cookie）
+    if storage_state and storage_state.get("cookies"):
+        try:
+            await context.add_cookies(storage_state["cookies"])
+        except Exception as exc:
+            print(f"恢复会话 cookie 失败: {exc}")
+    return context
+
+
+async def recycle_resources(playwright, context, user_data_dir, level, headless=False):
+    """按回收级别关闭遗留页面或重启浏览器，并携带会话"""
+    if level == RECYCLE_PAGE:
+        # 保留第一个页面：持久化上下文关闭最后一个页面后浏览器窗口也会关闭
+        pages = list(context.pages)[1:]
+        for page in pages:
+            await page.close()
+        print(f"已关闭 {len(pages)} 个遗留页面。")
+        return context
+    if level == RECYCLE_BROWSER:
+        # 持久化上下文与浏览器进程一一对应，只能整体重启
+        print("资源达到回收水位，正在重启浏览器并保留会话...")
+        storage_state = await context.storage_state()
+        await context.close()
+        return await launch_context(playwright, user_data_dir, storage_state, headless)
+    return context
+
+
+def load_runtime_config(args):
+    """按 配置文件 -> 环境变量 -> 命令行 的顺序加载配置；热更新时也通过它重新加载"""
+    config = apply_env_config(load_config(args.config))
+    if getattr(args, "headless", False):
+        config["headless"] = True
+    return config
+
+
+def load_runtime(args, interactive=False):
+    """加载配置与 secrets；interactive 时打开本地网页补充填写"""
+    config = load_runtime_config(args)
+    stored_secrets = load_user_secrets(args.secrets)
+    if interactive:
+        runtime_secrets = collect_runtime_secrets(config, stored_secrets)
+        stored_secrets = merge_secrets(stored_secrets, runtime_secrets)
+        save_user_secrets(stored_secrets, args.secrets)
+    secrets = merge_secrets(stored_secrets, secrets_from_env())
+    return config, secrets
+
 
+def report_startup_timing(marks):
+    """输出从解释器启动到各阶段的耗时"""
+    started = process_start_time() or MODULE_LOADED_AT
+    parts = [f"{name} {moment - started:.2f}s" for name, moment in marks]
+    print(f"启动耗时（自解释器启动）: {'，'.join(parts)}")
+
+
+async def check_once(config, secrets):
+    """执行一次检查后退出，返回进程退出码；供 cron/systemd 定时器调用"""
+    from playwright.async_api import async_playwright
+
+    marks = [("导入 Playwright", time.time())]
+    user_data_dir = os.path.abspath(config.get("user_data_dir", USER_DATA_DIR))
+    async with async_playwright() as p:
+        context = await launch_context(
+            p, user_data_dir, headless=bool(config.get("headless", False))
+        )
+        marks.append(("浏览器就绪", time.time()))
+        context.once("request", lambda request: marks.append(("首个请求", time.time())))
+        tracer = CheckTracer(build_trace_config(config))
+        try:
+            result = await check_grades(context, load_seen_courses(), config, secrets, tracer)
+        finally:
+            await context.close()
+            await close_webhook_notifier()
+    report_startup_timing(marks)
+    return 0 if result["ok"] else 1
+
+
+def shadowed_url_reason(key, old_config, new_config, secrets):
+    """config.json 中的 URL 被 secrets 中保存的 URL 覆盖时，修改它不会改变实际使用的地址"""
+    if key not in ("login_url", "grades_url", "url"):
+        return ""
+    trial = dict(old_config)
+    trial[key] = new_config.get(key, "")
+    if get_runtime_urls(trial, secrets) != get_runtime_urls(old_config, secrets):
+        return ""
+    return "secrets 中保存的 URL 优先，请运行 configure 或修改 secrets 文件"
+
+
+def build_config_watcher(args, config, secrets):
+    reload_config = build_config_reload_config(config)
+    if not reload_config["enabled"]:
+        return None
+    return ConfigWatcher(
+        args.config,
+        lambda: load_runtime_config(args),
+        config,
+        reload_config["poll_seconds"],
+        ignored=lambda key, old, new: shadowed_url_reason(key, old, new, secrets),
+    )
+
+
+async def run(config, secrets, watcher=None):
+    from playwright.async_api import async_playwright
+
+    headless = bool(config.get("headless", False))
     user_data_dir = config.get("user_data_dir", USER_DATA_DIR)
     user_data_dir = os.path.abspath(user_data_dir)
 
     async with async_playwright() as p:
-        context = await p.chromium.launch_persistent_context(
-            user_data_dir, headless=False, channel="msedge"
-        )
+        context = await launch_context(p, user_data_dir, headless=headless)
 
         seen_courses = load_seen_courses()
+        tracer = CheckTracer(build_trace_config(config))
+        governor = ResourceGovernor(build_resource_config(config))
+        feed_config = build_change_feed_config(config)
+        feed_server = None
+        if feed_config["enabled"] and feed_config["server_enabled"]:
+            feed_server = start_feed_server(
+                get_change_feed(feed_config),
+                feed_config["server_host"],
+                feed_config["server_port"],
+            )
         try:
             while True:
-                await check_grades(context, seen_courses, config, secrets)
+                await check_grades(context, seen_courses, config, secrets, tracer)
+                level = await asyncio.to_thread(governor.evaluate, len(context.pages))
+                if level:
+                    context = await recycle_resources(
+                        p, context, user_data_dir, level, headless
+                    )
+                    governor.mark_recycled(level)
                 interval = config.get("check_interval_seconds", 1800)
                 print(f"等待 {interval // 60} 分钟后进行下一次检查...")
-                await asyncio.sleep(interval)
+                if watcher is None:
+                    await asyncio.sleep(interval)
+                    continue
+                # 等待期间监视配置文件；有效的新配置在两次检查之间整体替换，并立即检查一次
+                new_config = await watcher.wait(interval)
+                if new_config is not None:
+                    config = new_config
+                    tracer.update_config(build_trace_config(config))
+                    governor.config = build_resource_config(config)
+                    # 旧配置下的检查结果（例如不同的 URL 或选择器）不能在新配置下复用
+                    get_single_flight().forget_prefix(("check",))
+                    print("新配置已生效，立即开始下一次检查。")
         except KeyboardInterrupt:
             print("脚本已停止。")#
         finally:
+            if feed_server is not None:
+                feed_server.shutdown()
             await context.close()
+            await close_webhook_notifier()
+
+
+def import_secrets(args):
+    """从 JSON 文件（- 表示标准输入）与环境变量导入 secrets，合并后保存"""
+    updates = {}
+    if args.file:
+        if args.file == "-":
+            try:
+                updates = json.load(sys.stdin)
+            except ValueError as exc:
+                print(f"无法解析标准输入中的 secrets: {exc}")
+                return 1
+        else:
+            updates = load_json_file(args.file, None)
+            if updates is None:
+                print(f"无法读取 secrets 文件: {args.file}")
+                return 1
+    if not isinstance(updates, dict):
+        print("secrets 文件必须是 JSON 对象。")
+        return 1
+    updates = merge_secrets(updates, secrets_from_env())
+    secrets = merge_secrets(load_user_secrets(args.secrets), updates)
+    save_user_secrets(secrets, args.secrets)
+    print(f"secrets 已保存到: {args.secrets}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="教务系统成绩监控")
+    parser.add_argument(
+        "--config",
+        default=os.environ.get(f"{ENV_PREFIX}CONFIG", CONFIG_FILE),
+        help=f"配置文件路径（环境变量 {ENV_PREFIX}CONFIG）",
+    )
+    parser.add_argument(
+        "--secrets",
+        default=os.environ.get(f"{ENV_PREFIX}SECRETS", SECRETS_FILE),
+        help=f"secrets 文件路径（环境变量 {ENV_PREFIX}SECRETS）",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    check_parser = subparsers.add_parser("check", help="非交互地执行检查")
+    check_parser.add_argument(
+        "--once", action="store_true", help="只检查一次后退出，失败时退出码为 1（必需；持续检查请用 daemon）"
+    )
+    check_parser.add_argument("--headless", action="store_true", help="以无头模式启动浏览器")
+
+    daemon_parser = subparsers.add_parser("daemon", help="非交互地按间隔持续检查")
+    daemon_parser.add_argument("--headless", action="store_true", help="以无头模式启动浏览器")
+
+    subparsers.add_parser("configure", help="打开本地网页填写账号、邮箱与 OCR 信息")
+
+    import_parser = subparsers.add_parser("import-secrets", help="从 JSON 文件或环境变量导入 secrets")
+    import_parser.add_argument("file", nargs="?", default="", help="JSON 文件路径，- 表示标准输入")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "import-secrets":
+        return import_secrets(args)
+    if args.command == "check" and not args.once:
+        # check 用于 cron/systemd 定时器，不带 --once 时不能悄悄变成常驻进程
+        parser.error("check 需要 --once；按间隔持续检查请使用 daemon 子命令")
+    try:
+        config, secrets = load_runtime(args, interactive=args.command in (None, "configure"))
+    except (FileNotFoundError, ValueError) as exc:
+        print(f"{exc}。请检查 --config 或环境变量 {ENV_PREFIX}CONFIG。")
+        return 2
+    if args.command == "configure":
+        print(f"secrets 已保存到: {args.secrets}")
+        return 0
+    if args.command in ("check", "daemon"):
+        errors = validate_config(config)
+        if errors:
+            print("配置文件校验失败：")
+            for error in errors:
+                print(f"  - {error}")
+            return 2
+        missing = missing_required_secrets(config, secrets)
+        if missing:
+            print(
+                f"缺少必需配置: {', '.join(missing)}。"
+                "请先运行 configure 或 import-secrets，或设置相应的环境变量。"
+            )
+            return 2
+        if args.command == "check":
+            return asyncio.run(check_once(config, secrets))
+        asyncio.run(run(config, secrets, build_config_watcher(args, config, secrets)))
+        return 0
+    # 未指定子命令时保持原有行为：先打开网页填写信息，再持续检查
+    asyncio.run(run(config, secrets, build_config_watcher(args, config, secrets)))
+    return 0
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    sys.exit(main())
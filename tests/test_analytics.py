@@ -0,0 +1,87 @@
+import json
+import math
+
+import pytest
+
+import analytics
+from analytics import (
+    build_columns,
+    build_report,
+    export_columns,
+    iter_seen_records,
+    parse_ratio,
+    parse_score,
+    parse_seen_arg,
+)
+
+np = pytest.importorskip("numpy")
+
+
+def test_parse_ratio_treats_bare_integers_as_percents():
+    assert parse_ratio("30%") == pytest.approx(0.3)
+    assert parse_ratio("30") == pytest.approx(0.3)
+    assert parse_ratio("1") == pytest.approx(0.01)
+    assert parse_ratio("0.3") == pytest.approx(0.3)
+    assert parse_ratio("30.5") == pytest.approx(0.305)
+    assert math.isnan(parse_ratio(""))
+
+
+def test_parse_score_maps_grade_levels():
+    assert parse_score("92") == 92.0
+    assert parse_score("良好") == 85.0
+    assert math.isnan(parse_score("缓考"))
+
+
+def test_seen_files_need_an_explicit_account():
+    assert parse_seen_arg("alice=seen_courses.json") == ("alice", "seen_courses.json")
+    assert parse_seen_arg("seen_courses.json", "bob") == ("bob", "seen_courses.json")
+    assert parse_seen_arg("seen_courses.json") is None
+
+
+def test_seen_records_use_the_given_account(tmp_path):
+    path = tmp_path / "seen_courses_0.json"
+    path.write_text(
+        json.dumps({"高等数学": {"total": "90", "components": []}}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+    records = list(iter_seen_records(str(path), "20260001"))
+    assert [(record["account"], record["course"], record["total"]) for record in records] == [
+        ("20260001", "高等数学", "90")
+    ]
+
+
+def test_legacy_list_seen_file_is_skipped(tmp_path, capsys):
+    path = tmp_path / "seen_courses.json"
+    path.write_text(json.dumps(["高等数学", "线性代数"], ensure_ascii=False), encoding="utf-8")
+    assert list(iter_seen_records(str(path), "alice")) == []
+    assert "跳过" in capsys.readouterr().out
+
+
+def make_records():
+    components = [
+        {"name": "平时成绩", "ratio": "40%", "score": "80"},
+        {"name": "期末成绩", "ratio": "60", "score": "100"},
+    ]
+    return [
+        {"timestamp": 1, "account": "alice", "course": "高等数学", "total": "90", "components": components},
+        {"timestamp": 2, "account": "alice", "course": "高等数学", "total": "92", "components": components},
+        {"timestamp": 1, "account": "bob", "course": "高等数学", "total": "优秀", "components": []},
+    ]
+
+
+def test_report_uses_latest_record_per_pair():
+    report = build_report(build_columns(make_records()))
+    assert report["records"] == 3
+    assert report["accounts"]["alice"] == {"courses": 1, "average": 92.0}
+    assert report["accounts"]["bob"]["average"] == 95.0
+    assert report["changes_after_release"]["changes"] == 1
+    # 加权总评 0.4 * 80 + 0.6 * 100 = 92，与系统总评一致
+    assert report["weighted_total_mean_abs_diff"] == 0.0
+
+
+def test_parquet_export_falls_back_to_npz_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics, "pyarrow", None)
+    paths = export_columns(build_columns(make_records()), str(tmp_path / "grades.parquet"))
+    assert paths == [str(tmp_path / "grades.npz")]
+    with np.load(paths[0]) as data:
+        assert list(data["accounts"]) == ["alice", "bob"]
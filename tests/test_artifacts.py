@@ -0,0 +1,69 @@
+import asyncio
+
+from artifacts import CheckTracer, build_trace_config
+
+
+class FakeTracing:
+    def __init__(self):
+        self.running = False
+        self.saved = []
+
+    async def start(self, **kwargs):
+        # 与 Playwright 一致：同一上下文重复 start 会报错
+        if self.running:
+            raise RuntimeError("Tracing has been already started")
+        self.running = True
+        await asyncio.sleep(0)
+
+    async def stop(self, path=None):
+        assert self.running
+        self.running = False
+        if path:
+            self.saved.append(path)
+
+
+class FakeContext:
+    def __init__(self):
+        self.tracing = FakeTracing()
+
+
+def make_tracer(tmp_path, **overrides):
+    config = {"trace": {"enabled": True, "dir": str(tmp_path), "slow_seconds": 0, **overrides}}
+    return CheckTracer(build_trace_config(config))
+
+
+def test_overlapping_checks_on_one_context_record_once(tmp_path):
+    async def run():
+        tracer = make_tracer(tmp_path)
+        context = FakeContext()
+        first, second = await asyncio.gather(
+            tracer.start(context, title="a"), tracer.start(context, title="b")
+        )
+        assert [first["context"], second["context"]].count(context) == 1
+        await tracer.finish(second, failed=False)
+        await tracer.finish(first, failed=False)
+        assert not context.tracing.running
+        assert len(tracer.durations) == 2
+        # 录制结束后同一上下文可以再次录制
+        third = await tracer.start(context)
+        assert third["context"] is context
+        await tracer.finish(third, failed=True, label="alice")
+        return context
+
+    context = asyncio.run(run())
+    assert len(context.tracing.saved) == 1
+    assert "alice" in context.tracing.saved[0]
+
+
+def test_timing_is_kept_per_check(tmp_path):
+    async def run():
+        tracer = make_tracer(tmp_path, enabled=False)
+        slow = await tracer.start(FakeContext())
+        await asyncio.sleep(0.05)
+        fast = await tracer.start(FakeContext())
+        await tracer.finish(fast, failed=False)
+        await tracer.finish(slow, failed=False)
+        return list(tracer.durations)
+
+    fast, slow = asyncio.run(run())
+    assert fast < 0.05 <= slow
@@ -0,0 +1,33 @@
+from benchmark import compare_with_history, summarize
+
+
+def make_record(p50, failures=0):
+    record = {
+        "benchmark": "check",
+        "rows": 10,
+        "components": 3,
+        "latency": 0.01,
+        "ocr_latency": 0.8,
+        "iframe": False,
+        "commit": "abc",
+    }
+    record.update(summarize([p50] * 3 if p50 else [], failures))
+    return record
+
+
+def test_failures_are_counted_apart_from_samples():
+    summary = summarize([1.0, 2.0, 3.0], failures=2)
+    assert summary["rounds"] == 3 and summary["failures"] == 2
+    assert summary["p50"] == 2.0
+    assert summarize([], failures=3)["rounds"] == 0
+
+
+def test_failed_runs_are_neither_compared_nor_used_as_baseline():
+    history = [make_record(1.0), make_record(0.1, failures=2)]
+    slower = make_record(1.5)
+    regressions = compare_with_history([slower], history, tolerance=0.2)
+    assert regressions and regressions[0][1]["p50"] == 1.0
+
+    failed = make_record(0.0, failures=3)
+    assert compare_with_history([failed], history, tolerance=0.2) == []
+    assert failed["change"] is None
@@ -0,0 +1,77 @@
+import threading
+
+from changefeed import (
+    CHANGE_NEW,
+    CHANGE_UPDATED,
+    ChangeFeed,
+    build_change_events,
+    commit_cursor,
+    load_cursor,
+)
+
+
+def make_events(count, account="alice"):
+    changes = [(f"课程{index}", None, {"total": "90"}) for index in range(count)]
+    return build_change_events(account, changes, timestamp=1)
+
+
+def test_build_change_events_marks_new_and_updated():
+    events = build_change_events(
+        "alice",
+        [("高等数学", None, {"total": "90"}), ("线性代数", {"total": "80"}, {"total": "85"})],
+        timestamp=1,
+    )
+    assert [event["type"] for event in events] == [CHANGE_NEW, CHANGE_UPDATED]
+    assert events[1]["previous"] == {"total": "80", "components": []}
+
+
+def test_offsets_continue_across_segments_and_restarts(tmp_path):
+    feed = ChangeFeed(str(tmp_path), segment_max_records=2, max_segments=0)
+    assert feed.append(make_events(3)) == [0, 1, 2]
+    assert feed.append(make_events(2)) == [3, 4]
+    assert len(feed.segments()) == 2
+    restarted = ChangeFeed(str(tmp_path), segment_max_records=2, max_segments=0)
+    assert restarted.append(make_events(1)) == [5]
+    events, cursor = restarted.read(2, limit=3)
+    assert [event["offset"] for event in events] == [2, 3, 4]
+    assert cursor == 5
+
+
+def test_partial_trailing_line_is_truncated_on_restart(tmp_path):
+    feed = ChangeFeed(str(tmp_path))
+    feed.append(make_events(2))
+    path = feed.segment_path(0)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"offset": 2, "cour')
+    restarted = ChangeFeed(str(tmp_path))
+    assert restarted.append(make_events(1)) == [2]
+    events, _ = restarted.read(0)
+    assert [event["offset"] for event in events] == [0, 1, 2]
+
+
+def test_old_segments_are_pruned_and_reads_start_at_earliest(tmp_path):
+    feed = ChangeFeed(str(tmp_path), segment_max_records=1, max_segments=2)
+    for _ in range(4):
+        feed.append(make_events(1))
+    assert feed.segments() == [2, 3]
+    events, cursor = feed.read(0)
+    assert [event["offset"] for event in events] == [2, 3]
+    assert cursor == 4
+
+
+def test_wait_wakes_on_append_from_same_process(tmp_path):
+    feed = ChangeFeed(str(tmp_path))
+    timer = threading.Timer(0.1, feed.append, args=(make_events(1),))
+    timer.start()
+    try:
+        events, cursor = feed.wait(0, timeout=5, poll_interval=5)
+    finally:
+        timer.cancel()
+    assert [event["offset"] for event in events] == [0]
+    assert cursor == 1
+
+
+def test_cursor_round_trip(tmp_path):
+    assert load_cursor(str(tmp_path), "mail bot") == 0
+    commit_cursor(str(tmp_path), "mail bot", 42)
+    assert load_cursor(str(tmp_path), "mail bot") == 42
@@ -0,0 +1,46 @@
+import io
+import json
+
+import pytest
+
+import spider
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_missing_config_exits_with_2(tmp_path, capsys):
+    code = spider.main(["--config", str(tmp_path / "missing.json"), "check", "--once"])
+    assert code == 2
+    assert "missing.json" in capsys.readouterr().out
+
+
+def test_unparsable_or_non_object_config_exits_with_2(tmp_path):
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json", encoding="utf-8")
+    assert spider.main(["--config", str(broken), "daemon"]) == 2
+    listed = write_json(tmp_path / "list.json", ["login_url"])
+    assert spider.main(["--config", listed, "check", "--once"]) == 2
+
+
+def test_invalid_config_values_exit_with_2(tmp_path):
+    config = write_json(tmp_path / "config.json", {"check_interval_seconds": "soon"})
+    assert spider.main(["--config", config, "check", "--once"]) == 2
+
+
+def test_check_requires_once(tmp_path):
+    with pytest.raises(SystemExit) as exit_info:
+        spider.main(["--config", str(tmp_path / "config.json"), "check"])
+    assert exit_info.value.code == 2
+
+
+def test_import_secrets_from_stdin(tmp_path, monkeypatch):
+    secrets_path = str(tmp_path / "secrets.json")
+    monkeypatch.setattr("sys.stdin", io.StringIO("{broken"))
+    assert spider.main(["--secrets", secrets_path, "import-secrets", "-"]) == 1
+
+    monkeypatch.setattr("sys.stdin", io.StringIO('{"login": {"username": "alice"}}'))
+    assert spider.main(["--secrets", secrets_path, "import-secrets", "-"]) == 0
+    assert json.loads(open(secrets_path, encoding="utf-8").read())["login"]["username"] == "alice"
@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+import spider
+from configwatch import ConfigWatcher, mask_config_value, validate_config
+
+
+def example_config():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "config.json.example"), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_example_config_is_valid():
+    assert validate_config(example_config()) == []
+
+
+@pytest.mark.parametrize(
+    "key, value, message",
+    [
+        ("session_probe", {"timeout_seconds": "abc"}, "session_probe.timeout_seconds"),
+        ("cas", {"markers": "CAS"}, "cas.markers"),
+        ("cas", {"markers": ["CAS", 1]}, "cas.markers"),
+        ("manual_login_timeout_seconds", "ten", "manual_login_timeout_seconds"),
+        ("manual_login_timeout_seconds", -1, "manual_login_timeout_seconds"),
+        ("email_config", "smtp.163.com", "email_config"),
+        ("email_config", {"smtp_port": "465"}, "email_config.smtp_port"),
+        ("check_interval_seconds", 0, "check_interval_seconds"),
+        ("rate_limit", {"burst": "many"}, "rate_limit"),
+    ],
+)
+def test_wrong_types_are_rejected(key, value, message):
+    config = example_config()
+    config[key] = value
+    errors = validate_config(config)
+    assert any(message in error for error in errors), errors
+
+
+def test_empty_cas_values_fall_back_to_defaults():
+    config = example_config()
+    config["cas"] = {"markers": [], "auth_url": ""}
+    assert validate_config(config) == []
+
+
+def test_secrets_are_masked_in_the_diff_log():
+    assert mask_config_value("ocr.api_key", "sk-123") == "***"
+    targets = [{"name": "ding", "url": "https://oapi.dingtalk.com/robot/send?access_token=abc"}]
+    masked = mask_config_value("webhook.targets", targets)
+    assert "abc" not in json.dumps(masked)
+    assert masked[0]["url"].startswith("https://oapi.dingtalk.com/")
+
+
+def make_watcher(tmp_path, config, secrets):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+
+    def load():
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    watcher = ConfigWatcher(
+        str(path),
+        load,
+        load(),
+        ignored=lambda key, old, new: spider.shadowed_url_reason(key, old, new, secrets),
+    )
+    return path, watcher
+
+
+def rewrite(path, config):
+    path.write_text(json.dumps(config), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_url_shadowed_by_secrets_is_reported_not_applied(tmp_path, capsys):
+    config = {"login_url": "https://old.example.edu/login", "grades_url": "https://old.example.edu/grades"}
+    secrets = {"grades_url": "https://saved.example.edu/grades"}
+    path, watcher = make_watcher(tmp_path, config, secrets)
+
+    rewrite(path, dict(config, grades_url="https://new.example.edu/grades"))
+    assert watcher.poll() is None
+    assert "不生效" in capsys.readouterr().out
+    assert watcher.stats["applied"] == 0
+
+    # login_url 没有被 secrets 覆盖，修改照常生效
+    rewrite(path, dict(config, grades_url="https://new.example.edu/grades", login_url="https://new.example.edu/login"))
+    new_config = watcher.poll()
+    assert new_config is not None and new_config["login_url"] == "https://new.example.edu/login"
+    assert spider.get_runtime_urls(new_config, secrets)[0] == "https://new.example.edu/login"
+
+
+def test_invalid_reload_keeps_previous_config(tmp_path):
+    config = {"check_interval_seconds": 60}
+    path, watcher = make_watcher(tmp_path, config, {})
+    rewrite(path, {"check_interval_seconds": 60, "session_probe": {"timeout_seconds": "abc"}})
+    assert watcher.poll() is None
+    assert watcher.current == config and watcher.stats["rejected"] == 1
@@ -0,0 +1,104 @@
+import asyncio
+
+from spider import is_login_response, wait_for_submit_settle
+
+
+class FakeFrame:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeRequest:
+    def __init__(self, method, resource_type, frame):
+        self.method = method
+        self.resource_type = resource_type
+        self.frame = frame
+
+
+class FakeResponse:
+    def __init__(self, url, method="POST", resource_type="fetch", frame=None):
+        self.url = url
+        self.request = FakeRequest(method, resource_type, frame)
+
+
+LOGIN_FRAME = FakeFrame("https://cas.example.edu/login")
+
+
+def test_login_xhr_from_login_frame_matches():
+    response = FakeResponse("https://cas.example.edu/api/login", frame=LOGIN_FRAME)
+    assert is_login_response(response, LOGIN_FRAME)
+
+
+def test_beacons_and_other_requests_do_not_end_the_wait():
+    other_frame = FakeFrame("https://cas.example.edu/ads")
+    assert not is_login_response(
+        FakeResponse("https://cas.example.edu/track", resource_type="ping", frame=LOGIN_FRAME),
+        LOGIN_FRAME,
+    )
+    assert not is_login_response(
+        FakeResponse("https://stats.example.com/collect", frame=LOGIN_FRAME), LOGIN_FRAME
+    )
+    assert not is_login_response(
+        FakeResponse("https://cas.example.edu/api/login", frame=other_frame), LOGIN_FRAME
+    )
+    assert not is_login_response(
+        FakeResponse("https://cas.example.edu/api/login", method="GET", frame=LOGIN_FRAME),
+        LOGIN_FRAME,
+    )
+
+
+def test_configured_endpoint_takes_precedence():
+    response = FakeResponse("https://cas.example.edu/track", frame=LOGIN_FRAME)
+    assert not is_login_response(response, LOGIN_FRAME, endpoint="/api/login")
+    response = FakeResponse("https://sso.example.edu/api/login", frame=FakeFrame("about:blank"))
+    assert is_login_response(response, LOGIN_FRAME, endpoint="/api/login")
+
+
+class FakePage:
+    """按时间表派发事件：[(延迟秒数, 事件名, 事件参数)]"""
+
+    def __init__(self, schedule):
+        self.main_frame = LOGIN_FRAME
+        self.schedule = schedule
+        self.loaded = 0
+
+    async def wait_for_event(self, event, predicate=None, timeout=None):
+        for delay, name, value in self.schedule:
+            if name == event and (predicate is None or predicate(value)):
+                await asyncio.sleep(delay)
+                return value
+        await asyncio.sleep(timeout / 1000)
+        raise TimeoutError(event)
+
+    async def wait_for_load_state(self, state, timeout=None):
+        self.loaded += 1
+
+
+async def noop():
+    pass
+
+
+def test_settle_waits_for_the_redirect_after_the_login_response():
+    async def run():
+        login = FakeResponse("https://cas.example.edu/api/login", frame=LOGIN_FRAME)
+        page = FakePage([(0.01, "response", login), (0.1, "framenavigated", LOGIN_FRAME)])
+        started = asyncio.get_running_loop().time()
+        settled = await wait_for_submit_settle(page, noop, timeout=2000)
+        return settled, asyncio.get_running_loop().time() - started, page.loaded
+
+    settled, elapsed, loaded = asyncio.run(run())
+    assert settled and loaded == 1
+    assert 0.1 <= elapsed < 0.5
+
+
+def test_settle_without_redirect_is_bounded():
+    async def run():
+        login = FakeResponse("https://cas.example.edu/api/login", frame=LOGIN_FRAME)
+        page = FakePage([(0.01, "response", login)])
+        started = asyncio.get_running_loop().time()
+        settled = await wait_for_submit_settle(page, noop, timeout=2000, redirect_timeout=200)
+        return settled, asyncio.get_running_loop().time() - started
+
+    settled, elapsed = asyncio.run(run())
+    assert settled
+    assert 0.2 <= elapsed < 1.0
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+from mock_portal import WebhookReceiver
+from notifier import WebhookNotifier, build_webhook_config
+
+
+def make_notifier(tmp_path, url, **overrides):
+    webhook = {
+        "targets": [{"name": "hook", "url": url}],
+        "coalesce_seconds": 0,
+        "timeout_seconds": 2,
+        "backoff_seconds": 0.1,
+        "dead_letter_file": str(tmp_path / "dead.jsonl"),
+        **overrides,
+    }
+    return WebhookNotifier(build_webhook_config({"webhook": webhook}))
+
+
+def read_dead_letters(tmp_path):
+    path = tmp_path / "dead.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def make_events(*courses):
+    return [{"account": "alice", "course": course, "current": {"total": "90"}} for course in courses]
+
+
+def test_retries_then_delivers_coalesced_events(tmp_path):
+    receiver = WebhookReceiver(fail_first=2).start()
+    try:
+        notifier = make_notifier(tmp_path, receiver.base_url + "/hook", coalesce_seconds=0.1)
+
+        async def run():
+            notifier.submit(make_events("高等数学"))
+            notifier.submit(make_events("线性代数"))
+            await notifier.close(timeout=5)
+
+        asyncio.run(run())
+    finally:
+        receiver.stop()
+    assert notifier.stats["delivered"] == 1
+    assert notifier.stats["retries"] == 2
+    assert [event["course"] for event in receiver.payloads[0][1]["changes"]] == ["高等数学", "线性代数"]
+    assert read_dead_letters(tmp_path) == []
+
+
+def test_exhausted_retries_go_to_dead_letter(tmp_path):
+    receiver = WebhookReceiver(fail_first=100).start()
+    try:
+        notifier = make_notifier(tmp_path, receiver.base_url, max_retries=1)
+
+        async def run():
+            notifier.submit(make_events("高等数学"))
+            await notifier.close(timeout=5)
+
+        asyncio.run(run())
+    finally:
+        receiver.stop()
+    records = read_dead_letters(tmp_path)
+    assert len(records) == 1
+    assert records[0]["attempts"] == 2
+    assert records[0]["error"] == "HTTP 503"
+
+
+def test_close_dead_letters_deliveries_still_retrying(tmp_path):
+    receiver = WebhookReceiver(fail_first=100).start()
+    try:
+        # 退避远长于 close 的超时，推送会在重试等待中被取消
+        notifier = make_notifier(tmp_path, receiver.base_url, backoff_seconds=30, max_backoff_seconds=60)
+
+        async def run():
+            notifier.submit(make_events("高等数学", "线性代数"))
+            await asyncio.sleep(0.2)
+            await notifier.close(timeout=0.3)
+
+        asyncio.run(run())
+    finally:
+        receiver.stop()
+    records = read_dead_letters(tmp_path)
+    assert len(records) == 1
+    assert records[0]["target"] == "hook"
+    assert records[0]["attempts"] == 1
+    assert "关闭时仍未送达" in records[0]["error"]
+    assert [event["course"] for event in records[0]["events"]] == ["高等数学", "线性代数"]
+    assert notifier.stats["dead_letters"] == 1
+    assert notifier.deliveries == {}
+
+
+def test_close_flushes_buffer_without_waiting_for_coalesce(tmp_path):
+    receiver = WebhookReceiver().start()
+    try:
+        notifier = make_notifier(tmp_path, receiver.base_url, coalesce_seconds=60)
+
+        async def run():
+            notifier.submit(make_events("高等数学"))
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await notifier.close(timeout=5)
+            return loop.time() - started
+
+        elapsed = asyncio.run(run())
+    finally:
+        receiver.stop()
+    assert elapsed < 2
+    assert notifier.stats["delivered"] == 1
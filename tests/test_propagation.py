@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import propagation
+from propagation import CourseIndex, ReleasePropagator, build_release_propagation_config
+
+
+def make_propagator(**overrides):
+    config = {"checks_per_second": 100, **overrides}
+    return ReleasePropagator(build_release_propagation_config({"release_propagation": config}))
+
+
+def released(*names):
+    return [(name, None, {"total": "90"}) for name in names]
+
+
+def test_course_index_updates_incrementally():
+    index = CourseIndex()
+    index.update("alice", ["高等数学", "线性代数"])
+    index.update("bob", ["高等数学"])
+    index.update("alice", ["线性代数"])
+    assert index.classmates("bob", "高等数学") == []
+    assert index.classmates("bob", " 线性代数 ") == ["alice"]
+    assert "高等数学" in index.accounts
+
+
+def test_release_wakes_registered_classmates_once():
+    async def run():
+        propagator = make_propagator()
+        for account in ("alice", "bob", "carol"):
+            propagator.register(account)
+            propagator.observe(account, ["高等数学"], [])
+        propagator.observe("alice", ["高等数学"], released("高等数学"))
+        await propagator.dispatcher
+        # 被唤醒的账号检测到同一次发布时不再扩散
+        propagator.observe("bob", ["高等数学"], released("高等数学"))
+        return propagator
+
+    propagator = asyncio.run(run())
+    assert propagator.stats["triggered"] == 2
+    assert propagator.stats["suppressed"] == 1
+    assert propagator.wakers["bob"].is_set()
+    assert not propagator.wakers["alice"].is_set()
+
+
+def test_expired_cooldown_records_are_pruned(monkeypatch):
+    now = [1000.0]
+    # 只替换模块内的时钟，事件循环仍使用真实时间
+    monkeypatch.setattr(propagation, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def run():
+        propagator = make_propagator(account_cooldown_seconds=60, course_cooldown_seconds=600)
+        for account in ("alice", "bob"):
+            propagator.register(account)
+            propagator.observe(account, ["高等数学", "线性代数"], [])
+        propagator.observe("alice", ["高等数学"], released("高等数学"))
+        await propagator.dispatcher
+        recorded = (set(propagator.last_propagated), set(propagator.last_triggered))
+        now[0] += 120
+        propagator.observe("alice", ["高等数学"], [])
+        after_account = (set(propagator.last_propagated), set(propagator.last_triggered))
+        now[0] += 600
+        propagator.observe("alice", ["高等数学"], [])
+        return recorded, after_account, (propagator.last_propagated, propagator.last_triggered)
+
+    recorded, after_account, after_course = asyncio.run(run())
+    assert recorded == ({"高等数学"}, {"bob"})
+    assert after_account == ({"高等数学"}, set())
+    assert after_course == ({}, {})
+
+
+def test_unregistered_accounts_are_not_woken():
+    async def run():
+        propagator = make_propagator()
+        propagator.register("alice")
+        propagator.observe("alice", ["高等数学"], [])
+        propagator.observe("bob", ["高等数学"], [])
+        propagator.observe("alice", ["高等数学"], released("高等数学"))
+        return propagator
+
+    propagator = asyncio.run(run())
+    assert propagator.stats["enqueued"] == 0
+    assert propagator.dispatcher is None
@@ -0,0 +1,126 @@
+import asyncio
+
+import ratelimit
+from ratelimit import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    DETAIL_BUCKET,
+    HostGuard,
+    build_rate_limit_config,
+    get_host_guard,
+    install_breaker_listeners,
+    throttle,
+)
+
+
+def time_now():
+    return asyncio.get_running_loop().time()
+
+
+def make_config(**overrides):
+    return build_rate_limit_config({"rate_limit": overrides})
+
+
+def test_burst_then_rate():
+    async def run():
+        guard = HostGuard("portal", make_config(requests_per_second=20, burst=3))
+        started = time_now()
+        for _ in range(5):
+            await guard.acquire()
+        return time_now() - started
+
+    elapsed = asyncio.run(run())
+    # 前 3 个令牌立即可用，之后每个间隔 1/20 秒
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_detail_clicks_do_not_drain_page_tokens():
+    async def run():
+        config = make_config(requests_per_second=0.5, burst=2, detail_burst=50)
+        started = time_now()
+        for _ in range(50):
+            await throttle("https://jw.example.edu/grades", config, DETAIL_BUCKET)
+        await throttle("https://jw.example.edu/grades", config)
+        await throttle("https://jw.example.edu/grades", config)
+        return time_now() - started
+
+    assert asyncio.run(run()) < 0.2
+
+
+def test_breaker_opens_half_opens_and_closes():
+    async def run():
+        guard = HostGuard("portal", make_config(failure_threshold=2, open_seconds=1))
+        guard.record_failure("HTTP 502")
+        assert guard.state == CIRCUIT_CLOSED
+        guard.record_failure("HTTP 502")
+        assert guard.state == CIRCUIT_OPEN
+        guard.open_until = time_now()
+        await guard.wait_until_available()
+        assert guard.state == CIRCUIT_HALF_OPEN
+        # 探测失败：重新打开且时长翻倍
+        guard.record_failure("HTTP 503")
+        assert guard.state == CIRCUIT_OPEN and guard.open_seconds == 2
+        guard.open_until = time_now()
+        await guard.wait_until_available()
+        guard.record_status(200)
+        assert guard.state == CIRCUIT_CLOSED and guard.open_seconds == 1
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+
+
+def test_guards_are_per_event_loop():
+    config = make_config()
+
+    async def use_guard():
+        guard = get_host_guard("portal", config)
+        await guard.acquire()
+        await guard.notify()
+        return guard
+
+    first = asyncio.run(use_guard())
+    second = asyncio.run(use_guard())
+    assert first is not second
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type="document", failure=None):
+        self.url = url
+        self.resource_type = resource_type
+        self.failure = failure
+
+
+class FakeResponse:
+    def __init__(self, url, status):
+        self.request = FakeRequest(url)
+        self.status = status
+
+
+class FakeContext:
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def emit(self, event, value):
+        for handler in self.handlers.get(event, []):
+            handler(value)
+
+
+def test_listeners_follow_hot_reloaded_urls():
+    async def run():
+        config = make_config(failure_threshold=1)
+        context = FakeContext()
+        install_breaker_listeners(context, config, ["https://old.example.edu/grades"])
+        install_breaker_listeners(context, config, ["https://new.example.edu/grades"])
+        assert len(context.handlers["response"]) == 1
+        context.emit("response", FakeResponse("https://new.example.edu/grades", 500))
+        context.emit("response", FakeResponse("https://cdn.example.com/app.js", 500))
+        guards = ratelimit.host_guards()
+        assert guards["new.example.edu"].state == CIRCUIT_OPEN
+        assert "cdn.example.com" not in guards
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
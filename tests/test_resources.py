@@ -0,0 +1,64 @@
+import pytest
+
+import resources
+from resources import (
+    RECYCLE_BROWSER,
+    RECYCLE_NONE,
+    RECYCLE_PAGE,
+    ResourceGovernor,
+    build_resource_config,
+)
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    stats = {"python_rss": 100 * MB, "browser_rss": 200 * MB, "browser_processes": 5}
+    monkeypatch.setattr(resources, "process_tree_stats", lambda pid=None: dict(stats))
+    monkeypatch.setattr(resources, "process_rss_bytes", lambda pid: stats["python_rss"])
+    return stats
+
+
+def test_working_page_alone_is_not_recycled(memory):
+    governor = ResourceGovernor(build_resource_config({}))
+    assert [governor.evaluate(open_pages=1) for _ in range(50)] == [RECYCLE_NONE] * 50
+
+
+def test_leftover_pages_are_recycled_at_the_page_watermarks(memory):
+    governor = ResourceGovernor(build_resource_config({"resources": {"max_pages": 2}}))
+    assert governor.evaluate(open_pages=2) == RECYCLE_NONE
+    assert governor.evaluate(open_pages=3) == RECYCLE_PAGE
+    memory["browser_rss"] = 600 * MB
+    assert governor.evaluate(open_pages=2) == RECYCLE_PAGE
+    assert governor.evaluate(open_pages=1) == RECYCLE_NONE
+
+
+def test_browser_restart_on_check_count_and_memory(memory):
+    governor = ResourceGovernor(
+        build_resource_config({"resources": {"max_checks_per_browser": 3}})
+    )
+    levels = [governor.evaluate(open_pages=1) for _ in range(3)]
+    assert levels == [RECYCLE_NONE, RECYCLE_NONE, RECYCLE_BROWSER]
+    governor.mark_recycled(RECYCLE_BROWSER)
+    assert governor.evaluate(open_pages=1) == RECYCLE_NONE
+    memory["browser_rss"] = 900 * MB
+    assert governor.evaluate(open_pages=1) == RECYCLE_BROWSER
+
+
+def test_legacy_context_watermarks_merge_into_the_browser_level():
+    config = build_resource_config(
+        {"resources": {"max_checks_per_context": 50, "max_checks_per_browser": 1000, "context_rss_mb": 0}}
+    )
+    assert config["max_checks_per_browser"] == 50
+    assert config["browser_rss_mb"] == 0
+    assert build_resource_config({"resources": {"max_checks_per_browser": 0}})["max_checks_per_browser"] == 0
+
+
+def test_python_watermark_runs_a_collection(memory, monkeypatch, capsys):
+    collected = []
+    monkeypatch.setattr("gc.collect", lambda: collected.append(1) or 0)
+    governor = ResourceGovernor(build_resource_config({"resources": {"python_rss_mb": 50}}))
+    assert governor.evaluate(open_pages=1) == RECYCLE_NONE
+    assert collected == [1]
+    assert "垃圾回收后" in capsys.readouterr().out
@@ -0,0 +1,97 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import singleflight
+from singleflight import SingleFlight, scope_token
+
+
+class Scope:
+    pass
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    async def run():
+        group = SingleFlight()
+        results = await asyncio.gather(*(group.do("key", factory) for _ in range(3)))
+        return [source for _, source in results]
+
+    sources = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(sources) == ["executed", "shared", "shared"]
+
+
+def test_failed_results_are_not_cached():
+    async def run():
+        group = SingleFlight()
+        outcomes = iter([{"ok": False}, {"ok": True}])
+
+        async def factory():
+            return next(outcomes)
+
+        cacheable = lambda result: result["ok"]
+        first = await group.do("key", factory, ttl=60, cacheable=cacheable)
+        second = await group.do("key", factory, ttl=60, cacheable=cacheable)
+        third = await group.do("key", factory, ttl=60, cacheable=cacheable)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == ({"ok": False}, "executed")
+    assert second == ({"ok": True}, "executed")
+    assert third == ({"ok": True}, "cached")
+
+
+def test_expired_results_of_other_keys_are_purged(monkeypatch):
+    now = [1000.0]
+    # 只替换模块内的时钟，事件循环仍使用真实时间
+    monkeypatch.setattr(singleflight, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def factory():
+        return "result"
+
+    async def run():
+        group = SingleFlight()
+        for key in ("a", "b", "c"):
+            await group.do(key, factory, ttl=10)
+        now[0] += 11
+        await group.do("d", factory)
+        return group
+
+    group = asyncio.run(run())
+    assert group.results == {}
+
+
+def test_forget_prefix_only_drops_matching_keys():
+    async def factory():
+        return "result"
+
+    async def run():
+        group = SingleFlight()
+        await group.do(("check", "alice", 1), factory, ttl=60)
+        await group.do(("check", "bob", 1), factory, ttl=60)
+        await group.do(("other", "alice"), factory, ttl=60)
+        group.forget_prefix(("check", "alice"))
+        keys = set(group.results)
+        group.forget_prefix(("check",))
+        return keys, set(group.results)
+
+    after_account, after_all = asyncio.run(run())
+    assert after_account == {("check", "bob", 1), ("other", "alice")}
+    assert after_all == {("other", "alice")}
+
+
+def test_scope_tokens_are_not_reused_after_collection():
+    first = Scope()
+    token = scope_token(first)
+    assert scope_token(first) == token
+    del first
+    gc.collect()
+    # 新对象可能复用旧对象的 id()，但编号不同
+    assert all(scope_token(Scope()) != token for _ in range(10))
@@ -0,0 +1,59 @@
+import snapshots
+from snapshots import CourseSnapshot, as_snapshot, snapshots_from_json, snapshots_to_json
+
+
+def course(total="90", **extra):
+    return {
+        "total": total,
+        "components": [{"name": "期末", "ratio": "60%", "score": "88"}],
+        **extra,
+    }
+
+
+def test_round_trip_keeps_extra_fields_and_nonstandard_components():
+    data = {
+        "total": "A",
+        "components": [{"name": "平时", "ratio": "40%", "score": "95"}, {"name": "附加", "bonus": 2}],
+        "credit": "3",
+    }
+    assert CourseSnapshot.from_dict(data).to_dict() == data
+
+
+def test_equality_ignores_key_order():
+    reordered = {
+        "credit": "3",
+        "components": [{"score": "88", "ratio": "60%", "name": "期末"}],
+        "total": "90",
+    }
+    assert CourseSnapshot.from_dict(course(credit="3")) == CourseSnapshot.from_dict(reordered)
+    assert CourseSnapshot.from_dict(course()) != CourseSnapshot.from_dict(course(total="91"))
+
+
+def test_equality_survives_pool_clear(monkeypatch):
+    monkeypatch.setattr(snapshots, "_POOL_LIMIT", 1)
+    monkeypatch.setattr(snapshots, "_COMPONENTS", {})
+    monkeypatch.setattr(snapshots, "_COMPONENT_LISTS", {})
+    first = CourseSnapshot.from_dict(course())
+    other = course()
+    other["components"] = [{"name": "平时", "ratio": "40%", "score": "95"}]
+    CourseSnapshot.from_dict(other)
+    second = CourseSnapshot.from_dict(course())
+    # 池子清空后重新驻留，两个快照不再共享同一个分项元组，但仍然相等
+    assert first.components is not second.components
+    assert first == second
+    assert hash(first) == hash(second)
+    assert snapshots.pool_stats() == {"components": 1, "component_lists": 1}
+
+
+def test_legacy_list_format_loads_as_empty_snapshots():
+    loaded = snapshots_from_json(["高等数学", 3])
+    assert loaded == {"高等数学": CourseSnapshot()}
+    assert snapshots_to_json(loaded) == {"高等数学": {"total": "", "components": []}}
+    assert snapshots_from_json("bad") == {}
+
+
+def test_as_snapshot_passes_through_none_and_snapshots():
+    snapshot = CourseSnapshot.from_dict(course())
+    assert as_snapshot(None) is None
+    assert as_snapshot(snapshot) is snapshot
+    assert as_snapshot(course()) == snapshot